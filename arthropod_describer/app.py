@@ -4,7 +4,6 @@ import importlib.resources
 import inspect
 import json
 import logging
-import multiprocessing as mp
 import os
 import platform
 import subprocess
@@ -21,12 +20,16 @@ from PySide2.QtGui import QCloseEvent, QPixmap, QColor, Qt, QImage, QIcon, QCurs
 from PySide2.QtWidgets import QMainWindow, QApplication, QHBoxLayout, QSizePolicy, QMessageBox, QMenu, QAction, \
     QVBoxLayout, QLabel, QDockWidget, QListView, QWidget, QDialogButtonBox, QAbstractItemView
 
-from arthropod_describer.common.blocking_operation import BlockingOperation
+from arthropod_describer.common.computations_scheduler import LabelPatch, RegionComputationsScheduler
 from arthropod_describer.common.edit_command_executor import EditCommandExecutor
 from arthropod_describer.common.image_operation_binding import ImageOperation
-from arthropod_describer.common.label_change import generate_change_command
+from arthropod_describer.common.job_engine import ExternalJob, JobEngine
+from arthropod_describer.common.job_panel import JobPanel
+from arthropod_describer.common.label_change import generate_patch_change_command
 from arthropod_describer.common.label_hierarchy import LabelHierarchy
 from arthropod_describer.common.local_storage import Storage, LocalStorage
+from arthropod_describer.common.residency_manager import DEFAULT_MEMORY_BUDGET_MB
+from arthropod_describer.common.photo_prefetcher import PhotoPrefetcher, DEFAULT_PREFETCH_RADIUS
 from arthropod_describer.common.photo import LabelImg, Photo
 from arthropod_describer.common.plugin import RegionComputation, GeneralAction
 from arthropod_describer.common.scale_setting_widget import ScaleSettingWidget, ScaleItemDelegate
@@ -54,16 +57,6 @@ logging.basicConfig(filename='arthropod_logger.log', level=logging.INFO, format=
 logger = logging.getLogger("ArthropodDescriber")
 
 
-def run_reg_comp_on_storage(reg_comp: RegionComputation, storage: Storage, progress_queue: mp.Queue, send_photo: bool=True):
-    for i in range(storage.image_count):
-        photo = storage.get_photo_by_idx(i)
-        label_imgs: typing.List[LabelImg] = reg_comp(photo)
-        if send_photo:
-            progress_queue.put_nowait((i+1, storage.image_count, photo, label_imgs))
-        else:
-            progress_queue.put_nowait((i+1, storage.image_count))
-
-
 class ArthropodDescriber(QMainWindow):
     copying_finished = Signal()
 
@@ -95,6 +88,19 @@ class ArthropodDescriber(QMainWindow):
 
         self.current_idx: typing.Optional[QModelIndex] = None
 
+        # decodes the photos around the current one in the background, so that navigating to them is instant
+        self._prefetcher = PhotoPrefetcher()
+
+        # region computations, scale extraction and measurements run as jobs, without blocking the GUI
+        self.job_engine = JobEngine(parent=self)
+        # region computations run in worker processes, one photo per task
+        self.region_scheduler = RegionComputationsScheduler(parent=self)
+        self.region_scheduler.photo_computed.connect(self._process_region_operation_result)
+        self.region_scheduler.progress.connect(self._handle_region_computation_progress)
+        self.region_scheduler.finished.connect(self._handle_region_computation_finished)
+        self.region_scheduler.cancelled.connect(lambda: self._handle_region_computation_finished(cancelled=True))
+        self._region_job: typing.Optional[ExternalJob] = None
+
         self.thumbnail_storage: typing.Optional[ThumbnailStorage_] = None
 
         self.plugins_widget = PluginManager(self.state)
@@ -102,7 +108,7 @@ class ArthropodDescriber(QMainWindow):
 
         self._setup_plugins_menu_entry()
 
-        self.measurements_viewer = MeasurementsViewer(self.state)
+        self.measurements_viewer = MeasurementsViewer(self.state, job_engine=self.job_engine)
         self.measurements_viewer.open_project_folder.connect(self.open_project_folder_in_explorer)
         self.measurements_viewer.unsaved_changes.connect(self.enable_actionSave)
 
@@ -184,7 +190,7 @@ class ArthropodDescriber(QMainWindow):
             self._tag_filter_widget.tags_widget.hide()
 
     def _setup_scale_setting_widget(self):
-        self.scale_setting_widget: ScaleSettingWidget = ScaleSettingWidget(self.state)
+        self.scale_setting_widget: ScaleSettingWidget = ScaleSettingWidget(self.state, job_engine=self.job_engine)
         self.scale_setting_widget.accepted.connect(self._handle_scales_accepted)
         self.scale_setting_widget.cancelled.connect(self.switch_to_label_editor)
 
@@ -251,6 +257,15 @@ class ArthropodDescriber(QMainWindow):
         self.dw_labels.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
         self.dw_labels.sizePolicy().setVerticalStretch(4)
 
+        self.dw_jobs = QDockWidget()
+        self.dw_jobs.setWindowTitle("Jobs")
+        self.dw_jobs.setWidget(JobPanel(self.job_engine))
+        self.dw_jobs.setFeatures(QDockWidget.DockWidgetFloatable | QDockWidget.DockWidgetMovable |
+                                 QDockWidget.DockWidgetClosable)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.dw_jobs)
+        self.dw_jobs.hide()
+        self.job_engine.job_added.connect(lambda _: self.dw_jobs.show())
+
         self.dw_image_list.setEnabled(False)
         self.dw_labels.setEnabled(False)
         self.dw_toolbox.setEnabled(False)
@@ -304,6 +319,12 @@ class ArthropodDescriber(QMainWindow):
 
         self.image_list.verticalScrollBar().sliderPressed.connect(self.image_list_model.handle_slider_pressed)
         self.image_list.verticalScrollBar().sliderReleased.connect(self.handle_image_list_slider_released)
+        # scrolling changes the value pixel by pixel, the visible thumbnails are prioritized once it settles
+        self._visible_thumbnails_timer = QTimer(self)
+        self._visible_thumbnails_timer.setSingleShot(True)
+        self._visible_thumbnails_timer.setInterval(100)
+        self._visible_thumbnails_timer.timeout.connect(self.prioritize_visible_thumbnails)
+        self.image_list.verticalScrollBar().valueChanged.connect(lambda _: self._visible_thumbnails_timer.start())
         self.image_list.setVerticalScrollMode(QListView.ScrollPerPixel)
         self.image_list.verticalScrollBar().setSingleStep(18)
         self.image_list.entered.connect(self.show_thumbnail_gui)
@@ -539,8 +560,7 @@ class ArthropodDescriber(QMainWindow):
         unsegmented_count = 0
         if self.state.storage is not None:
             for i in range(self.state.storage.image_count):
-                photo = self.state.storage.get_photo_by_idx(i, False)
-                if not photo.has_segmentation_for(self.state.storage.default_label_image):
+                if not self.state.storage.is_segmented(i, self.state.storage.default_label_image):
                     unsegmented_count = unsegmented_count + 1
         apply_to_all_unsegmented_text = "Apply to all unsegmented"
         self.label_editor.region_computation_widget.action_applyToUnsegmented.setText(apply_to_all_unsegmented_text + f" ({unsegmented_count if unsegmented_count > 0 else 'none'})")
@@ -674,6 +694,9 @@ class ArthropodDescriber(QMainWindow):
             if storage.get_label_hierarchy2(lbl_name) is None:
                 storage.set_label_hierarchy2(lbl_name, self.label_hierarchies[lbl_name])
         self.plugins_menu.setEnabled(True)
+        self._prefetcher.cancel()
+        self.job_engine.cancel_all()
+        self.measurements_viewer.scheduler.cancel()
         self.storage = storage
         self.storage.storage_update.connect(self.handle_storage_updated)
         self.state.storage = storage
@@ -682,11 +705,14 @@ class ArthropodDescriber(QMainWindow):
         self.state.set_label_constraint(self.state.current_label_name)
         self.command_executor.initialize(self.state)
 
+        if self.thumbnail_storage is not None:
+            self.thumbnail_storage.stop()
         self.thumbnail_storage = ThumbnailStorage_(self.state.storage)
         self.thumbnail_delegate = ImageListDelegate(self.thumbnail_storage)
         self.image_list.initialize(self.thumbnail_delegate)
 
         self.image_list_model.initialize(self.storage.image_paths, self.thumbnail_storage, 0, self.state.storage)
+        self.prioritize_visible_thumbnails()
 
         self.current_idx = self.image_list_proxy_model.index(0, 0)
         self.label_editor.widget.setEnabled(True)
@@ -808,6 +834,8 @@ class ArthropodDescriber(QMainWindow):
 
     def handle_current_changed(self, current: QModelIndex, previous: QModelIndex):
         if not current.isValid():
+            if self.state.current_photo is not None:
+                self.storage.unpin_photo(self.state.current_photo)
             self.state.current_photo = None
             return
         # if self.image_list.selectionMode() != ImageListView.SingleSelection:
@@ -819,10 +847,11 @@ class ArthropodDescriber(QMainWindow):
         row = mapped_index.row()
 
         if self.state.current_photo is not None:
-            logger.info(f'Unloading the current photo {self.state.current_photo.image_name}.')
-            for _, lbl_img in self.state.current_photo.label_images_.items():
-                lbl_img.unload()
+            # the residency manager of the storage unloads the photo once the memory budget is exceeded
+            logger.info(f'Unpinning the current photo {self.state.current_photo.image_name}.')
+            self.storage.unpin_photo(self.state.current_photo)
         photo = self.storage.get_photo_by_idx(row)
+        self.storage.pin_photo(photo)
         self.state.current_photo = photo
         logger.info(f'Current photo is now {self.state.current_photo.image_name}')
         print(f'Current photo is now {self.state.current_photo.image_name}')
@@ -834,6 +863,17 @@ class ArthropodDescriber(QMainWindow):
             self.scale_setting_widget.image_viewer.set_photo(photo, True)
             self.scale_setting_widget.image_viewer.enable_navigation_buttons(current.row(), self.image_list_proxy_model.rowCount())
         self.current_idx = current
+        self._prefetch_neighbours(current)
+
+    def _prefetch_neighbours(self, current: QModelIndex):
+        """Schedules decoding of the photos next to `current` in the order shown in the image list, nearest first."""
+        radius = self.config.get('prefetch_radius', DEFAULT_PREFETCH_RADIUS)
+        rows = [row for dist in range(1, radius + 1) for row in (current.row() + dist, current.row() - dist)
+                if 0 <= row < self.image_list_proxy_model.rowCount()]
+        photos = [self.storage.get_photo_by_idx(self.image_list_proxy_model.mapToSource(
+                      self.image_list_proxy_model.index(row, 0)).row(), load_image=False)
+                  for row in rows]
+        self._prefetcher.prefetch(photos, self.storage.label_image_names)
 
     def handle_selection_changed(self, selected: QItemSelection, deselected: QItemSelection):
         if len(self.image_list.selectionModel().selectedIndexes()) == 0:
@@ -844,6 +884,18 @@ class ArthropodDescriber(QMainWindow):
         first_idx = self.image_list.indexAt(QPoint(0, 0))
         last_idx = self.image_list.indexAt(self.image_list.viewport().rect().bottomLeft())
         self.image_list_model.handle_slider_released(first_idx, last_idx)
+        self.prioritize_visible_thumbnails()
+
+    def prioritize_visible_thumbnails(self):
+        """Moves the thumbnails of the rows visible in the image list to the front of the loading queue."""
+        if self.thumbnail_storage is None or self.storage is None:
+            return
+        first_idx = self.image_list.indexAt(QPoint(0, 0))
+        last_idx = self.image_list.indexAt(self.image_list.viewport().rect().bottomLeft())
+        first_row = max(0, first_idx.row())
+        last_row = last_idx.row() if last_idx.isValid() else self.image_list_proxy_model.rowCount() - 1
+        names = [self.image_list_proxy_model.index(row, 0).data(ROLE_IMAGE_NAME) for row in range(first_row, last_row + 1)]
+        self.thumbnail_storage.prioritize(names)
 
     def handle_action_import_photos_triggered(self):
         self.import_dialog.open_for_importing(self.state.storage.location,
@@ -855,7 +907,12 @@ class ArthropodDescriber(QMainWindow):
     def closeEvent(self, event: QCloseEvent):
         reply = QMessageBox.question(self, 'Confirmation', 'Do you really want to exit?', QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if reply == QMessageBox.Yes:
-            # self.thumbnail_storage.stop()
+            if self.thumbnail_storage is not None:
+                self.thumbnail_storage.stop()
+            self._prefetcher.shutdown()
+            self.job_engine.shutdown()
+            self.region_scheduler.shutdown()
+            self.measurements_viewer.scheduler.shutdown()
             if self.storage is not None:
                 self.storage.save()
             self.label_editor.release_resources()
@@ -889,7 +946,8 @@ class ArthropodDescriber(QMainWindow):
                 logger.info('Stopping ThumbnailStorage')
                 # self.thumbnail_storage.stop()
             logger.info(f'Attemtpting to load LocalStorage from {folder}')
-            strg = LocalStorage.load_from(folder)  # <-- This is where the exception happens if the .json is not found.
+            strg = LocalStorage.load_from(folder, memory_budget_mb=self.config.get('memory_budget_mb',
+                                                                                   DEFAULT_MEMORY_BUDGET_MB))  # <-- This is where the exception happens if the .json is not found.
 
             self.set_storage(strg)
 
@@ -1157,34 +1215,26 @@ class ArthropodDescriber(QMainWindow):
     def _handle_label_image_changed(self, lbl_img: LabelImg):
         self.enable_actionSave()
 
-    def _process_region_operation_result(self, storage: Storage, idx: int, label_imgs: typing.List[LabelImg]):
-        photo = storage.get_photo_by_idx(idx, False)
-        if photo.image_path == self.state.current_photo.image_path:
-            commands = []
-            for lab_img in label_imgs:
-                photo[lab_img.label_info.name].is_segmented = lab_img.is_segmented
-                cmd = generate_change_command(self.state.current_photo[lab_img.label_semantic], lab_img.label_image)
-                cmd.image_name = photo.image_name
-                cmd.label_name = lab_img.label_semantic
-                commands.append(cmd)
-            self.command_executor.do_commands(commands)
+    def _process_region_operation_result(self, idx: int, patches: typing.Dict[str, LabelPatch]):
+        """Applies the changes computed by a region computation for the photo `idx` as an undoable command."""
+        photo = self.state.storage.get_photo_by_idx(idx, False)
+        commands = []
+        for label_name, patch in patches.items():
+            cmd = generate_patch_change_command(photo[label_name], patch.top, patch.left, patch.pixels)
+            cmd.image_name = photo.image_name
+            cmd.label_name = label_name
+            commands.append(cmd)
+        self.command_executor.do_commands(commands, photo.image_name)
+        self.label_editor.cmd_executor.undo_manager.get_undo_redo(photo.image_name, '').clear_redo()
+        if self.state.current_photo is not None and photo.image_path == self.state.current_photo.image_path:
             self.state.label_img_changed.emit(self.state.current_photo['Labels'])
-            print('setting the current photo')
-            # self.label_editor.set_photo2(self.state.current_photo, reset_view=False)
             self.label_editor.image_viewer.set_photo(self.state.current_photo, False)
-        else:
-            _photo = self.storage.get_photo_by_name(photo.image_name)
-            for lab_img in label_imgs:
-                _photo[lab_img.label_semantic].label_image = lab_img.label_image
-        self.label_editor.cmd_executor.undo_manager.get_undo_redo(photo.image_name, '').clear_redo()
-
-    def _region_comp_operation(self, reg_comp: RegionComputation):
-        def execute(storage: Storage, idx: int):
-            photo = storage.get_photo_by_idx(idx, True)
-            return reg_comp(photo)
-        return execute
 
     def compute_regions3(self, reg_comp: RegionComputation, process_mode: ProcessType):
+        if self._region_job is not None:
+            QMessageBox.information(self, 'Region computation running',
+                                    'Another region computation is running, wait for it to finish or cancel it.')
+            return
         if process_mode == ProcessType.ALL_PHOTOS:
             img_idxs = list(range(self.state.storage.image_count))
         elif process_mode == ProcessType.SELECTED_PHOTOS:
@@ -1192,16 +1242,39 @@ class ArthropodDescriber(QMainWindow):
         else:
             img_idxs = []
             for i in range(self.state.storage.image_count):
-                photo = self.state.storage.get_photo_by_idx(i, False)
-                if not photo.has_segmentation_for(self.state.storage.default_label_image):
+                if not self.state.storage.is_segmented(i, self.state.storage.default_label_image):
                     img_idxs.append(i)
-        block_op = BlockingOperation(self.state.storage, img_idxs,
-                                     self._region_comp_operation(reg_comp),
-                                     self._process_region_operation_result, parent=self)
-        block_op.start()
+        storage = self.state.storage
+        # the scheduler runs its own pool of processes, the job only shows it next to the other jobs
+        self._region_job = ExternalJob(f'{reg_comp.info.name} using {self.region_scheduler.max_workers} processes',
+                                       len(img_idxs),
+                                       start_fn=lambda: self.region_scheduler.start(storage, img_idxs, reg_comp),
+                                       cancel_fn=self.region_scheduler.cancel)
+        self._region_job.finished.connect(self._handle_region_job_finished)
+        self.job_engine.submit(self._region_job)
+
+    def _handle_region_computation_progress(self, done: int, total: int):
+        if self._region_job is not None:
+            self._region_job.set_progress(done, total)
+
+    def _handle_region_computation_finished(self, cancelled: bool = False):
+        if self._region_job is not None:
+            self._region_job.complete(cancelled)
+        failures = self.region_scheduler.failures
+        if not cancelled and len(failures) > 0:
+            shown = '\n'.join(f'{img_name}: {error}' for img_name, error in failures[:20])
+            more = f'\n... and {len(failures) - 20} more, see the log' if len(failures) > 20 else ''
+            QMessageBox.warning(self, 'Region computation failed for some photos',
+                                f'The computation failed for {len(failures)} photos:\n{shown}{more}')
+        if self.state.current_photo is None:
+            return
         self.state.current_photo = self.state.storage.get_photo_by_name(self.state.current_photo.image_name)
         self.update_applyToUnsegmented_state()
 
+    def _handle_region_job_finished(self, _):
+        # also when the job is cancelled before it started
+        self._region_job = None
+
     def switch_to_scale_setting(self):
         # self.label_editor.disable()
         #
@@ -0,0 +1,243 @@
+"""Computes regions and properties for a whole project without the GUI, e.g. overnight on a compute server.
+
+    python -m arthropod_describer.batch PROJECT_FOLDER --list
+    python -m arthropod_describer.batch PROJECT_FOLDER --region body legs --property area mean_width --workers 8
+    python -m arthropod_describer.batch PROJECT_FOLDER --property glcm_contrast --tags beetle --param body.threshold=90
+
+Computations are selected by their keys, i.e. the modules they are defined in, or by any unique suffix of the key,
+e.g. "body" or "regions.body". Region computations run first, in the given order, then the property computations
+for the regions given by `--labels`. The results are saved into the project.
+"""
+import argparse
+import dataclasses
+import importlib.resources
+import logging
+import sys
+import time
+import typing
+from pathlib import Path
+
+from PySide2.QtCore import QCoreApplication
+
+from arthropod_describer.common.computations_scheduler import ComputationsScheduler, LabelPatch, \
+    RegionComputationsScheduler, default_max_workers
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.local_storage import LocalStorage
+from arthropod_describer.common.plugin import PropertyComputation, RegionComputation
+from arthropod_describer.common.result_cache import ResultCache, RESULT_CACHE_FILENAME
+from arthropod_describer.common.user_params import UserParam
+from arthropod_describer.plugin_manager import get_plugin_folder_paths, load_plugin
+
+logger = logging.getLogger("batch")
+
+
+DEFAULT_LABEL_HIERARCHIES: typing.Dict[str, str] = {
+    'Labels': 'regions_label_hierarchy.json',
+    'Reflections': 'reflections_label_hierarchy.json'
+}
+SAVE_INTERVAL: int = 50  # photos with new regions after which the project is saved
+
+
+@dataclasses.dataclass
+class StageStats:
+    name: str
+    photos: int = 0
+    tasks: int = 0
+    seconds: float = 0.0
+    failures: typing.List[typing.Tuple[str, str, str]] = dataclasses.field(default_factory=list)  # photo, key, error
+
+    def report(self) -> str:
+        per_second = self.photos / self.seconds if self.seconds > 0 else 0.0
+        return (f'{self.name}: {self.photos} photos, {self.tasks} tasks in {self.seconds:.1f} s, '
+                f'{per_second:.2f} photos/s, {len(self.failures)} failed')
+
+
+def load_computations() -> typing.Tuple[typing.Dict[str, RegionComputation], typing.Dict[str, PropertyComputation]]:
+    """Loads all plugins the same way `PluginManager` does and returns their region and property computations by
+    key. Plugins that cannot be loaded, e.g. because of missing dependencies, are skipped."""
+    region_comps: typing.Dict[str, RegionComputation] = {}
+    prop_comps: typing.Dict[str, PropertyComputation] = {}
+    for plugin_path in get_plugin_folder_paths():
+        try:
+            plugin = load_plugin(Path(plugin_path))
+        except Exception as e:
+            logger.warning(f'skipping the plugin {plugin_path}: {type(e).__name__}: {e}')
+            continue
+        if plugin is None:
+            continue
+        region_comps.update({comp.info.key: comp for comp in plugin.region_computations})
+        prop_comps.update({comp.info.key: comp for comp in plugin.property_computations})
+    return region_comps, prop_comps
+
+
+def resolve_key(key: str, available: typing.Iterable[str]) -> str:
+    """Returns the key from `available` equal to `key` or ending with "." + `key`."""
+    available = list(available)
+    if key in available:
+        return key
+    matches = [candidate for candidate in available if candidate.endswith(f'.{key}')]
+    if len(matches) != 1:
+        raise KeyError(f'{key} matches {len(matches)} computations' + (f': {matches}' if len(matches) > 0 else ''))
+    return matches[0]
+
+
+def apply_params(computations: typing.Dict[str, typing.Union[RegionComputation, PropertyComputation]],
+                 params: typing.List[str]):
+    """Sets user parameters given as "computation.param_key=value", the computation part is resolved by
+    `resolve_key`."""
+    for param_str in params:
+        name, value = param_str.split('=', 1)
+        comp_key, param_key = resolve_key(name.rsplit('.', 1)[0], computations.keys()), name.rsplit('.', 1)[1]
+        user_params = {param.param_key: param for param in computations[comp_key].user_params}
+        if param_key not in user_params:
+            raise KeyError(f'{comp_key} has no parameter {param_key}, its parameters are {list(user_params.keys())}')
+        param = user_params[param_key]
+        param.value = UserParam.converters[param.param_type](value)
+
+
+def open_storage(folder: Path) -> LocalStorage:
+    storage = LocalStorage.load_from(folder)
+    for lbl_name, file_name in DEFAULT_LABEL_HIERARCHIES.items():
+        if lbl_name in storage.label_image_names and storage.get_label_hierarchy2(lbl_name) is None:
+            with importlib.resources.path('arthropod_describer', file_name) as path:
+                storage.set_label_hierarchy2(lbl_name, LabelHierarchy.load(path))
+    return storage
+
+
+def parse_labels(codes: typing.Optional[typing.List[str]], label_hierarchy: LabelHierarchy) \
+        -> typing.Optional[typing.Set[int]]:
+    if codes is None:
+        return None
+    return {label_hierarchy.label(code) for code in codes}
+
+
+def run_region_computation(storage: LocalStorage, idxs: typing.List[int], computation: RegionComputation,
+                           labels: typing.Optional[typing.Set[int]], workers: int) -> StageStats:
+    """Runs `computation` on the photos `idxs` in `workers` processes, one photo per task, and stores the produced
+    label images in the photos."""
+    stats = StageStats(computation.info.name)
+    scheduler = RegionComputationsScheduler(max_workers=workers)
+    unsaved = 0
+
+    def apply_patches(idx: int, patches: typing.Dict[str, LabelPatch]):
+        nonlocal unsaved
+        photo = storage.get_photo_by_idx(idx, load_image=False)
+        for lbl_name, patch in patches.items():
+            label_img = photo[lbl_name]
+            label_img.label_image = patch.apply_to(label_img.label_image).astype(label_img.label_image.dtype,
+                                                                                 copy=False)
+        stats.photos += 1
+        if (unsaved := unsaved + 1) == SAVE_INTERVAL:
+            storage.save()
+            unsaved = 0
+
+    scheduler.photo_computed.connect(apply_patches)
+    start = time.perf_counter()
+    scheduler.start(storage, idxs, computation, labels)
+    scheduler.wait()
+    scheduler.shutdown()
+    storage.save()
+    stats.seconds = time.perf_counter() - start
+    stats.tasks = len(idxs)
+    stats.failures = [(img_name, computation.info.key, error) for img_name, error in scheduler.failures]
+    return stats
+
+
+def run_property_computations(storage: LocalStorage, idxs: typing.List[int],
+                              computations: typing.Dict[str, PropertyComputation], labels: typing.Set[int],
+                              workers: int, result_cache: typing.Optional[ResultCache]) -> StageStats:
+    stats = StageStats('Properties')
+    scheduler = ComputationsScheduler(max_workers=workers)
+    scheduler.task_failed.connect(lambda img_name, comp_key, error: stats.failures.append((img_name, comp_key, error)))
+    failed_photos: typing.Set[str] = set()
+    start = time.perf_counter()
+    scheduler.start(storage, storage.default_label_image,
+                    [(idx, {comp_key: labels for comp_key in computations.keys()}) for idx in idxs], computations,
+                    result_cache)
+    scheduler.wait()
+    scheduler.shutdown()
+    storage.save()
+    stats.seconds = time.perf_counter() - start
+    stats.tasks = len(idxs) * len(computations)
+    failed_photos.update(img_name for img_name, _, _ in stats.failures)
+    stats.photos = len(idxs) - len(failed_photos)
+    if result_cache is not None:
+        stats.name += f' ({scheduler.cache_hits} region results from the cache)'
+    return stats
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m arthropod_describer.batch',
+                                     description='Computes regions and properties for a project without the GUI.')
+    parser.add_argument('project', type=Path, help='the project folder')
+    parser.add_argument('--list', action='store_true', help='list the available computations and exit')
+    parser.add_argument('--region', nargs='+', default=[], metavar='KEY', help='region computations, run in order')
+    parser.add_argument('--property', nargs='+', default=[], metavar='KEY', help='property computations')
+    parser.add_argument('--param', nargs='+', default=[], metavar='COMPUTATION.PARAM=VALUE',
+                        help='user parameters of the computations')
+    parser.add_argument('--tags', nargs='+', default=None, help='process only the photos having all of the tags')
+    parser.add_argument('--labels', nargs='+', default=None, metavar='CODE',
+                        help='regions to measure, e.g. 1:0:0:0, all labels of the label hierarchy by default')
+    parser.add_argument('--region-labels', nargs='+', default=None, metavar='CODE',
+                        help='regions region-restricted computations are restricted to')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, all CPUs by default')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the result cache of the project')
+    args = parser.parse_args(argv)
+
+    _ = QCoreApplication.instance() or QCoreApplication([])
+    region_comps, prop_comps = load_computations()
+    if args.list:
+        for title, comps in [('Region computations', region_comps), ('Property computations', prop_comps)]:
+            print(f'{title}:')
+            for key, comp in sorted(comps.items()):
+                params = ', '.join(f'{param.param_key}={param.value}' for param in comp.user_params)
+                print(f'  {key}  ({comp.info.name}{"; " + params if len(params) > 0 else ""})')
+        return 0
+
+    try:
+        region_keys = [resolve_key(key, region_comps.keys()) for key in args.region]
+        prop_keys = [resolve_key(key, prop_comps.keys()) for key in args.property]
+        apply_params({**region_comps, **prop_comps}, args.param)
+    except (KeyError, IndexError, ValueError) as e:
+        parser.error(str(e))
+    if len(region_keys) == 0 and len(prop_keys) == 0:
+        parser.error('nothing to compute, use --region and/or --property')
+
+    workers = args.workers if args.workers is not None else default_max_workers()
+    storage = open_storage(args.project)
+    idxs = list(range(storage.image_count))
+    if args.tags is not None:
+        names = storage.photo_names_with_tags(set(args.tags))
+        idxs = [idx for idx in idxs if storage.image_names[idx] in names]
+    label_hierarchy = storage.get_label_hierarchy2(storage.default_label_image)
+    print(f'{args.project}: {len(idxs)} of {storage.image_count} photos, {workers} workers')
+
+    all_stats: typing.List[StageStats] = []
+    for key in region_keys:
+        stats = run_region_computation(storage, idxs, region_comps[key],
+                                       parse_labels(args.region_labels, label_hierarchy), workers)
+        print(stats.report())
+        all_stats.append(stats)
+    if len(prop_keys) > 0:
+        labels = parse_labels(args.labels, label_hierarchy)
+        if labels is None:
+            labels = {label for label in label_hierarchy.labels if label > 0}
+        result_cache = None if args.no_cache else ResultCache(storage.location / RESULT_CACHE_FILENAME)
+        stats = run_property_computations(storage, idxs, {key: prop_comps[key] for key in prop_keys}, labels,
+                                          workers, result_cache)
+        if result_cache is not None:
+            result_cache.close()
+        print(stats.report())
+        all_stats.append(stats)
+
+    failures = [failure for stats in all_stats for failure in stats.failures]
+    for img_name, comp_key, error in failures:
+        print(f'FAILED {img_name} {comp_key}: {error}', file=sys.stderr)
+    total_seconds = sum(stats.seconds for stats in all_stats)
+    print(f'total: {total_seconds:.1f} s, {len(idxs) / total_seconds if total_seconds > 0 else 0.0:.2f} photos/s '
+          f'over all stages')
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
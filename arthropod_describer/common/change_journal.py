@@ -0,0 +1,51 @@
+import typing
+
+from arthropod_describer.common.photo import Photo
+
+
+class ChangeJournal:
+    """Keeps track of what was modified since the last save, so that `Storage.save` can write only that.
+
+    Photos register themselves when their tags, approvals, scale setting, image or label images change, label
+    hierarchies when a label is added or modified.
+    """
+    def __init__(self):
+        self._photos: typing.Dict[str, Photo] = {}
+        self._label_hierarchies: typing.Set[str] = set()
+        self._label_images: typing.Set[typing.Tuple[str, str]] = set()  # (image name, label name)
+
+    def photo_changed(self, photo: Photo):
+        self._photos[photo.image_name] = photo
+
+    def label_image_changed(self, photo: Photo, label_name: str):
+        self._photos[photo.image_name] = photo
+        self._label_images.add((photo.image_name, label_name))
+
+    def label_hierarchy_changed(self, label_name: str):
+        self._label_hierarchies.add(label_name)
+
+    def discard_photo(self, img_name: str):
+        self._photos.pop(img_name, None)
+        self._label_images = {entry for entry in self._label_images if entry[0] != img_name}
+
+    @property
+    def changed_photos(self) -> typing.List[Photo]:
+        return list(self._photos.values())
+
+    @property
+    def changed_label_images(self) -> typing.Set[typing.Tuple[str, str]]:
+        """(image name, label name) pairs of the modified label images."""
+        return set(self._label_images)
+
+    @property
+    def changed_label_hierarchies(self) -> typing.Set[str]:
+        return set(self._label_hierarchies)
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self._photos) == 0 and len(self._label_hierarchies) == 0
+
+    def clear(self):
+        self._photos.clear()
+        self._label_hierarchies.clear()
+        self._label_images.clear()
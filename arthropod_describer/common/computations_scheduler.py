@@ -1,24 +1,746 @@
+import collections
+import concurrent.futures
 import dataclasses
+import importlib
+import inspect
+import logging
+import os
+import time
 import typing
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
 
 import numpy as np
+from PySide2.QtCore import QObject, QTimer, Signal
 
-from arthropod_describer.common.label_image import RegionProperty
-from arthropod_describer.common.photo import Photo
-from arthropod_describer.common.plugin import PropertyComputation
+from arthropod_describer.common.intermediates import group_computations, make_plan
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.label_image import LabelImg, LabelImgInfo, RegionProperty
+from arthropod_describer.common.label_index import LabelIndex
+from arthropod_describer.common.photo import Photo, Subscriber
+from arthropod_describer.common.plugin import PropertyComputation, RegionComputation
 from arthropod_describer.common.regions_cache import RegionsCache
+from arthropod_describer.common.result_cache import ResultCache, computation_fingerprint, region_content_hash, \
+    result_key
+from arthropod_describer.common.storage import Storage
+from arthropod_describer.common.units import Value
 
+logger = logging.getLogger("model.computations_scheduler")
 
-class ComputationsScheduler:
-    def __init__(self, props_by_regions: typing.Dict[int, typing.List[PropertyComputation]]):
-        self.props_by_regions: typing.Dict[int, typing.List[PropertyComputation]] = props_by_regions
-        self.regions_labels: typing.Set[int] = set(props_by_regions.keys())
 
-    def run(self, photo: Photo, label_name: str) -> typing.List[RegionProperty]:
-        regions_cache = RegionsCache(self.regions_labels, photo, label_name)
+PhotoAssignment = typing.Tuple[int, typing.Dict[str, typing.Set[int]]]  # photo index, computation -> region labels
+Computation = typing.Union[PropertyComputation, RegionComputation]
+OnPrepared = typing.Callable[[concurrent.futures.Future, typing.Any], None]  # called with a future and its context
+Discard = typing.Callable[[concurrent.futures.Future], None]  # releases what a future of a cancelled scheduler produced
 
-        props: typing.List[RegionProperty] = []
 
-        for label, prop_comps in self.props_by_regions.items():
-            for prop_comp in prop_comps:
-                pass
\ No newline at end of file
+@dataclasses.dataclass
+class SharedArray:
+    """Describes a numpy array stored in a `SharedMemory` block."""
+    shm_name: str
+    shape: typing.Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def create(cls, arr: np.ndarray) -> typing.Tuple['SharedArray', SharedMemory]:
+        arr = np.ascontiguousarray(arr)
+        shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+        return SharedArray(shm.name, arr.shape, arr.dtype.str), shm
+
+    def attach(self) -> typing.Tuple[np.ndarray, SharedMemory]:
+        shm = SharedMemory(name=self.shm_name)
+        return np.ndarray(self.shape, np.dtype(self.dtype), buffer=shm.buf), shm
+
+
+@dataclasses.dataclass
+class SharedLabelImage:
+    pixels: SharedArray
+    label_hierarchy: typing.Optional[typing.Dict[str, typing.Any]]
+    index: typing.Optional[typing.Dict[str, typing.Any]]
+
+
+@dataclasses.dataclass
+class PhotoPayload:
+    """Everything a worker process needs to reconstruct a photo, the pixel data is passed in shared memory."""
+    image_name: str
+    image_path: str
+    image: SharedArray
+    image_scale: typing.Optional[Value]
+    label_images: typing.Dict[str, SharedLabelImage]
+    label_name: str  # the label image the regions are taken from
+    region_labels: typing.Set[int]  # all the regions any computation needs for this photo
+
+
+def share_photo(photo: Photo, label_name: str, region_labels: typing.Set[int]) \
+        -> typing.Tuple[PhotoPayload, typing.List[SharedMemory]]:
+    """Copies the image and the label images of `photo` to shared memory. The caller owns the returned blocks and
+    has to close and unlink them once the workers are done with the photo."""
+    shms: typing.List[SharedMemory] = []
+    image, shm = SharedArray.create(photo.image)
+    shms.append(shm)
+    label_images: typing.Dict[str, SharedLabelImage] = {}
+    for lab_name in photo.label_image_info.keys():
+        label_img = photo[lab_name]
+        pixels, shm = SharedArray.create(label_img.label_image)
+        shms.append(shm)
+        lab_hier = label_img.label_hierarchy
+        label_images[lab_name] = SharedLabelImage(pixels, None if lab_hier is None else lab_hier.to_dict(),
+                                                  label_img.label_index.to_dict() if lab_name == label_name else None)
+    payload = PhotoPayload(photo.image_name, str(photo.image_path), image, photo.image_scale, label_images,
+                           label_name, set(region_labels))
+    return payload, shms
+
+
+class SharedPhoto(Photo):
+    """A read-only `Photo` in a worker process, reconstructed from a `PhotoPayload`."""
+    def __init__(self, payload: PhotoPayload):
+        self._shms: typing.List[SharedMemory] = []
+        self._image_name = payload.image_name
+        self._image_path = Path(payload.image_path)
+        self._image = self._attach(payload.image)
+        self._image_scale = payload.image_scale
+        self._label_images: typing.Dict[str, LabelImg] = {}
+        self._label_image_info: typing.Dict[str, LabelImgInfo] = {}
+        for lab_name, shared in payload.label_images.items():
+            lab_hier = None if shared.label_hierarchy is None else LabelHierarchy.from_dict(shared.label_hierarchy)
+            index = None if shared.index is None else LabelIndex.from_dict(shared.index)
+            self._label_images[lab_name] = LabelImg.from_array(self._attach(shared.pixels), lab_hier, lab_name, index)
+            self._label_image_info[lab_name] = LabelImgInfo(lab_name, False)
+
+    def _attach(self, shared: SharedArray) -> np.ndarray:
+        arr, shm = shared.attach()
+        self._shms.append(shm)
+        return arr
+
+    def close(self):
+        """Releases the shared memory, nothing may reference the arrays of this photo anymore."""
+        self._image = None
+        for label_img in self._label_images.values():
+            label_img.drop_decoded_data()
+        for shm in self._shms:
+            try:
+                shm.close()
+            except BufferError:  # an array still references the block, it is closed when it is garbage collected
+                pass
+        self._shms.clear()
+
+    @property
+    def _subscriber(self) -> Subscriber:
+        return Subscriber()
+
+    @property
+    def image_name(self) -> str:
+        return self._image_name
+
+    @property
+    def image_path(self) -> Path:
+        return self._image_path
+
+    @image_path.setter
+    def image_path(self, path: Path):
+        self._image_path = path
+
+    @property
+    def image(self) -> np.ndarray:
+        return self._image
+
+    @property
+    def image_size(self) -> typing.Tuple[int, int]:
+        return self._image.shape[1], self._image.shape[0]
+
+    def __getitem__(self, label_name: str) -> LabelImg:
+        return self._label_images[label_name]
+
+    @property
+    def label_images_(self) -> typing.Dict[str, LabelImg]:
+        return self._label_images
+
+    @property
+    def label_image_info(self) -> typing.Dict[str, LabelImgInfo]:
+        return self._label_image_info
+
+    @property
+    def image_scale(self) -> typing.Optional[Value]:
+        return self._image_scale
+
+    def has_segmentation_for(self, label_name: str) -> bool:
+        return label_name in self._label_images and self._label_images[label_name].is_segmented
+
+    def rotate(self, ccw: bool):
+        raise NotImplementedError('SharedPhoto is read-only')
+
+    def resize(self, factor: float):
+        raise NotImplementedError('SharedPhoto is read-only')
+
+    def save(self):
+        pass
+
+    @property
+    def has_unsaved_changes(self) -> bool:
+        return False
+
+
+@dataclasses.dataclass
+class TaskResult:
+    image_name: str
+    computation_key: str
+    props: typing.List[RegionProperty] = dataclasses.field(default_factory=list)
+    timings: typing.Dict[str, float] = dataclasses.field(default_factory=dict)  # derived images computed by the task
+    error: typing.Optional[str] = None
+
+
+@dataclasses.dataclass
+class LabelPatch:
+    """The new pixels of a label image within the bounding box of the changed pixels, whose top left corner is
+    (`top`, `left`)."""
+    top: int
+    left: int
+    pixels: np.ndarray
+
+    @classmethod
+    def difference(cls, old_label: np.ndarray, new_label: np.ndarray) -> typing.Optional['LabelPatch']:
+        """Returns the patch turning `old_label` into `new_label`, None if they are equal."""
+        if old_label.shape != new_label.shape:
+            return LabelPatch(0, 0, np.ascontiguousarray(new_label))
+        changed = old_label != new_label
+        rows = np.flatnonzero(np.any(changed, axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(np.any(changed, axis=0))
+        top, bottom, left, right = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+        return LabelPatch(top, left, np.ascontiguousarray(new_label[top:bottom, left:right]))
+
+    def apply_to(self, label_nd: np.ndarray) -> np.ndarray:
+        """Returns a copy of `label_nd` with the patch applied."""
+        new_label = np.array(label_nd)
+        new_label[self.top:self.top + self.pixels.shape[0], self.left:self.left + self.pixels.shape[1]] = self.pixels
+        return new_label
+
+
+@dataclasses.dataclass
+class RegionTaskResult:
+    image_name: str
+    computation_key: str
+    label_images: typing.Dict[str, LabelPatch] = dataclasses.field(default_factory=dict)  # only the changed ones
+    seconds: float = 0.0
+    error: typing.Optional[str] = None
+
+
+# State of a worker process. Tasks for the same photo reuse the photo and its `RegionsCache`, so derived images
+# are computed once per photo and worker.
+_worker_photo: typing.Optional[typing.Tuple[str, SharedPhoto, RegionsCache]] = None
+_worker_computations: typing.Dict[typing.Tuple[str, typing.Tuple], Computation] = {}
+
+
+def instantiate_computation(key: str, param_values: typing.Dict[str, typing.Any],
+                            base: typing.Type = PropertyComputation) -> Computation:
+    """Creates the computation derived from `base` whose `info.key` is `key`, i.e. the module it is defined in, see
+    `Plugin.register_computation`, and sets its user parameters to `param_values`."""
+    module = importlib.import_module(key)
+    classes = [cls for _, cls in inspect.getmembers(module, inspect.isclass)
+               if issubclass(cls, base) and cls is not base and cls.__module__ == key]
+    if len(classes) == 0:
+        raise ValueError(f'There is no {base.__name__} in the module {key}.')
+    computation: Computation = classes[0]()
+    computation.info.key = key
+    for param in computation.user_params:
+        if param.param_key in param_values:
+            param.value = param_values[param.param_key]
+    return computation
+
+
+def _worker_computation(key: str, param_values: typing.Dict[str, typing.Any],
+                        base: typing.Type = PropertyComputation) -> Computation:
+    # the values of storage-sourced parameters are collections, so they are keyed by `repr`, as in
+    # `computation_fingerprint`
+    cache_key = (key, tuple(sorted((param_key, repr(value)) for param_key, value in param_values.items())))
+    if cache_key not in _worker_computations:
+        _worker_computations[cache_key] = instantiate_computation(key, param_values, base)
+    return _worker_computations[cache_key]
+
+
+def _worker_regions(payload: PhotoPayload) -> typing.Tuple[SharedPhoto, RegionsCache]:
+    global _worker_photo
+    if _worker_photo is None or _worker_photo[0] != payload.image.shm_name:
+        if _worker_photo is not None:
+            old_photo = _worker_photo[1]
+            _worker_photo = None  # drops the regions cache, which holds views of the shared memory
+            old_photo.close()
+        photo = SharedPhoto(payload)
+        _worker_photo = (payload.image.shm_name, photo,
+                         RegionsCache(payload.region_labels, photo, payload.label_name, lazy=True))
+    return _worker_photo[1], _worker_photo[2]
+
+
+def _hash_regions(photo: Photo, label_name: str, labels: typing.Set[int]) -> typing.Dict[int, str]:
+    """`region_content_hash` of every region in `labels`. Decodes the photo and its label images, so the scheduler
+    runs it in its helper thread."""
+    return {label: region_content_hash(photo, label_name, label) for label in labels}
+
+
+def _timings(regions_cache: RegionsCache) -> typing.Dict[str, float]:
+    timings = dict(regions_cache.data_storage.timings)
+    timings.update({f'intermediate {name}': secs for name, secs in regions_cache.intermediates.timings.items()})
+    return timings
+
+
+def _new_timings(before: typing.Dict[str, float], after: typing.Dict[str, float]) -> typing.Dict[str, float]:
+    return {key: secs - before.get(key, 0.0) for key, secs in after.items() if secs > before.get(key, 0.0)}
+
+
+def compute_task(payload: PhotoPayload,
+                 tasks: typing.List[typing.Tuple[str, typing.Dict[str, typing.Any], typing.Set[int]]]) \
+        -> typing.List[TaskResult]:
+    """Runs the computations (computation key, parameter values, region labels) in `tasks` on the photo described by
+    `payload`, computing the intermediates they require first, each of them once. Runs in a worker process, errors
+    are reported in the results."""
+    results = [TaskResult(payload.image_name, computation_key) for computation_key, _, _ in tasks]
+    try:
+        photo, regions_cache = _worker_regions(payload)
+        computations = [_worker_computation(computation_key, param_values)
+                        for computation_key, param_values, _ in tasks]
+        before = _timings(regions_cache)
+        regions_cache.intermediates.execute(make_plan((computation.requires, labels)
+                                                      for computation, (_, _, labels) in zip(computations, tasks)))
+        results[0].timings = _new_timings(before, _timings(regions_cache))
+    except Exception as e:
+        for result in results:
+            result.error = f'{type(e).__name__}: {e}'
+        return results
+    for result, computation, (_, _, region_labels) in zip(results, computations, tasks):
+        try:
+            before = _timings(regions_cache)
+            result.props = computation(photo, list(region_labels), regions_cache)
+            result.timings.update(_new_timings(before, _timings(regions_cache)))
+        except Exception as e:
+            result.error = f'{type(e).__name__}: {e}'
+    return results
+
+
+def compute_regions_task(payload: PhotoPayload, computation_key: str, param_values: typing.Dict[str, typing.Any],
+                         labels: typing.Optional[typing.Set[int]]) -> RegionTaskResult:
+    """Runs the region computation `computation_key` on the photo described by `payload` and returns the changes of
+    the label images it produced as `LabelPatch`es, so that only the changed part of a label image is sent back. Runs
+    in a worker process, errors are reported in the result."""
+    result = RegionTaskResult(payload.image_name, computation_key)
+    start = time.perf_counter()
+    try:
+        photo, _ = _worker_regions(payload)
+        computation: RegionComputation = _worker_computation(computation_key, param_values, RegionComputation)
+        # some computations modify the label images of the photo in place
+        originals = {lab_name: np.array(photo[lab_name].label_image) for lab_name in photo.label_image_info.keys()}
+        for label_img in computation(photo, labels):
+            patch = LabelPatch.difference(originals[label_img.label_semantic], label_img.label_image)
+            if patch is not None:
+                result.label_images[label_img.label_semantic] = patch
+    except Exception as e:
+        result.error = f'{type(e).__name__}: {e}'
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def default_max_workers() -> int:
+    """The number of worker processes the schedulers use unless told otherwise."""
+    return os.cpu_count() or 1
+
+
+class PoolScheduler(QObject):
+    """Base of the schedulers that run work on photos in a pool of worker processes.
+
+    A subclass puts its work items in `_queue`, `_submit` starts the work for one item and `_collect` handles a
+    finished task submitted to `_executor` and recorded in `_running`. Work that has to be done before submitting,
+    e.g. copying a photo to shared memory, runs in a helper thread through `_prepare`. At most two photos per worker
+    are being prepared or kept in shared memory (`_shared`) at a time. Everything but the work in the helper thread
+    and in the workers runs in the thread that owns the scheduler, which must run a Qt event loop, or call `wait`.
+    """
+    progress = Signal(int, int)  # finished work items, all work items
+    finished = Signal()
+    cancelled = Signal()
+
+    POLL_INTERVAL_MS: int = 50
+
+    def __init__(self, max_workers: typing.Optional[int] = None, parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.max_workers: int = max_workers if max_workers is not None else default_max_workers()
+        self._executor: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._preparer: typing.Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._storage: typing.Optional[Storage] = None
+        self._queue: typing.Deque[typing.Any] = collections.deque()
+        # futures of `_preparer` -> (called once the future is done, its context, called instead if the scheduler
+        # was cancelled while the future was running)
+        self._preparing: typing.Dict[concurrent.futures.Future,
+                                     typing.Tuple[OnPrepared, typing.Any, typing.Optional[Discard]]] = {}
+        self._running: typing.Dict[concurrent.futures.Future, typing.Any] = {}  # future -> context for `_collect`
+        self._shared: typing.Dict[str, typing.List[SharedMemory]] = {}  # photo name -> its shared memory blocks
+        self._done: int = 0
+        self._total: int = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.POLL_INTERVAL_MS)
+        self._timer.timeout.connect(self._poll)
+
+    @property
+    def is_running(self) -> bool:
+        return len(self._running) > 0 or len(self._queue) > 0 or len(self._preparing) > 0
+
+    def _start(self, storage: Storage, work_items: typing.Iterable[typing.Any], total: int):
+        self._storage = storage
+        self._queue = collections.deque(work_items)
+        self._total = total
+        self._done = 0
+        if self._executor is None:
+            # workers are not forked, forking a process with a running Qt application is not safe
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers,
+                                                                    mp_context=get_context('spawn'))
+        if self._preparer is None:
+            self._preparer = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                   thread_name_prefix='computations_prepare')
+        self.progress.emit(0, self._total)
+        self._submit_photos()
+        if self.is_running:
+            self._timer.start()
+        else:
+            self._finish()
+
+    def wait(self):
+        """Blocks until all the work is finished, for use without an event loop."""
+        while self.is_running:
+            concurrent.futures.wait(list(self._running.keys()) + list(self._preparing.keys()),
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            self._poll()
+
+    def cancel(self):
+        """Cancels the work that has not started yet and discards the results of the running tasks."""
+        if not self.is_running:
+            return
+        self._timer.stop()
+        self._queue.clear()
+        for future, (_, _, discard) in self._preparing.items():
+            if not future.cancel() and discard is not None:
+                future.add_done_callback(discard)
+        self._preparing.clear()
+        for future in self._running.keys():
+            future.cancel()
+        self._running.clear()
+        for img_name in list(self._shared.keys()):
+            self._release(img_name)
+        self._cancelled()
+        self.cancelled.emit()
+
+    def shutdown(self):
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._preparer is not None:
+            self._preparer.shutdown(wait=False)
+            self._preparer = None
+
+    def _submit_photos(self):
+        while len(self._queue) > 0 and len(self._preparing) + len(self._shared) < 2 * self.max_workers:
+            self._submit(self._queue.popleft())
+
+    def _prepare(self, fn: typing.Callable, args: typing.Tuple, on_done: OnPrepared, context: typing.Any,
+                 discard: typing.Optional[Discard] = None):
+        """Runs `fn(*args)` in the helper thread, `on_done(future, context)` is called in the owning thread once it
+        is done."""
+        self._preparing[self._preparer.submit(fn, *args)] = (on_done, context, discard)
+
+    def _share(self, photo: Photo, label_name: str, region_labels: typing.Set[int], on_shared: OnPrepared,
+               context: typing.Any):
+        """Copies `photo` to shared memory in the helper thread, `on_shared` gets the future of `share_photo`."""
+        # the label images are created here, `Photo.__getitem__` is not thread-safe
+        for lab_name in photo.label_image_info.keys():
+            _ = photo[lab_name]
+        self._prepare(share_photo, (photo, label_name, region_labels), on_shared, context, self._discard_shared)
+
+    def _poll(self):
+        for future in [future for future in self._preparing.keys() if future.done()]:
+            on_done, context, _ = self._preparing.pop(future)
+            on_done(future, context)
+        for future in [future for future in self._running.keys() if future.done()]:
+            self._collect(future, self._running.pop(future))
+        self._submit_photos()
+        if not self.is_running:
+            self._finish()
+
+    def _advance(self):
+        self._done += 1
+        self.progress.emit(self._done, self._total)
+
+    def _release(self, img_name: str):
+        for shm in self._shared.pop(img_name, []):
+            shm.close()
+            shm.unlink()
+
+    @staticmethod
+    def _discard_shared(future: concurrent.futures.Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        _, shms = future.result()
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    def _finish(self):
+        self._timer.stop()
+        self._log_summary()
+        self.finished.emit()
+
+    def _submit(self, work_item: typing.Any):
+        raise NotImplementedError
+
+    def _collect(self, future: concurrent.futures.Future, context: typing.Any):
+        raise NotImplementedError
+
+    def _cancelled(self):
+        """Drops the state of the subclass after `cancel`."""
+        pass
+
+    def _log_summary(self):
+        pass
+
+
+class ComputationsScheduler(PoolScheduler):
+    """Computes region properties in a pool of worker processes.
+
+    The computations of a photo that require common intermediates (see `PropertyComputation.requires`) form one
+    task, so that the intermediates are computed once, every other (photo, computation) pair is a task of its own.
+    The photo and its label images are copied to shared memory once and used by all the tasks of the photo. With a
+    `ResultCache`, only the regions whose results are not in the cache are computed, and the new results are added
+    to it, the regions are hashed for the cache in the helper thread. The results are merged into the photos' label
+    images in the thread that owns the scheduler.
+    """
+    photo_finished = Signal(str)
+    task_failed = Signal(str, str, str)  # photo name, computation key, error message
+
+    def __init__(self, max_workers: typing.Optional[int] = None, parent: typing.Optional[QObject] = None):
+        super().__init__(max_workers, parent)
+        self._label_name: str = 'Labels'
+        self._computations: typing.Dict[str, PropertyComputation] = {}
+        self._result_cache: typing.Optional[ResultCache] = None
+        # (photo name, computation key) -> {label: result cache key} of the regions being computed
+        self._result_keys: typing.Dict[typing.Tuple[str, str], typing.Dict[int, str]] = {}
+        self.cache_hits: int = 0  # number of regions whose results were taken from the result cache
+        self._remaining_per_photo: typing.Dict[str, int] = {}
+        self.derived_timings: typing.Dict[str, float] = {}  # time spent on every derived image and intermediate
+
+    def start(self, storage: Storage, label_name: str, photo_assignments: typing.List[PhotoAssignment],
+              computations: typing.Dict[str, PropertyComputation], result_cache: typing.Optional[ResultCache] = None):
+        """Starts computing, for every (photo index, {computation key: labels}) in `photo_assignments`, the
+        computations from `computations` for the labels, taking the results present in `result_cache` from it."""
+        if self.is_running:
+            raise RuntimeError('The scheduler is already running.')
+        self._label_name = label_name
+        self._computations = computations
+        self._result_cache = result_cache
+        self._result_keys.clear()
+        self.cache_hits = 0
+        self.derived_timings = {}
+        assignments = [assignment for assignment in photo_assignments if len(assignment[1]) > 0]
+        self._start(storage, assignments, sum(len(to_compute) for _, to_compute in assignments))
+
+    def _submit(self, work_item: PhotoAssignment):
+        idx, to_compute = work_item
+        photo = self._storage.get_photo_by_idx(idx, load_image=False)
+        if self._result_cache is None:
+            self._share(photo, self._label_name, set().union(*to_compute.values()), self._collect_shared,
+                        (photo.image_name, to_compute))
+            return
+        # the label images are created here, `Photo.__getitem__` is not thread-safe
+        for lab_name in photo.label_image_info.keys():
+            _ = photo[lab_name]
+        self._prepare(_hash_regions, (photo, self._label_name, set().union(*to_compute.values())),
+                      self._collect_hashes, (photo, to_compute))
+
+    def _collect_hashes(self, future: concurrent.futures.Future,
+                        context: typing.Tuple[Photo, typing.Dict[str, typing.Set[int]]]):
+        photo, to_compute = context
+        try:
+            content_hashes = future.result()
+        except Exception as e:
+            logger.warning(f'could not hash the regions of {photo.image_name}, the result cache is not used: {e}')
+        else:
+            to_compute = self._take_cached(photo, to_compute, content_hashes)
+        if len(to_compute) == 0:
+            self.photo_finished.emit(photo.image_name)
+        else:
+            self._share(photo, self._label_name, set().union(*to_compute.values()), self._collect_shared,
+                        (photo.image_name, to_compute))
+
+    def _collect_shared(self, future: concurrent.futures.Future,
+                        context: typing.Tuple[str, typing.Dict[str, typing.Set[int]]]):
+        img_name, to_compute = context
+        try:
+            payload, shms = future.result()
+        except Exception as e:
+            for comp_key in to_compute.keys():
+                self._report_failure(img_name, comp_key, f'{type(e).__name__}: {e}')
+            return
+        self._shared[img_name] = shms
+        groups = group_computations({comp_key: self._computations[comp_key].requires
+                                     for comp_key in to_compute.keys()})
+        self._remaining_per_photo[img_name] = len(groups)
+        for group in groups:
+            tasks = []
+            for comp_key in group:
+                computation = self._computations[comp_key]
+                param_values = {param.param_key: param.value for param in computation.user_params}
+                tasks.append((computation.info.key, param_values, set(to_compute[comp_key])))
+            future = self._executor.submit(compute_task, payload, tasks)
+            self._running[future] = (img_name, group)
+
+    def _take_cached(self, photo: Photo, to_compute: typing.Dict[str, typing.Set[int]],
+                     content_hashes: typing.Dict[int, str]) -> typing.Dict[str, typing.Set[int]]:
+        """Applies the results of `to_compute` found in the result cache and returns what remains to be computed."""
+        remaining: typing.Dict[str, typing.Set[int]] = {}
+        label_img = photo[self._label_name]
+        for comp_key, labels in to_compute.items():
+            fingerprint = computation_fingerprint(self._computations[comp_key])
+            keys = {label: result_key(content_hashes[label], fingerprint) for label in labels}
+            cached = self._result_cache.get_many(keys.values())
+            for label, key in keys.items():
+                for prop in cached.get(key, []):
+                    prop.info.key = self._computations[comp_key].info.key
+                    label_img.set_region_prop(prop.label, prop)
+            self.cache_hits += len(cached)
+            missing = {label for label, key in keys.items() if key not in cached}
+            if len(missing) == 0:
+                self._advance()
+                continue
+            remaining[comp_key] = missing
+            self._result_keys[(photo.image_name, comp_key)] = {label: keys[label] for label in missing}
+        return remaining
+
+    def _collect(self, future: concurrent.futures.Future, context: typing.Tuple[str, typing.List[str]]):
+        img_name, comp_keys = context
+        try:
+            results: typing.List[TaskResult] = future.result()
+        except Exception as e:  # e.g. a worker process died
+            results = [TaskResult(img_name, comp_key, error=f'{type(e).__name__}: {e}') for comp_key in comp_keys]
+        for comp_key, result in zip(comp_keys, results):
+            if result.error is not None:
+                self._report_failure(img_name, comp_key, result.error)
+            else:
+                label_img = self._storage.get_photo_by_name(img_name)[self._label_name]
+                for prop in result.props:
+                    prop.info.key = self._computations[comp_key].info.key
+                self._cache_results(img_name, comp_key, result.props)
+                for prop in result.props:
+                    label_img.set_region_prop(prop.label, prop)
+                self._advance()
+            for key, secs in result.timings.items():
+                self.derived_timings[key] = self.derived_timings.get(key, 0.0) + secs
+        self._remaining_per_photo[img_name] -= 1
+        if self._remaining_per_photo[img_name] == 0:
+            del self._remaining_per_photo[img_name]
+            self._release(img_name)
+            self.photo_finished.emit(img_name)
+
+    def _cache_results(self, img_name: str, comp_key: str, props: typing.List[RegionProperty]):
+        keys = self._result_keys.pop((img_name, comp_key), None)
+        if keys is None or self._result_cache is None:
+            return
+        # regions without any property are stored too, so that they are not computed again either
+        props_per_label: typing.Dict[int, typing.List[RegionProperty]] = {label: [] for label in keys.keys()}
+        for prop in props:
+            if prop.label in props_per_label:
+                props_per_label[prop.label].append(prop)
+        try:
+            self._result_cache.put_many((keys[label], label_props) for label, label_props in props_per_label.items())
+        except Exception as e:
+            logger.warning(f'could not store the results of {comp_key} for {img_name} in the result cache: {e}')
+
+    def _report_failure(self, img_name: str, comp_key: str, error: str):
+        self._result_keys.pop((img_name, comp_key), None)
+        logger.error(f'computing {comp_key} for {img_name} failed: {error}')
+        self._advance()
+        self.task_failed.emit(img_name, comp_key, error)
+
+    def _cancelled(self):
+        self._remaining_per_photo.clear()
+        self._result_keys.clear()
+
+    def _log_summary(self):
+        if len(self.derived_timings) > 0:
+            logger.info('time spent computing derived images and intermediates: ' +
+                        ', '.join(f'{key}: {secs:.2f} s' for key, secs in
+                                  sorted(self.derived_timings.items(), key=lambda kv: kv[1], reverse=True)))
+        if self._result_cache is not None:
+            logger.info(f'{self.cache_hits} region results taken from the result cache')
+
+
+class RegionComputationsScheduler(PoolScheduler):
+    """Runs a region computation on photos in a pool of worker processes, one photo per task.
+
+    The workers send back only the changed parts of the label images, see `LabelPatch`, which are handed over with
+    `photo_computed` in the thread that owns the scheduler. Applying them is up to the receiver. A failure affects
+    only its photo, the failures are collected in `failures`.
+    """
+    photo_computed = Signal(int, object)  # photo index, {label image name: LabelPatch}
+    photo_failed = Signal(str, str)  # photo name, error message
+
+    def __init__(self, max_workers: typing.Optional[int] = None, parent: typing.Optional[QObject] = None):
+        super().__init__(max_workers, parent)
+        self._computation_key: str = ''
+        self._param_values: typing.Dict[str, typing.Any] = {}
+        self._labels: typing.Optional[typing.Set[int]] = None
+        self.failures: typing.List[typing.Tuple[str, str]] = []  # photo name, error message
+        self.seconds: float = 0.0  # time spent by the workers on the computation
+
+    def start(self, storage: Storage, idxs: typing.List[int], computation: RegionComputation,
+              labels: typing.Optional[typing.Set[int]] = None):
+        """Starts computing `computation` restricted to `labels` for the photos with indices `idxs`."""
+        if self.is_running:
+            raise RuntimeError('The scheduler is already running.')
+        self._computation_key = computation.info.key
+        self._param_values = {param.param_key: param.value for param in computation.user_params}
+        self._labels = None if labels is None else set(labels)
+        self.failures = []
+        self.seconds = 0.0
+        self._start(storage, idxs, len(idxs))
+
+    def _submit(self, work_item: int):
+        try:
+            photo = self._storage.get_photo_by_idx(work_item, load_image=False)
+        except Exception as e:
+            self._report_failure(self._storage.image_names[work_item], f'{type(e).__name__}: {e}')
+            return
+        self._share(photo, self._storage.default_label_image, set(), self._collect_shared, work_item)
+
+    def _collect_shared(self, future: concurrent.futures.Future, idx: int):
+        img_name = self._storage.image_names[idx]
+        try:
+            payload, shms = future.result()
+        except Exception as e:
+            self._report_failure(img_name, f'{type(e).__name__}: {e}')
+            return
+        self._shared[img_name] = shms
+        future = self._executor.submit(compute_regions_task, payload, self._computation_key, self._param_values,
+                                       self._labels)
+        self._running[future] = idx
+
+    def _collect(self, future: concurrent.futures.Future, idx: int):
+        img_name = self._storage.image_names[idx]
+        self._release(img_name)
+        try:
+            result: RegionTaskResult = future.result()
+        except Exception as e:  # e.g. a worker process died
+            result = RegionTaskResult(img_name, self._computation_key, error=f'{type(e).__name__}: {e}')
+        self.seconds += result.seconds
+        if result.error is not None:
+            self._report_failure(img_name, result.error)
+            return
+        self._advance()
+        self.photo_computed.emit(idx, result.label_images)
+
+    def _report_failure(self, img_name: str, error: str):
+        logger.error(f'computing {self._computation_key} for {img_name} failed: {error}')
+        self.failures.append((img_name, error))
+        self._advance()
+        self.photo_failed.emit(img_name, error)
+
+    def _log_summary(self):
+        logger.info(f'{self._computation_key} computed for {self._total - len(self.failures)}/{self._total} photos, '
+                    f'{self.seconds:.1f} s spent in the workers')
@@ -0,0 +1,79 @@
+import logging
+import time
+import typing
+
+import numpy as np
+from scipy import ndimage
+from skimage.color import rgb2gray, rgb2hsv
+
+from arthropod_describer.common.label_image import LabelImg
+from arthropod_describer.common.photo import Photo
+from arthropod_describer.common.region_stats import RegionStats, compute_region_stats
+
+logger = logging.getLogger("model.derived_images")
+
+
+class DerivedImages:
+    """Images derived from a photo and its label image, shared by all `PropertyComputation`s of one measurement run.
+
+    Every entry is computed on its first request and kept until the store is discarded together with its
+    `RegionsCache`, so e.g. the HSV version of a photo is computed at most once per photo, no matter how many
+    computations need it. The time spent computing every entry is recorded in `timings`.
+
+    The entries are shared, so they must not be modified by the computations.
+    """
+    def __init__(self, photo: Photo, label_img: LabelImg):
+        self._photo = photo
+        self._label_img = label_img
+        self._entries: typing.Dict[str, typing.Any] = {}
+        self.timings: typing.Dict[str, float] = {}
+
+    def get(self, key: str, compute: typing.Callable[[], typing.Any]) -> typing.Any:
+        """Returns the entry `key`, computing it with `compute` if it is not present yet."""
+        if key not in self._entries:
+            start = time.perf_counter()
+            self._entries[key] = compute()
+            self.timings[key] = time.perf_counter() - start
+            logger.debug(f'{key} for {self._photo.image_name} took {1000 * self.timings[key]:.1f} ms')
+        return self._entries[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __getitem__(self, key: str) -> typing.Any:
+        return self._entries[key]
+
+    def __setitem__(self, key: str, value: typing.Any):
+        self._entries[key] = value
+
+    @property
+    def hsv(self) -> np.ndarray:
+        """The photo in HSV, all channels in the range [0, 1], as returned by `skimage.color.rgb2hsv`."""
+        return self.get('photo_hsv', lambda: rgb2hsv(self._photo.image))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """The photo in grayscale, in the range [0, 1], as returned by `skimage.color.rgb2gray`."""
+        return self.get('photo_gray', lambda: rgb2gray(self._photo.image))
+
+    def level_image(self, level: int) -> np.ndarray:
+        """The label image with the labels of `level` of the label hierarchy, see `LabelImg.__getitem__`."""
+        return self.get(f'level_{level}', lambda: self._label_img[level])
+
+    def distance_transform(self, label: int, mask: np.ndarray) -> np.ndarray:
+        """The Euclidean distance transform of the region `label` whose mask (e.g. `Region.mask`) is `mask`. Pixels
+        outside of `mask`'s array count as background."""
+        return self.get(f'edt_{label}', lambda: ndimage.distance_transform_edt(np.pad(mask, 1))[1:-1, 1:-1])
+
+    def region_stats(self, label: int) -> typing.Optional[RegionStats]:
+        """The basic statistics of the region `label`, None if it has no pixels. They are computed at once for all the
+        labels on the level of `label`, see `compute_region_stats`."""
+        level = self._label_img.label_hierarchy.get_level(label)
+        all_stats = self.get(f'region_stats_{level}', lambda: self._compute_region_stats(level))
+        return all_stats.get(label)
+
+    def _compute_region_stats(self, level: int) -> typing.Dict[int, RegionStats]:
+        reflections = self._photo['Reflections'].label_image if 'Reflections' in self._photo.label_image_info \
+            else None
+        return compute_region_stats(self.level_image(level), self._label_img.label_hierarchy.level_groups[level],
+                                    self._photo.image, reflections)
@@ -99,9 +99,10 @@ class EditCommandExecutor(QObject):
                     self._filter_against_mask(change, photo.image_name, label_img.label_info.constrain_to)
                 if len(change.coords[0]) == 0:
                     continue
+                _ = label_img.label_index  # so that the index is updated incrementally in `set_dirty`
+                old_values = label_img_nd[change.coords[0], change.coords[1]]
                 self.change_labels(label_img_nd, change)
-                label_img.label_image = label_img_nd
-                self.state.current_photo[change.label_name].set_dirty()
+                label_img.set_dirty(change.coords, old_values)  # lets the storage backend save only the touched part
                 # label_img.save()
                 if not leave_loaded:
                     label_img.unload()
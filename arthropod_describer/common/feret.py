@@ -0,0 +1,181 @@
+import dataclasses
+import math
+import typing
+
+import numba
+import numpy as np
+
+# The kernels work with integer coordinates (x, y) = (2 * column + 2, 2 * row + 2) of the mask, so that the centres
+# of the pixels as well as the midpoints of their edges are positive integers and all the geometric predicates are
+# exact.
+
+
+@dataclasses.dataclass
+class FeretDiameters:
+    max: float  # px
+    max_angle: float  # degrees in [0, 180), counter-clockwise from the x axis of the image
+    min: float  # px, the minimum width of the region
+    min_angle: float  # degrees in [0, 180), the direction the minimum width is measured in
+
+
+@numba.njit
+def _cross(o: np.ndarray, a: np.ndarray, b: np.ndarray) -> int:
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+@numba.njit
+def _row_extents(mask: np.ndarray) -> np.ndarray:
+    """(row, first column, last column) of every non-empty row of `mask`."""
+    extents = np.empty((mask.shape[0], 3), dtype=np.int64)
+    count = 0
+    for r in range(mask.shape[0]):
+        first = -1
+        for c in range(mask.shape[1]):
+            if mask[r, c]:
+                first = c
+                break
+        if first < 0:
+            continue
+        last = first
+        for c in range(mask.shape[1] - 1, first - 1, -1):
+            if mask[r, c]:
+                last = c
+                break
+        extents[count, 0], extents[count, 1], extents[count, 2] = r, first, last
+        count += 1
+    return extents[:count]
+
+
+@numba.njit
+def _edge_midpoints(extents: np.ndarray) -> np.ndarray:
+    """The midpoints of the outer edges of the first and the last pixel of every row in `extents`. Their convex hull
+    is the convex hull of the edge midpoints of all the pixels of the rows."""
+    points = np.empty((6 * extents.shape[0], 2), dtype=np.int64)
+    for i in range(extents.shape[0]):
+        y, x_first, x_last = 2 * extents[i, 0] + 2, 2 * extents[i, 1] + 2, 2 * extents[i, 2] + 2
+        points[6 * i + 0, 0], points[6 * i + 0, 1] = x_first - 1, y
+        points[6 * i + 1, 0], points[6 * i + 1, 1] = x_last + 1, y
+        points[6 * i + 2, 0], points[6 * i + 2, 1] = x_first, y - 1
+        points[6 * i + 3, 0], points[6 * i + 3, 1] = x_first, y + 1
+        points[6 * i + 4, 0], points[6 * i + 4, 1] = x_last, y - 1
+        points[6 * i + 5, 0], points[6 * i + 5, 1] = x_last, y + 1
+    return points
+
+
+@numba.njit
+def _convex_hull(points: np.ndarray) -> np.ndarray:
+    """Andrew's monotone chain, the vertices of the hull in counter-clockwise order without collinear points."""
+    n = points.shape[0]
+    keys = points[:, 0] * (np.max(points[:, 1]) + 1) + points[:, 1]
+    pts = points[np.argsort(keys)]
+    hull = np.empty((2 * n, 2), dtype=np.int64)
+    k = 0
+    for i in range(n):  # lower hull
+        while k >= 2 and _cross(hull[k - 2], hull[k - 1], pts[i]) <= 0:
+            k -= 1
+        hull[k] = pts[i]
+        k += 1
+    lower = k + 1
+    for i in range(n - 2, -1, -1):  # upper hull
+        while k >= lower and _cross(hull[k - 2], hull[k - 1], pts[i]) <= 0:
+            k -= 1
+        hull[k] = pts[i]
+        k += 1
+    return hull[:max(k - 1, 1)]
+
+
+@numba.njit
+def _hull_row_extents(hull: np.ndarray, rows: int) -> np.ndarray:
+    """(row, first column, last column) of the pixels of the rows 0..`rows` whose centres lie in `hull` or on its
+    boundary, i.e. the rows of `skimage.morphology.convex_hull_image`."""
+    extents = np.empty((rows, 3), dtype=np.int64)
+    count = 0
+    h = hull.shape[0]
+    for r in range(rows):
+        y = 2 * r + 2
+        first, last = 1 << 62, -(1 << 62)
+        for e in range(h):
+            x1, y1, x2, y2 = hull[e, 0], hull[e, 1], hull[(e + 1) % h, 0], hull[(e + 1) % h, 1]
+            if y < min(y1, y2) or y > max(y1, y2):
+                continue
+            if y1 == y2:
+                num_lo, num_hi, den = min(x1, x2), max(x1, x2), 1
+            else:
+                # the edge crosses the row at x = num / den
+                num_lo = x1 * (y2 - y1) + (y - y1) * (x2 - x1)
+                den = y2 - y1
+                if den < 0:
+                    num_lo, den = -num_lo, -den
+                num_hi = num_lo
+            # column c has x = 2 * c + 2
+            first = min(first, -((2 * den - num_lo) // (2 * den)))
+            last = max(last, (num_hi - 2 * den) // (2 * den))
+        if first <= last:
+            extents[count, 0], extents[count, 1], extents[count, 2] = r, first, last
+            count += 1
+    return extents[:count]
+
+
+@numba.njit
+def _rotating_calipers(hull: np.ndarray) -> typing.Tuple[int, int, int, float, int]:
+    """Returns the squared diameter of `hull` with its two vertices, and the minimum width with the edge it is
+    measured from, in the coordinates of `hull`."""
+    h = hull.shape[0]
+    max_d2, max_i, max_j = 0, 0, 0
+    min_width, min_edge = np.inf, 0
+    if h < 3:
+        if h == 2:
+            max_d2, max_j = (hull[1, 0] - hull[0, 0]) ** 2 + (hull[1, 1] - hull[0, 1]) ** 2, 1
+        return max_d2, max_i, max_j, 0.0, 0
+    j = 1
+    for i in range(h):
+        ni = (i + 1) % h
+        # the vertex farthest from the edge (i, ni)
+        while abs(_cross(hull[i], hull[ni], hull[(j + 1) % h])) > abs(_cross(hull[i], hull[ni], hull[j])):
+            j = (j + 1) % h
+        for p in (i, ni):
+            d2 = (hull[j, 0] - hull[p, 0]) ** 2 + (hull[j, 1] - hull[p, 1]) ** 2
+            if d2 > max_d2:
+                max_d2, max_i, max_j = d2, p, j
+        edge_length = math.sqrt((hull[ni, 0] - hull[i, 0]) ** 2 + (hull[ni, 1] - hull[i, 1]) ** 2)
+        width = abs(_cross(hull[i], hull[ni], hull[j])) / edge_length
+        if width < min_width:
+            min_width, min_edge = width, i
+    return max_d2, max_i, max_j, min_width, min_edge
+
+
+@numba.njit
+def _feret(mask: np.ndarray) -> typing.Tuple[float, float, float, float, float, float]:
+    # the convex hull image of the region, as in `skimage.morphology.convex_hull_image`: the pixels whose centres lie
+    # in the convex hull of the edge midpoints of the region's pixels
+    region_hull = _convex_hull(_edge_midpoints(_row_extents(mask)))
+    # the contour of the convex hull image at the level 0.5 passes through the edge midpoints of its outer pixels
+    hull = _convex_hull(_edge_midpoints(_hull_row_extents(region_hull, mask.shape[0])))
+    max_d2, max_i, max_j, min_width, min_edge = _rotating_calipers(hull)
+    h = hull.shape[0]
+    max_dx, max_dy = hull[max_j, 0] - hull[max_i, 0], hull[max_j, 1] - hull[max_i, 1]
+    edge_dx = hull[(min_edge + 1) % h, 0] - hull[min_edge, 0]
+    edge_dy = hull[(min_edge + 1) % h, 1] - hull[min_edge, 1]
+    return math.sqrt(max_d2) / 2, float(max_dx), float(max_dy), min_width / 2, float(edge_dx), float(edge_dy)
+
+
+def _angle(dx: float, dy: float) -> float:
+    """The direction of (dx, dy) in image coordinates, the y axis pointing down, in degrees in [0, 180)."""
+    return math.degrees(math.atan2(-dy, dx)) % 180.0
+
+
+def feret_diameters(mask: np.ndarray) -> FeretDiameters:
+    """The maximum and minimum Feret diameters of the region `mask`, measured on the contour of its convex hull
+    image. The maximum is the same as `skimage.measure.regionprops`' `feret_diameter_max`, computed by rotating
+    calipers on the convex hull of the contour instead of from all pairs of the contour points."""
+    mask = np.ascontiguousarray(mask, dtype=np.bool_)
+    if not mask.any():
+        return FeretDiameters(0.0, 0.0, 0.0, 0.0)
+    max_diameter, max_dx, max_dy, min_width, edge_dx, edge_dy = _feret(mask)
+    return FeretDiameters(max_diameter, _angle(max_dx, max_dy), min_width, (_angle(edge_dx, edge_dy) + 90.0) % 180.0)
+
+
+def batch_feret_diameters(masks: typing.Iterable[typing.Tuple[int, np.ndarray]]) -> typing.Dict[int, FeretDiameters]:
+    """`feret_diameters` of every (label, mask) pair of `masks`, e.g. `(label, region.mask)` of the regions of a
+    `RegionsCache`."""
+    return {label: feret_diameters(mask) for label, mask in masks}
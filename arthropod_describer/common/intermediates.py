@@ -0,0 +1,218 @@
+import ast
+import dataclasses
+import logging
+import time
+import typing
+
+import numpy as np
+
+from arthropod_describer.common.feret import FeretDiameters, feret_diameters
+from arthropod_describer.common.region_stats import RegionStats
+
+logger = logging.getLogger("model.intermediates")
+
+
+@dataclasses.dataclass
+class IntermediateSpec:
+    """Describes a named intermediate product computed per region, e.g. the skeleton of the region.
+
+    `compute(intermediates, label, *args)` computes the product for the region `label`, taking the products it
+    depends on from `intermediates`. `requires` lists the names of those products. Intermediates with `group`
+    set are worth sharing between computations, so computations requiring the same ones are run together.
+    """
+    name: str
+    compute: typing.Callable[..., typing.Any]
+    requires: typing.Tuple[str, ...] = ()
+    group: bool = True
+
+
+INTERMEDIATES: typing.Dict[str, IntermediateSpec] = {}
+
+
+def intermediate(name: str, requires: typing.Sequence[str] = (), group: bool = True):
+    """Registers the decorated function as the producer of the intermediate `name`. Plugins register their
+    intermediates in modules imported by their computations."""
+    def register(func: typing.Callable[..., typing.Any]) -> typing.Callable[..., typing.Any]:
+        if name in INTERMEDIATES and INTERMEDIATES[name].compute is not func:
+            logger.warning(f'the intermediate {name} is registered more than once, the last registration is used')
+        INTERMEDIATES[name] = IntermediateSpec(name, func, tuple(requires), group)
+        return func
+    return register
+
+
+def parse_key(key: str) -> typing.Tuple[str, typing.Tuple]:
+    """Splits a requirement like "glcm[0, (1, 2)]" into the name and the tuple of arguments, ('glcm', (0, (1, 2)))."""
+    key = key.strip()
+    if not key.endswith(']') or '[' not in key:
+        return key, ()
+    name, args = key[:-1].split('[', 1)
+    args = ast.literal_eval(f'({args},)') if len(args.strip()) > 0 else ()
+    return name.strip(), tuple(args)
+
+
+def parse_requirements(requirements: str) -> typing.List[str]:
+    """Splits the value of the `REQUIRES` docstring key, a comma separated list of intermediates, which may have
+    arguments in square brackets containing commas as well."""
+    keys: typing.List[str] = []
+    depth, start = 0, 0
+    for i, char in enumerate(requirements):
+        if char in '[(':
+            depth += 1
+        elif char in '])':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            keys.append(requirements[start:i])
+            start = i + 1
+    keys.append(requirements[start:])
+    return [key.strip() for key in keys if len(key.strip()) > 0]
+
+
+def dependency_closure(names: typing.Iterable[str]) -> typing.Set[str]:
+    """The names of `names` and of all the intermediates they depend on."""
+    closure: typing.Set[str] = set()
+    stack = list(names)
+    while len(stack) > 0:
+        name = stack.pop()
+        if name in closure:
+            continue
+        closure.add(name)
+        if name in INTERMEDIATES:
+            stack.extend(INTERMEDIATES[name].requires)
+    return closure
+
+
+def topological_order(names: typing.Iterable[str]) -> typing.List[str]:
+    """Orders `names` and their dependencies so that every intermediate comes after the ones it depends on."""
+    order: typing.List[str] = []
+    state: typing.Dict[str, int] = {}  # 1 = being visited, 2 = done
+
+    def visit(name: str):
+        if state.get(name) == 2:
+            return
+        if state.get(name) == 1:
+            raise ValueError(f'The intermediates depend on each other in a cycle containing {name}.')
+        state[name] = 1
+        for dep in (INTERMEDIATES[name].requires if name in INTERMEDIATES else ()):
+            visit(dep)
+        state[name] = 2
+        order.append(name)
+
+    for name in sorted(set(names)):
+        visit(name)
+    return order
+
+
+PlanStep = typing.Tuple[str, typing.Tuple, int]  # intermediate name, arguments, region label
+
+
+def make_plan(requests: typing.Iterable[typing.Tuple[typing.Sequence[str], typing.Iterable[int]]]) \
+        -> typing.List[PlanStep]:
+    """Builds the DAG of the intermediates needed by `requests`, pairs of (requirements of a computation, region
+    labels it is computed for), and returns its nodes in a topological order, every node exactly once."""
+    wanted: typing.Dict[int, typing.Set[typing.Tuple[str, typing.Tuple]]] = {}
+    for requirements, labels in requests:
+        keys = [parse_key(key) for key in requirements]
+        for label in labels:
+            label_keys = wanted.setdefault(label, set())
+            for name, args in keys:
+                label_keys.add((name, args))
+                label_keys.update((dep, ()) for dep in dependency_closure([name]) if dep != name)
+    rank = {name: i for i, name in enumerate(topological_order(name for keys in wanted.values() for name, _ in keys))}
+    return sorted(((name, args, label) for label, keys in wanted.items() for name, args in keys),
+                  key=lambda step: (rank[step[0]], step[2], repr(step[1])))
+
+
+def group_computations(requirements: typing.Dict[str, typing.Sequence[str]]) -> typing.List[typing.List[str]]:
+    """Splits the computations, given by their requirements, into groups such that computations sharing an
+    intermediate worth sharing are in the same group."""
+    parents = {key: key for key in requirements.keys()}
+
+    def find(key: str) -> str:
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    owners: typing.Dict[str, str] = {}
+    for comp_key, reqs in requirements.items():
+        for name in dependency_closure(parse_key(req)[0] for req in reqs):
+            if name in INTERMEDIATES and not INTERMEDIATES[name].group:
+                continue
+            if name in owners:
+                parents[find(comp_key)] = find(owners[name])
+            else:
+                owners[name] = comp_key
+    groups: typing.Dict[str, typing.List[str]] = {}
+    for comp_key in requirements.keys():
+        groups.setdefault(find(comp_key), []).append(comp_key)
+    return list(groups.values())
+
+
+class Intermediates:
+    """Memoised intermediate products of the regions of a `RegionsCache`, every product is computed at most once.
+
+    `counts` holds how many times each intermediate was computed and `timings` the time spent on it.
+    """
+    def __init__(self, regions_cache, photo):
+        self.regions_cache = regions_cache
+        self.photo = photo
+        self._values: typing.Dict[typing.Tuple[str, typing.Tuple, int], typing.Any] = {}
+        self.counts: typing.Dict[str, int] = {}
+        self.timings: typing.Dict[str, float] = {}
+
+    def get(self, key: str, label: int, *args) -> typing.Any:
+        """Returns the intermediate `key` of the region `label`. `key` can contain arguments, e.g. "glcm[0, 1]",
+        further arguments can be passed in `args`."""
+        name, key_args = parse_key(key)
+        args = key_args + tuple(args)
+        if (name, args, label) not in self._values:
+            if name not in INTERMEDIATES:
+                raise KeyError(f'Unknown intermediate {name}, known intermediates: {list(INTERMEDIATES.keys())}')
+            start = time.perf_counter()
+            self._values[(name, args, label)] = INTERMEDIATES[name].compute(self, label, *args)
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+            self.counts[name] = self.counts.get(name, 0) + 1
+        return self._values[(name, args, label)]
+
+    def __contains__(self, step: PlanStep) -> bool:
+        return step in self._values
+
+    def execute(self, plan: typing.List[PlanStep]):
+        """Computes the steps of `plan`, see `make_plan`. Failures are left to surface in the computations that need
+        the failed intermediates."""
+        for name, args, label in plan:
+            if label not in self.regions_cache.regions:
+                continue
+            try:
+                self.get(name, label, *args)
+            except Exception as e:
+                logger.debug(f'computing {name}{list(args)} for {label} failed: {e}')
+
+
+@intermediate('mask', group=False)
+def _mask(intermediates: Intermediates, label: int) -> np.ndarray:
+    return intermediates.regions_cache.regions[label].mask
+
+
+@intermediate('image', group=False)
+def _image(intermediates: Intermediates, label: int) -> np.ndarray:
+    return intermediates.regions_cache.regions[label].image
+
+
+@intermediate('hsv')
+def _hsv(intermediates: Intermediates, label: int) -> np.ndarray:
+    """The HSV region of interest of the region, in the bounding box of the region."""
+    top, left, height, width = intermediates.regions_cache.regions[label].bbox
+    return intermediates.regions_cache.data_storage.hsv[top:top + height, left:left + width]
+
+
+@intermediate('region_stats')
+def _region_stats(intermediates: Intermediates, label: int) -> typing.Optional[RegionStats]:
+    """The `RegionStats` of the region, computed together for all the regions of its level."""
+    return intermediates.regions_cache.data_storage.region_stats(label)
+
+
+@intermediate('feret')
+def _feret(intermediates: Intermediates, label: int) -> FeretDiameters:
+    """The maximum and minimum Feret diameters of the region and their directions."""
+    return feret_diameters(intermediates.get('mask', label))
@@ -0,0 +1,75 @@
+import typing
+
+Key = typing.Hashable
+
+
+class InvertedIndex:
+    """Maps keys, e.g. tags or labels, to the names of the photos they occur in.
+
+    The index is updated per photo, so keeping it up to date costs time proportional to the change, not to the size
+    of the project. `version` is incremented on every modification, so that users can cache query results.
+    """
+    def __init__(self):
+        self._photos_by_key: typing.Dict[Key, typing.Set[str]] = {}
+        self._keys_by_photo: typing.Dict[str, typing.Set[Key]] = {}
+        self.version: int = 0
+
+    def __contains__(self, photo_name: str) -> bool:
+        """Whether the keys of `photo_name` are indexed."""
+        return photo_name in self._keys_by_photo
+
+    def set_keys(self, photo_name: str, keys: typing.Iterable[Key]):
+        """Sets the keys of `photo_name`, replacing the previous ones."""
+        keys = set(keys)
+        old_keys = self._keys_by_photo.get(photo_name, set())
+        for key in old_keys - keys:
+            self._discard(key, photo_name)
+        for key in keys - old_keys:
+            self._photos_by_key.setdefault(key, set()).add(photo_name)
+        self._keys_by_photo[photo_name] = keys
+        self.version += 1
+
+    def add_key(self, photo_name: str, key: Key):
+        self._keys_by_photo.setdefault(photo_name, set()).add(key)
+        self._photos_by_key.setdefault(key, set()).add(photo_name)
+        self.version += 1
+
+    def remove_key(self, photo_name: str, key: Key):
+        self._keys_by_photo.get(photo_name, set()).discard(key)
+        self._discard(key, photo_name)
+        self.version += 1
+
+    def remove_photo(self, photo_name: str):
+        for key in self._keys_by_photo.pop(photo_name, set()):
+            self._discard(key, photo_name)
+        self.version += 1
+
+    def _discard(self, key: Key, photo_name: str):
+        if (photos := self._photos_by_key.get(key)) is None:
+            return
+        photos.discard(photo_name)
+        if len(photos) == 0:
+            del self._photos_by_key[key]
+
+    @property
+    def keys(self) -> typing.Set[Key]:
+        """All keys occurring in at least one photo."""
+        return set(self._photos_by_key.keys())
+
+    def keys_of(self, photo_name: str) -> typing.Set[Key]:
+        return set(self._keys_by_photo.get(photo_name, set()))
+
+    def count(self, key: Key) -> int:
+        """The number of photos `key` occurs in."""
+        return len(self._photos_by_key.get(key, ()))
+
+    def photos_with(self, key: Key) -> typing.Set[str]:
+        return set(self._photos_by_key.get(key, set()))
+
+    def photos_with_all(self, keys: typing.Iterable[Key]) -> typing.Set[str]:
+        """Returns the photos containing every key from `keys`, for no keys all indexed photos are returned."""
+        keys = list(keys)
+        if len(keys) == 0:
+            return set(self._keys_by_photo.keys())
+        sets = sorted((self._photos_by_key.get(key, set()) for key in keys), key=len)
+        return set(sets[0]).intersection(*sets[1:])
@@ -0,0 +1,287 @@
+import enum
+import logging
+import time
+import typing
+
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+from arthropod_describer.common.storage import Storage
+
+logger = logging.getLogger("model.job_engine")
+
+
+class JobState(enum.IntEnum):
+    Queued = 0
+    Running = 1
+    Finished = 2
+    Cancelled = 3
+    Failed = 4
+
+
+class Job(QObject):
+    """A long running operation executed by `JobEngine` without blocking the GUI thread.
+
+    Subclasses implement `_run`, which starts the work and returns immediately, and report with `_advance` and
+    `_complete`. All of the methods are called in the GUI thread, so are the signal handlers.
+    """
+    progress = Signal(int, int)  # done, total
+    state_changed = Signal(object)  # JobState
+    finished = Signal(object)  # JobState
+
+    def __init__(self, title: str, total: int, parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self.title = title
+        self.total = total
+        self.done: int = 0
+        self.failed: int = 0
+        self.state: JobState = JobState.Queued
+        self._started_at: typing.Optional[float] = None
+        self._cancel_requested: bool = False
+
+    @property
+    def eta(self) -> typing.Optional[float]:
+        """Estimated number of seconds until the job finishes, from the mean time per finished item, None if nothing
+        is finished yet."""
+        if self._started_at is None or self.done == 0 or self.state != JobState.Running:
+            return None
+        elapsed = time.monotonic() - self._started_at
+        return elapsed / self.done * (self.total - self.done)
+
+    @property
+    def is_cancel_requested(self) -> bool:
+        return self._cancel_requested
+
+    def cancel(self):
+        """Requests cancellation, queued jobs are cancelled immediately, running ones after their current items."""
+        if self.state in (JobState.Finished, JobState.Cancelled, JobState.Failed):
+            return
+        self._cancel_requested = True
+        if self.state == JobState.Queued:
+            self._set_state(JobState.Cancelled)
+            self.finished.emit(self.state)
+        else:
+            self._cancel()
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._set_state(JobState.Running)
+        self.progress.emit(self.done, self.total)
+        try:
+            self._run()
+        except Exception as e:
+            logger.error(f'starting the job {self.title} failed: {e}')
+            self._complete(JobState.Failed)
+
+    def _run(self):
+        raise NotImplementedError
+
+    def _cancel(self):
+        """Stops a running job, which must call `_complete` once its running items are done."""
+        pass
+
+    def _advance(self, count: int = 1):
+        self.done += count
+        self.progress.emit(self.done, self.total)
+
+    def _complete(self, state: typing.Optional[JobState] = None):
+        if state is None:
+            state = JobState.Cancelled if self._cancel_requested else JobState.Finished
+        self._set_state(state)
+        logger.info(f'job {self.title} {state.name.lower()} after {self.done}/{self.total} items '
+                    f'in {time.monotonic() - self._started_at:.1f} s')
+        self.finished.emit(state)
+
+    def _set_state(self, state: JobState):
+        self.state = state
+        self.state_changed.emit(state)
+
+
+class _PhotoRunnable(QRunnable):
+    def __init__(self, job: 'PhotoJob', idx: int):
+        super().__init__()
+        self._job = job
+        self._idx = idx
+
+    def run(self):
+        try:
+            result = self._job.operation(self._job.storage, self._idx)
+        except Exception as e:
+            self._job._item_failed.emit(self._idx, f'{type(e).__name__}: {e}')
+            return
+        self._job._item_done.emit(self._idx, result)
+
+
+class PhotoJob(Job):
+    """Runs `operation(storage, idx)` for every index in `idxs` in worker threads, at most `max_parallel` at a time,
+    and hands every result to `result_handler(storage, idx, result)` in the GUI thread.
+
+    With `prepare_photos`, the photo and its label images are created in the GUI thread before the operation runs,
+    `Photo.__getitem__` is not thread-safe. The operations must not modify the photos, that is the job of
+    `result_handler`.
+    """
+    _item_done = Signal(int, object)
+    _item_failed = Signal(int, str)
+
+    item_failed = Signal(str, str)  # photo name, error message
+
+    def __init__(self, title: str, storage: Storage, idxs: typing.List[int],
+                 operation: typing.Callable[[Storage, int], typing.Any],
+                 result_handler: typing.Callable[[Storage, int, typing.Any], None], max_parallel: int = 1,
+                 prepare_photos: bool = True, parent: typing.Optional[QObject] = None):
+        super().__init__(title, len(idxs), parent)
+        self.storage = storage
+        self.operation = operation
+        self.result_handler = result_handler
+        self.max_parallel = max(1, max_parallel)
+        self.prepare_photos = prepare_photos
+        self._pending: typing.List[int] = list(idxs)
+        self._in_flight: int = 0
+        self._pool: typing.Optional[QThreadPool] = None
+        self._item_done.connect(self._handle_item_done)
+        self._item_failed.connect(self._handle_item_failed)
+
+    def run_in(self, pool: QThreadPool):
+        self._pool = pool
+        self.start()
+
+    def _run(self):
+        self._submit()
+        if self._in_flight == 0:
+            self._complete()
+
+    def _submit(self):
+        while len(self._pending) > 0 and self._in_flight < self.max_parallel and not self._cancel_requested:
+            idx = self._pending.pop(0)
+            try:
+                if self.prepare_photos:
+                    photo = self.storage.get_photo_by_idx(idx, load_image=False)
+                    for label_name in self.storage.label_image_names:
+                        _ = photo[label_name]
+            except Exception as e:
+                self._report_failure(idx, f'{type(e).__name__}: {e}')
+                self._advance()
+                continue
+            self._in_flight += 1
+            self._pool.start(_PhotoRunnable(self, idx))
+
+    def _cancel(self):
+        self._pending.clear()
+        if self._in_flight == 0:
+            self._complete()
+
+    def _handle_item_done(self, idx: int, result: typing.Any):
+        self._in_flight -= 1
+        if not self._cancel_requested:
+            try:
+                self.result_handler(self.storage, idx, result)
+            except Exception as e:
+                self._report_failure(idx, f'{type(e).__name__}: {e}')
+        self._item_finished()
+
+    def _handle_item_failed(self, idx: int, error: str):
+        self._in_flight -= 1
+        self._report_failure(idx, error)
+        self._item_finished()
+
+    def _report_failure(self, idx: int, error: str):
+        img_name = self.storage.image_names[idx]
+        logger.error(f'job {self.title} failed for {img_name}: {error}')
+        self.failed += 1
+        self.item_failed.emit(img_name, error)
+
+    def _item_finished(self):
+        self._advance()
+        self._submit()
+        if self._in_flight == 0 and (len(self._pending) == 0 or self._cancel_requested):
+            self._complete()
+
+
+class ExternalJob(Job):
+    """Shows work executed by another engine, e.g. `ComputationsScheduler` with its process pool, as a job.
+
+    `start_fn` starts the work, the owner reports through `set_progress` and `complete`, `cancel_fn` is called on
+    cancellation.
+    """
+    def __init__(self, title: str, total: int, start_fn: typing.Callable[[], None],
+                 cancel_fn: typing.Callable[[], None], parent: typing.Optional[QObject] = None):
+        super().__init__(title, total, parent)
+        self._start_fn = start_fn
+        self._cancel_fn = cancel_fn
+
+    def _run(self):
+        self._start_fn()
+
+    def _cancel(self):
+        self._cancel_fn()
+
+    def set_progress(self, done: int, total: int):
+        self.total = total
+        self._advance(done - self.done)
+
+    def complete(self, cancelled: bool = False):
+        if self.state == JobState.Running:
+            self._complete(JobState.Cancelled if cancelled else None)
+
+
+class JobEngine(QObject):
+    """Queue of `Job`s, executed one after another so that jobs modifying the same photos do not interfere, the items
+    of a `PhotoJob` run in parallel in a `QThreadPool`.
+    """
+    job_added = Signal(Job)
+    job_started = Signal(Job)
+    job_finished = Signal(Job)
+
+    def __init__(self, max_threads: typing.Optional[int] = None, parent: typing.Optional[QObject] = None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        if max_threads is not None:
+            self._pool.setMaxThreadCount(max_threads)
+        self._queue: typing.List[Job] = []
+        self._running: typing.Optional[Job] = None
+
+    @property
+    def max_threads(self) -> int:
+        return self._pool.maxThreadCount()
+
+    @property
+    def jobs(self) -> typing.List[Job]:
+        """The running job followed by the queued ones."""
+        return ([self._running] if self._running is not None else []) + list(self._queue)
+
+    def submit(self, job: Job) -> Job:
+        job.setParent(self)
+        job.finished.connect(lambda _, job=job: self._handle_job_finished(job))
+        self._queue.append(job)
+        self.job_added.emit(job)
+        self._start_next()
+        return job
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pool.clear()
+        self._pool.waitForDone()
+
+    def _start_next(self):
+        while self._running is None and len(self._queue) > 0:
+            job = self._queue.pop(0)
+            if job.state != JobState.Queued:  # cancelled while queued
+                continue
+            self._running = job
+            self.job_started.emit(job)
+            if isinstance(job, PhotoJob):
+                job.run_in(self._pool)
+            else:
+                job.start()
+
+    def _handle_job_finished(self, job: Job):
+        if job is self._running:
+            self._running = None
+        elif job in self._queue:
+            self._queue.remove(job)
+        self.job_finished.emit(job)
+        job.deleteLater()
+        self._start_next()
@@ -0,0 +1,104 @@
+import typing
+
+from PySide2.QtCore import QTimer
+from PySide2.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QProgressBar, QPushButton, QTableWidgetItem, \
+    QHeaderView, QAbstractItemView
+
+from arthropod_describer.common.job_engine import Job, JobEngine, JobState
+
+
+def format_eta(seconds: typing.Optional[float]) -> str:
+    if seconds is None:
+        return ''
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f'{seconds // 3600} h {(seconds % 3600) // 60} min'
+    if seconds >= 60:
+        return f'{seconds // 60} min {seconds % 60} s'
+    return f'{seconds} s'
+
+
+class JobPanel(QWidget):
+    """Lists the running and queued jobs of a `JobEngine` with their progress and ETA, every job can be cancelled."""
+    COLUMNS = ['Job', 'State', 'Progress', 'ETA', '']
+
+    def __init__(self, engine: JobEngine, parent: typing.Optional[QWidget] = None):
+        super().__init__(parent)
+        self.engine = engine
+        self._rows: typing.List[Job] = []
+
+        self._table = QTableWidget(0, len(self.COLUMNS))
+        self._table.setHorizontalHeaderLabels(self.COLUMNS)
+        self._table.verticalHeader().setVisible(False)
+        self._table.setSelectionMode(QAbstractItemView.NoSelection)
+        self._table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self._table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, len(self.COLUMNS)):
+            self._table.horizontalHeader().setSectionResizeMode(column, QHeaderView.ResizeToContents)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self._table)
+        self.setLayout(layout)
+
+        # the ETA changes even when no item finishes
+        self._eta_timer = QTimer(self)
+        self._eta_timer.setInterval(1000)
+        self._eta_timer.timeout.connect(self._update_etas)
+
+        self.engine.job_added.connect(self._add_job)
+        self.engine.job_finished.connect(self._remove_job)
+        for job in self.engine.jobs:
+            self._add_job(job)
+
+    def _add_job(self, job: Job):
+        row = len(self._rows)
+        self._rows.append(job)
+        self._table.insertRow(row)
+        self._table.setItem(row, 0, QTableWidgetItem(job.title))
+        self._table.setItem(row, 1, QTableWidgetItem(job.state.name))
+        progress_bar = QProgressBar()
+        progress_bar.setRange(0, max(job.total, 1))
+        progress_bar.setValue(job.done)
+        progress_bar.setFormat('%v/%m')
+        self._table.setCellWidget(row, 2, progress_bar)
+        self._table.setItem(row, 3, QTableWidgetItem(''))
+        btn_cancel = QPushButton('Cancel')
+        btn_cancel.clicked.connect(job.cancel)
+        self._table.setCellWidget(row, 4, btn_cancel)
+
+        job.progress.connect(lambda done, total, job=job: self._update_progress(job, done, total))
+        job.state_changed.connect(lambda state, job=job: self._update_state(job, state))
+        self._eta_timer.start()
+
+    def _remove_job(self, job: Job):
+        if job not in self._rows:
+            return
+        row = self._rows.index(job)
+        self._rows.pop(row)
+        self._table.removeRow(row)
+        if len(self._rows) == 0:
+            self._eta_timer.stop()
+
+    def _update_progress(self, job: Job, done: int, total: int):
+        if job not in self._rows:
+            return
+        row = self._rows.index(job)
+        progress_bar: QProgressBar = self._table.cellWidget(row, 2)
+        progress_bar.setRange(0, max(total, 1))
+        progress_bar.setValue(done)
+        self._table.item(row, 3).setText(format_eta(job.eta))
+
+    def _update_state(self, job: Job, state: JobState):
+        if job not in self._rows:
+            return
+        row = self._rows.index(job)
+        text = 'Cancelling' if state == JobState.Running and job.is_cancel_requested else state.name
+        self._table.item(row, 1).setText(text)
+        self._table.cellWidget(row, 4).setEnabled(state in (JobState.Queued, JobState.Running))
+
+    def _update_etas(self):
+        for row, job in enumerate(self._rows):
+            self._table.item(row, 3).setText(format_eta(job.eta))
+            if job.is_cancel_requested and job.state == JobState.Running:
+                self._table.item(row, 1).setText('Cancelling')
@@ -292,6 +292,20 @@ def generate_change_command(old_lab_img: LabelImg, new_label: np.ndarray) -> Opt
     return label_difference_to_command(lab_diff, old_lab_img)
 
 
+def generate_patch_change_command(old_lab_img: LabelImg, top: int, left: int, new_patch: np.ndarray) -> CommandEntry:
+    """Like `generate_change_command`, but `new_patch` contains the new values only for the part of `old_lab_img`
+    whose top left corner is (`top`, `left`), the rest of `old_lab_img` stays unchanged."""
+    old_patch = old_lab_img.label_image[top:top + new_patch.shape[0], left:left + new_patch.shape[1]]
+    changed = old_patch != new_patch
+    label_changes: List[LabelChange] = []
+    for new_label in np.unique(new_patch[changed]):
+        painted = np.logical_and(changed, new_patch == new_label)
+        for old_label in np.unique(old_patch[painted]):
+            yy, xx = np.nonzero(np.logical_and(painted, old_patch == old_label))
+            label_changes.append(LabelChange((yy + top, xx + left), new_label, old_label, old_lab_img.label_semantic))
+    return CommandEntry(label_changes)
+
+
 def generate_command_from_coordinates(label_img: LabelImg, coords_x: List[int], coords_y: List[int], new_label: int) -> CommandEntry:
     lab_img = label_img.label_image
     values = lab_img[coords_y, coords_x]
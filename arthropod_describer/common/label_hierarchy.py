@@ -3,7 +3,7 @@ import json
 import math
 import operator
 from pathlib import Path
-from typing import List, Optional, Dict, Union, Any, Tuple, Set
+from typing import List, Optional, Dict, Union, Any, Tuple, Set, Callable
 
 
 class Node:
@@ -51,6 +51,7 @@ class LabelHierarchy:
         self.name = ''
         self._level_groups: List[Set[int]] = []
         self.mask_label: Optional[Node] = None
+        self.on_modified: Optional[Callable[[], None]] = None  # called by `mark_modified`
 
     @classmethod
     def are_valid_masks(cls, masks: List[int], n_bits: int = 32) -> bool:
@@ -368,6 +369,7 @@ class LabelHierarchy:
         self.labels.sort()
 
         self.colormap[label] = color
+        self.mark_modified()
 
     def add_child_label(self, parent: int, name: str, color: Tuple[int, int, int]) -> Node:
         """Adds a new child label to the label `parent`."""
@@ -405,9 +407,15 @@ class LabelHierarchy:
         self.labels.sort()
 
         self.colormap[label] = color
+        self.mark_modified()
 
         return label_node
 
+    def mark_modified(self):
+        """Should be called whenever labels, their names or colors are modified, so the hierarchy gets saved."""
+        if self.on_modified is not None:
+            self.on_modified()
+
     @property
     def level_groups(self) -> List[Set[int]]:
         """
@@ -1,4 +1,5 @@
 import json
+import threading
 from enum import IntEnum
 from pathlib import Path
 from typing import Optional, Any, List, Dict, Tuple, Union
@@ -9,11 +10,14 @@ import typing
 from PIL import Image
 from PySide2.QtGui import QPixmap
 from scipy import ndimage
-from skimage import io
 
 from arthropod_describer.common.common import Info
 from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.label_index import LabelIndex
+from arthropod_describer.common.label_storage import LabelStorageBackend, TiffLabelBackend, make_backend
+from arthropod_describer.common.residency_manager import ResidencyManager
 from arthropod_describer.common.units import Value, CompoundUnit, Unit, BaseUnit, SIPrefix
+from arthropod_describer.common.utils import atomic_write_path
 
 
 class PropertyType(IntEnum):
@@ -127,11 +131,12 @@ class LabelImgType(IntEnum):
 class LabelImgInfo:
     """Info about a particular `LabelImg` object."""
     def __init__(self, label_name: str, is_default: bool, always_constrain_to: Optional[str] = None,
-                 allow_constrain_to: Optional[List[str]] = None):
+                 allow_constrain_to: Optional[List[str]] = None, storage_format: str = TiffLabelBackend.FORMAT):
         self.name: str = label_name
         self.is_default = is_default  # if this is the default label image to show at startup
         self.constrain_to: Optional[str] = always_constrain_to  # whether the editing should be always constrained to some other label image
         self.can_constrain_to: Optional[List[str]] = allow_constrain_to  # what other label images can serve as constraints
+        self.storage_format: str = storage_format  # on-disk format of the label images, see `label_storage.BACKENDS`
 
         if self.constrain_to is not None:
             self.can_constrain_to = None
@@ -150,17 +155,23 @@ class LabelImg:
         self._label_img: Optional[np.ndarray] = None
         self.size = image_size
         self._path: typing.Optional[Path] = None
+        self._backend: typing.Optional[LabelStorageBackend] = None
         self._bbox: typing.Optional[typing.Tuple[int, int, int, int]]
         self._region_props: Dict[int, Dict[str, RegionProperty]] = {}
+        self._measurements_loaded: bool = True
         self._label_hierarchy: Optional[LabelHierarchy] = None
         self.label_img_type: LabelImgType = LabelImgType.Regions
         self.label_info: typing.Optional[LabelImgInfo] = None
         self.label_semantic: str = ''
-        self._used_labels: Optional[typing.Set[int]] = None
+        self._index: Optional[LabelIndex] = None
         self._dirty_flag: bool = False
-        self.prop_list: typing.List[RegionProperty] = []
+        self._pixels_dirty: bool = False  # whether `save` has to write the pixel data or just the measurements
+        self._prop_list: typing.List[RegionProperty] = []
         self.timestamp: int = -1
-        self.is_segmented: bool = False
+        self._is_segmented: Optional[bool] = False  # None = unknown, see `is_segmented`
+        self.on_modified: Optional[typing.Callable[['LabelImg'], None]] = None  # called whenever this becomes dirty
+        self.residency_manager: Optional[ResidencyManager] = None
+        self._load_lock = threading.RLock()  # the label image can be loaded by a prefetching thread
 
     @property
     def path(self) -> typing.Optional[Path]:
@@ -172,15 +183,56 @@ class LabelImg:
     def filename(self) -> str:
         return self.path.name
 
+    @property
+    def storage_files(self) -> typing.List[Path]:
+        """Paths of the files holding the pixel data of this label image."""
+        return self.backend.files
+
+    @property
+    def backend(self) -> LabelStorageBackend:
+        if self._backend is None:
+            self._backend = TiffLabelBackend(self._path)
+        return self._backend
+
+    @property
+    def decoded_data_lock(self) -> threading.RLock:
+        return self._load_lock
+
+    @property
+    def is_segmented(self) -> bool:
+        """Whether there are any labels in this label image. If an edit made it unknown, it is taken from
+        `label_index`."""
+        if self._is_segmented is None:
+            self._is_segmented = self.label_index.has_foreground
+        return self._is_segmented
+
+    @is_segmented.setter
+    def is_segmented(self, segmented: bool):
+        self._is_segmented = segmented
+
+    def _resident_nbytes(self) -> int:
+        # pages of memory-mapped label images are managed by the OS and do not count against the memory budget
+        label_img = self._label_img
+        return 0 if label_img is None or isinstance(label_img, np.memmap) else label_img.nbytes
+
     @property
     def label_image(self) -> np.ndarray:
-        if self._label_img is None:
-            if self._path.exists():
-                self._label_img = io.imread(str(self._path))
-                self.is_segmented = bool(np.any(self._label_img > 0))
-            else:
-                self._label_img = np.zeros(self.size[::-1], np.uint32)
-        return self._label_img
+        with self._load_lock:
+            hit = self._label_img is not None
+            if self._label_img is None:
+                if (loaded_img := self.backend.load()) is not None:
+                    self._label_img = loaded_img
+                    if isinstance(loaded_img, np.memmap):
+                        # do not page in the whole memory-mapped image, the persisted index answers this
+                        self.is_segmented = self.label_index.has_foreground
+                    else:
+                        self.is_segmented = bool(np.any(self._label_img > 0))
+                else:
+                    self._label_img = np.zeros(self.size[::-1], np.uint32)
+            label_img = self._label_img
+            if self.residency_manager is not None:
+                self.residency_manager.access(self, self._resident_nbytes(), hit)
+        return label_img
 
     @label_image.setter
     def label_image(self, lbl_nd: np.ndarray):
@@ -189,38 +241,47 @@ class LabelImg:
         else:
             self.set_image(lbl_nd)
         self.is_segmented = bool(np.any(self._label_img > 0))
-        self._dirty_flag = True
+        self._mark_dirty()
+        if self.residency_manager is not None:
+            self.residency_manager.access(self, self._resident_nbytes())
 
     @property
     def is_set(self) -> bool:
         return self._label_img is not None
 
     def reload(self):
-        if self._path.exists():
-            loaded_img = io.imread(str(self._path))
-            self._label_img = loaded_img.astype(np.uint32)
-            self._used_labels = set(np.unique(self._label_img))
+        if (loaded_img := self.backend.load()) is not None:
+            self._label_img = loaded_img if loaded_img.dtype == np.uint32 else loaded_img.astype(np.uint32)
         else:
             self._label_img = np.zeros(self.size[::-1], dtype=np.uint32)
-            self._used_labels = {0}
+        self._index = None
 
     def unload(self):
         self.save()
+        self.drop_decoded_data()
+
+    def drop_decoded_data(self):
         self._label_img = None
+        if self.residency_manager is not None:
+            self.residency_manager.release(self)
 
     def _serialize_prop_value(self, reg_prop: RegionProperty) -> Union[typing.Any, str]:
         """Returns a representation of `RegionProperty.value` in a form suitable for serialization in .json."""
         if reg_prop.prop_type == PropertyType.NDArray:
             path = f'{self._path}_{reg_prop.info.name}_{reg_prop.label}.npy'
-            np.save(path, reg_prop.value[0])
+            with atomic_write_path(Path(path)) as tmp_path:
+                np.save(tmp_path, reg_prop.value[0])
             return repr((path, reg_prop.value[1]))  # return path to the serialized ndarray and the unit that the array is in
         return repr(reg_prop.value)
 
     def save(self):
         if self._dirty_flag:
-            if self._label_img is not None:
-                self._used_labels = set(np.unique(self._label_img))
-                io.imsave(str(self._path), self._label_img, check_contrast=False)
+            self._ensure_measurements()
+            if self._label_img is not None and self._pixels_dirty:
+                self._label_img = self.backend.save(self._label_img)
+                self._pixels_dirty = False
+                if self._index is not None:
+                    self._index.save(self.index_path, self.backend.stamp)
                 #im = Image.fromarray(self._label_img)
                 #im.save(self._path)
             prop_dict = {
@@ -243,8 +304,9 @@ class LabelImg:
                     ]
                 } for label, prop_dict in self._region_props.items()
             }
-            with open(f'{self._path}_measurements.json', 'w') as f:
-                json.dump(prop_dict, f, indent=2)
+            with atomic_write_path(Path(f'{self._path}_measurements.json')) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    json.dump(prop_dict, f, indent=2)
             self._dirty_flag = False
 
     @classmethod
@@ -259,15 +321,32 @@ class LabelImg:
         lbl = LabelImg(image_size)
         #lbl._type = label_type
         lbl._path = path
+        lbl._backend = make_backend(path, label_info.storage_format)
         #lbl.label_img_type = label_type
         lbl.label_info = label_info
         lbl.label_semantic = label_info.name
-        lbl._load_measurements()
+        # measurements are parsed on the first access, see `_ensure_measurements`
+        lbl._measurements_loaded = False
+        return lbl
+
+    @classmethod
+    def from_array(cls, label_nd: np.ndarray, label_hierarchy: Optional[LabelHierarchy], label_name: str = '',
+                   index: Optional[LabelIndex] = None) -> 'LabelImg':
+        """Creates a `LabelImg` that is not backed by any file, e.g. for computations in worker processes.
+
+        index: LabelIndex - the index of `label_nd` if it is known, otherwise it is built when needed
+        """
+        lbl = LabelImg(label_nd.shape[::-1])
+        lbl._label_img = label_nd
+        lbl._label_hierarchy = label_hierarchy
+        lbl.label_semantic = label_name
+        lbl._index = index
+        lbl.is_segmented = index.has_foreground if index is not None else bool(np.any(label_nd > 0))
         return lbl
 
     def make_empty(self, size: typing.Tuple[int, int]):
         self._label_img = np.zeros(size, np.uint32)
-        self._used_labels = {0}
+        self._index = None
 
     def set_image(self, img: np.ndarray):
         if self._label_img is not None and img is not None:
@@ -276,18 +355,20 @@ class LabelImg:
             elif self._label_img.dtype != img.dtype:
                 raise ValueError(f'The dtype must be {self._label_img.dtype}, got {img.dtype}.')
         self._label_img = img
-        self._dirty_flag = True
+        self._mark_dirty()
 
     def clone(self) -> 'LabelImg':
         lbl = LabelImg(self.size)
         lbl._path = self._path
-        lbl._label_img = self._label_img.copy() if self._label_img is not None else None
+        if self.label_info is not None:
+            lbl._backend = make_backend(self._path, self.label_info.storage_format)
+        lbl._label_img = np.array(self._label_img) if self._label_img is not None else None
         # lbl.label_img_type = self.label_img_type
         lbl.label_info = self.label_info
         lbl.label_semantic = self.label_semantic
         lbl._label_hierarchy = self._label_hierarchy
-        lbl._used_labels = self._used_labels
         lbl._dirty_flag = self._dirty_flag
+        lbl._pixels_dirty = self._pixels_dirty
         return lbl
 
     def _compute_bbox(self):
@@ -299,10 +380,12 @@ class LabelImg:
     @property
     def region_props(self) -> Dict[int, Dict[str, RegionProperty]]:
         """Returns a dictionary of (label -> (property_key -> `RegionProperty`) pairs."""
+        self._ensure_measurements()
         return self._region_props
 
     @region_props.setter
     def region_props(self, props: Dict[int, Dict[str, RegionProperty]]):
+        self._ensure_measurements()
         for label, props in props.items():
             label_props = self._region_props.setdefault(label, dict())
             for prop_key, prop in props.items():
@@ -314,17 +397,24 @@ class LabelImg:
                 #label_prop.unit = prop.unit
                 #label_prop.prop_type = prop.prop_type
                 #label_prop.num_vals = prop.num_vals
-        self._dirty_flag = True
+        self._mark_dirty(pixels_changed=False)
 
     def clear_region_props(self):
+        self._ensure_measurements()
         self._region_props.clear()
 
     def set_region_prop(self, region_label: int, prop: RegionProperty):
         self.region_props = {region_label: {prop.info.key: prop}}
-        self.prop_list.append(prop)
+        self._prop_list.append(prop)
+
+    @property
+    def prop_list(self) -> typing.List[RegionProperty]:
+        self._ensure_measurements()
+        return self._prop_list
 
     def get_region_props(self, region_label: int) -> Optional[Dict[str, RegionProperty]]:
         """Returns (property_key -> `RegionProperty) for `region_label`."""
+        self._ensure_measurements()
         if region_label in self._region_props:
             return self._region_props[region_label]
         return None
@@ -347,17 +437,66 @@ class LabelImg:
         level_mask = self._label_hierarchy.level_mask(level)
         return np.bitwise_and(self.label_image, level_mask)
 
+    @property
+    def index_path(self) -> Path:
+        return Path(f'{self._path}_index.json')
+
+    @property
+    def label_index(self) -> LabelIndex:
+        """Returns the pixel counts and bounding boxes of the labels in this label image. The index is read from
+        `index_path` if it is up to date, otherwise it is built from the label image."""
+        if self._index is None:
+            if not self._pixels_dirty and self._path is not None:
+                self._index = LabelIndex.load(self.index_path, self.backend.stamp)
+            if self._index is None:
+                self._index = LabelIndex.build(self.label_image)
+        return self._index
+
     @property
     def used_labels(self) -> Optional[typing.Set[int]]:
         """Returns the set of labels that are present in this label image."""
-        if self._dirty_flag or self._used_labels is None:
-            self._used_labels = set(np.unique(self.label_image))
-            self._dirty_flag = False
-        return self._used_labels
+        return self.label_index.labels
+
+    def set_dirty(self, coords: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+                  old_values: Optional[np.ndarray] = None):
+        """Marks the pixels at `coords` as modified, None means the whole image. If `old_values`, the values of the
+        pixels before the modification, are provided, the label index is updated instead of being rebuilt."""
+        index_updated = False
+        if coords is not None and self._label_img is not None:
+            if self._index is not None and old_values is not None:
+                self._index.apply_change(coords, old_values, self._label_img[coords[0], coords[1]])
+                self.is_segmented = self._index.has_foreground
+                index_updated = True
+            elif np.any(self._label_img[coords[0], coords[1]] > 0):
+                self.is_segmented = True
+            else:  # labels may have been erased, the label index will tell
+                self._is_segmented = None
+        self._mark_dirty(coords, index_updated=index_updated)
+        self.timestamp = time.time()
 
-    def set_dirty(self):
+    def _mark_dirty(self, coords: Optional[Tuple[np.ndarray, np.ndarray]] = None, pixels_changed: bool = True,
+                    index_updated: bool = False):
         self._dirty_flag = True
-        self.timestamp = time.time()
+        if pixels_changed:
+            self._pixels_dirty = True
+            self.backend.mark_dirty(coords)
+            if not index_updated:
+                self._index = None
+        if self.on_modified is not None:
+            self.on_modified(self)
+
+    def read_region(self, top: int, left: int, bottom: int, right: int) -> np.ndarray:
+        """Returns the pixels in rows `top`..`bottom` and columns `left`..`right` (inclusive). If the label image is
+        not loaded, only the part of the stored label image covering the region is decoded, if the backend supports it."""
+        if self._label_img is None and self.backend.PARTIAL_READS:
+            if (region := self.backend.read_region(top, left, bottom, right)) is not None:
+                return region
+        return self.label_image[top:bottom + 1, left:right + 1]
+
+    def _ensure_measurements(self):
+        if not self._measurements_loaded:
+            self._measurements_loaded = True
+            self._load_measurements()
 
     def _load_measurements(self):
         if (path := Path(f'{str(self._path)}_measurements.json')).exists():
@@ -366,15 +505,15 @@ class LabelImg:
             for code in props.keys():
                 for prop_dict in props[code]['measurements']:
                     reg_prop = RegionProperty.from_dict(prop_dict)
-                    self.set_region_prop(reg_prop.label, reg_prop)
-            self._dirty_flag = False
+                    self._region_props.setdefault(reg_prop.label, dict())[reg_prop.info.key] = reg_prop
+                    self._prop_list.append(reg_prop)
 
     def rotate(self, ccw: bool):
         unload = self._label_img is not None
         if self._label_img is None:
             self.reload()
         self._label_img = ndimage.rotate(self._label_img, 90 if ccw else -90, order=0, prefilter=False)
-        self._dirty_flag = True
+        self._mark_dirty()
         if unload:
             self.unload()
 
@@ -393,7 +532,7 @@ class LabelImg:
         self.size = sz
         im = im.resize(sz, resample=Image.NEAREST)
         self._label_img = np.asarray(im, dtype=np.uint32)
-        self._dirty_flag = True
+        self._mark_dirty()
         if unload:
             self.unload()
 
@@ -404,5 +543,7 @@ class LabelImg:
         return level_img == label
 
     @property
-    def has_unsaved_changed(self) -> bool:
+    def has_unsaved_changes(self) -> bool:
         return self._dirty_flag
+
+    has_unsaved_changed = has_unsaved_changes  # the former name
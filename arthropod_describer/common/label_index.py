@@ -0,0 +1,132 @@
+import json
+import logging
+import typing
+from pathlib import Path
+
+import numpy as np
+from scipy import ndimage
+
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.utils import atomic_write_path
+
+logger = logging.getLogger("model.label_index")
+
+
+BBox = typing.Tuple[int, int, int, int]  # top, left, bottom, right, all inclusive
+
+
+def _union_bbox(bbox1: typing.Optional[BBox], bbox2: BBox) -> BBox:
+    if bbox1 is None:
+        return bbox2
+    return min(bbox1[0], bbox2[0]), min(bbox1[1], bbox2[1]), max(bbox1[2], bbox2[2]), max(bbox1[3], bbox2[3])
+
+
+class LabelIndex:
+    """Pixel count and bounding box of every label value present in a label image.
+
+    The index is built with one pass over the label image and then kept up to date with `apply_change`, which costs
+    time proportional to the number of changed pixels. After incremental updates, bounding boxes of labels that lost
+    pixels may be larger than necessary, they are exact again after `build`.
+    """
+    VERSION: int = 1
+
+    def __init__(self, shape: typing.Tuple[int, int]):
+        self.shape = shape
+        self.counts: typing.Dict[int, int] = {}
+        self.bboxes: typing.Dict[int, BBox] = {}
+
+    @classmethod
+    def build(cls, label_img: np.ndarray) -> 'LabelIndex':
+        index = LabelIndex(label_img.shape)
+        labels, inverse, counts = np.unique(label_img, return_inverse=True, return_counts=True)
+        slices = ndimage.find_objects(inverse.reshape(label_img.shape) + 1)
+        for label, count, slc in zip(labels.tolist(), counts.tolist(), slices):
+            index.counts[label] = count
+            index.bboxes[label] = (slc[0].start, slc[1].start, slc[0].stop - 1, slc[1].stop - 1)
+        return index
+
+    @property
+    def labels(self) -> typing.Set[int]:
+        return set(self.counts.keys())
+
+    @property
+    def has_foreground(self) -> bool:
+        return any(label != 0 for label in self.counts.keys())
+
+    def apply_change(self, coords: typing.Tuple[np.ndarray, np.ndarray], old_values: np.ndarray,
+                     new_values: np.ndarray):
+        """Updates the index after the pixels at `coords` changed from `old_values` to `new_values`. Every pixel must
+        be present in `coords` only once."""
+        rows, cols = np.asarray(coords[0]), np.asarray(coords[1])
+        if len(rows) == 0:
+            return
+        old_labels, old_counts = np.unique(old_values, return_counts=True)
+        for label, count in zip(old_labels.tolist(), old_counts.tolist()):
+            if (remaining := self.counts.get(label, 0) - count) > 0:
+                self.counts[label] = remaining
+            else:
+                self.counts.pop(label, None)
+                self.bboxes.pop(label, None)
+        new_values = np.asarray(new_values)
+        for label in np.unique(new_values).tolist():
+            sel = new_values == label
+            rr, cc = rows[sel], cols[sel]
+            self.counts[label] = self.counts.get(label, 0) + len(rr)
+            self.bboxes[label] = _union_bbox(self.bboxes.get(label),
+                                             (int(rr.min()), int(cc.min()), int(rr.max()), int(cc.max())))
+
+    def region(self, label: int, label_hierarchy: LabelHierarchy) -> typing.Tuple[int, typing.Optional[BBox]]:
+        """Returns the pixel count and the bounding box of the region `label`, i.e. of all pixels whose value is `label`
+        or a descendant of `label` in `label_hierarchy`."""
+        level_mask = label_hierarchy.level_mask(label_hierarchy.get_level(label))
+        count, bbox = 0, None
+        for raw_label, raw_count in self.counts.items():
+            if raw_label & level_mask == label:
+                count += raw_count
+                bbox = _union_bbox(bbox, self.bboxes[raw_label])
+        return count, bbox
+
+    def regions_on_level(self, level: int, label_hierarchy: LabelHierarchy) -> typing.Set[int]:
+        """Returns the labels of `level` that have at least one pixel."""
+        level_mask = label_hierarchy.level_mask(level)
+        return {raw_label & level_mask for raw_label in self.counts.keys()} - {0}
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            'version': self.VERSION,
+            'shape': list(self.shape),
+            'labels': {str(label): {'count': count, 'bbox': list(self.bboxes[label])}
+                       for label, count in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, index_dict: typing.Dict[str, typing.Any]) -> 'LabelIndex':
+        index = LabelIndex(tuple(index_dict['shape']))
+        for label, info in index_dict['labels'].items():
+            index.counts[int(label)] = info['count']
+            index.bboxes[int(label)] = tuple(info['bbox'])
+        return index
+
+    def save(self, path: Path, source_stamp: int):
+        """Saves the index to `path`, `source_stamp` identifies the state of the label image the index describes."""
+        index_dict = self.to_dict()
+        index_dict['source_stamp'] = source_stamp
+        with atomic_write_path(path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump(index_dict, f)
+
+    @classmethod
+    def load(cls, path: Path, source_stamp: int) -> typing.Optional['LabelIndex']:
+        """Loads the index from `path`, returns None if there is none or if it was saved for a different
+        `source_stamp`, e.g. because the label image was modified by another program."""
+        if not path.exists():
+            return None
+        try:
+            with open(path) as f:
+                index_dict = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'could not read the label index {path}: {e}')
+            return None
+        if index_dict.get('version') != cls.VERSION or index_dict.get('source_stamp') != source_stamp:
+            return None
+        return cls.from_dict(index_dict)
@@ -0,0 +1,322 @@
+import abc
+import json
+import logging
+import os
+import typing
+import zlib
+from pathlib import Path
+
+import numpy as np
+from skimage import io
+
+try:
+    import imagecodecs
+except ImportError:
+    imagecodecs = None
+
+from arthropod_describer.common.utils import atomic_write_path
+
+logger = logging.getLogger("model.label_storage")
+
+
+class LabelStorageBackend(abc.ABC):
+    """Reads and writes the pixel data of one label image.
+
+    `path` is the logical path of the label image, i.e. `<project>/<label name>/<photo name>.tif`, backends derive
+    the actual file names from it.
+    """
+    FORMAT: str = ''
+    PARTIAL_READS: bool = False  # whether `read_region` is cheaper than reading the whole label image
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @property
+    @abc.abstractmethod
+    def files(self) -> typing.List[Path]:
+        """Paths of all the files this backend stores the label image in."""
+        pass
+
+    def exists(self) -> bool:
+        return all(p.exists() for p in self.files)
+
+    @abc.abstractmethod
+    def _read(self) -> np.ndarray:
+        pass
+
+    @abc.abstractmethod
+    def save(self, label_img: np.ndarray) -> np.ndarray:
+        """Persists `label_img` and returns the array the `LabelImg` should work with from now on."""
+        pass
+
+    def mark_dirty(self, coords: typing.Optional[typing.Tuple[np.ndarray, np.ndarray]] = None):
+        """Records that the pixels at `coords` changed, None means the whole image. Backends that can save
+        a part of the image use this to limit what `save` writes."""
+        pass
+
+    def read_region(self, top: int, left: int, bottom: int, right: int) -> typing.Optional[np.ndarray]:
+        """Returns the stored pixels in rows `top`..`bottom` and columns `left`..`right` (inclusive) or None if
+        there is no stored label image."""
+        if (label_img := self.load()) is None:
+            return None
+        return np.array(label_img[top:bottom + 1, left:right + 1])
+
+    def load(self) -> typing.Optional[np.ndarray]:
+        """Returns the stored label image or None if there is none. A label image stored in another format is
+        migrated to this one."""
+        if self.exists():
+            return self._read()
+        for backend_cls in BACKENDS.values():
+            if backend_cls is type(self):
+                continue
+            other = backend_cls(self.path)
+            if not other.exists():
+                continue
+            logger.info(f'migrating {self.path} from the format {other.FORMAT} to {self.FORMAT}')
+            label_img = self.save(other._read().astype(np.uint32))
+            other.delete()
+            return label_img
+        return None
+
+    def delete(self):
+        for path in self.files:
+            if path.exists():
+                os.remove(path)
+
+    @property
+    def disk_usage(self) -> int:
+        return sum(p.stat().st_size for p in self.files if p.exists())
+
+    @property
+    def stamp(self) -> int:
+        """A value that changes whenever the stored label image changes."""
+        return max((p.stat().st_mtime_ns for p in self.files if p.exists()), default=0)
+
+
+class TiffLabelBackend(LabelStorageBackend):
+    """The label image is stored as a single TIFF file, it is decoded as a whole and rewritten as a whole on save."""
+    FORMAT = 'tif'
+
+    @property
+    def files(self) -> typing.List[Path]:
+        return [self.path]
+
+    def _read(self) -> np.ndarray:
+        return io.imread(str(self.path))
+
+    def save(self, label_img: np.ndarray) -> np.ndarray:
+        with atomic_write_path(self.path) as tmp_path:
+            io.imsave(str(tmp_path), np.asarray(label_img), check_contrast=False)
+        return label_img
+
+
+class NpyLabelBackend(LabelStorageBackend):
+    """The label image is stored as a raw `.npy` file which is memory-mapped copy-on-write.
+
+    Opening a label image does not read any pixels and edits stay in memory until `save`, which writes back only the
+    rows recorded by `mark_dirty`, so unsaved edits are discarded like with the other formats.
+    """
+    FORMAT = 'npy'
+    PARTIAL_READS = True
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._dirty_rows: typing.Optional[typing.Set[int]] = None  # None = all rows are dirty
+
+    @property
+    def npy_path(self) -> Path:
+        return self.path.with_suffix('.npy')
+
+    @property
+    def files(self) -> typing.List[Path]:
+        return [self.npy_path]
+
+    def _read(self) -> np.ndarray:
+        self._dirty_rows = set()
+        return np.load(str(self.npy_path), mmap_mode='c')
+
+    def mark_dirty(self, coords: typing.Optional[typing.Tuple[np.ndarray, np.ndarray]] = None):
+        if coords is None:
+            self._dirty_rows = None
+        elif self._dirty_rows is not None:
+            self._dirty_rows.update(np.unique(np.asarray(coords[0])).tolist())
+
+    def save(self, label_img: np.ndarray) -> np.ndarray:
+        if self.exists():
+            stored = np.load(str(self.npy_path), mmap_mode='r+')
+            if stored.shape == label_img.shape and stored.dtype == label_img.dtype:
+                if isinstance(label_img, np.memmap) and label_img.filename == os.path.abspath(self.npy_path) and \
+                        self._dirty_rows is not None:
+                    rows = np.array(sorted(self._dirty_rows), dtype=np.int64)
+                    stored[rows] = label_img[rows]
+                else:
+                    stored[...] = label_img
+                stored.flush()
+                del stored
+                self._dirty_rows = set()
+                return label_img
+            del stored  # the shape changed (rotation, resizing), the file has to be replaced
+        with atomic_write_path(self.npy_path) as tmp_path:
+            np.save(tmp_path, np.asarray(label_img, dtype=np.uint32))
+        return self._read()
+
+
+def _encode_tile(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return imagecodecs.zstd_encode(data)
+    return zlib.compress(data, 6)
+
+
+def _decode_tile(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if imagecodecs is None:
+            raise RuntimeError('The label image is compressed with zstd, install the `imagecodecs` package to read it.')
+        return imagecodecs.zstd_decode(data)
+    return zlib.decompress(data)
+
+
+class TiledLabelBackend(LabelStorageBackend):
+    """The label image is split into `TILE_SIZE` x `TILE_SIZE` tiles, each compressed on its own (zstd if `imagecodecs`
+    is available, zlib otherwise) and stored in `<name>.tiles/`. Tiles with only zeros are not stored at all.
+
+    The backend remembers which tiles were touched since the last load or save (`mark_dirty`), `save` re-encodes
+    only those and `read_region` decodes only the tiles overlapping the region.
+    """
+    FORMAT = 'tiles'
+    PARTIAL_READS = True
+    TILE_SIZE: int = 256
+
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self._meta: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self._dirty_tiles: typing.Optional[typing.Set[typing.Tuple[int, int]]] = None  # None = all tiles are dirty
+        self.codec: str = 'zstd' if imagecodecs is not None else 'zlib'
+
+    @property
+    def folder(self) -> Path:
+        return self.path.with_suffix('.tiles')
+
+    @property
+    def meta_path(self) -> Path:
+        return self.folder / 'meta.json'
+
+    def _tile_path(self, tile: typing.Tuple[int, int]) -> Path:
+        return self.folder / f'{tile[0]}_{tile[1]}.tile'
+
+    @property
+    def files(self) -> typing.List[Path]:
+        if not self.folder.exists():
+            return [self.meta_path]
+        return [self.meta_path] + sorted(self.folder.glob('*.tile'))
+
+    def exists(self) -> bool:
+        return self.meta_path.exists()
+
+    @property
+    def stamp(self) -> int:
+        # removing an all-zero tile changes only the modification time of the folder
+        return max(super().stamp, self.folder.stat().st_mtime_ns if self.folder.exists() else 0)
+
+    def delete(self):
+        super().delete()
+        if self.folder.exists():
+            os.rmdir(self.folder)
+
+    def _load_meta(self) -> typing.Dict[str, typing.Any]:
+        if self._meta is None:
+            with open(self.meta_path) as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    def _tile_grid(self, shape: typing.Tuple[int, ...]) -> typing.Tuple[int, int]:
+        return (shape[0] + self.TILE_SIZE - 1) // self.TILE_SIZE, (shape[1] + self.TILE_SIZE - 1) // self.TILE_SIZE
+
+    def _read_tile(self, tile: typing.Tuple[int, int], out: np.ndarray):
+        """Decodes `tile` into `out`, which has the shape of the tile. Missing tiles are left untouched (zeros)."""
+        if not (tile_path := self._tile_path(tile)).exists():
+            return
+        with open(tile_path, 'rb') as f:
+            data = _decode_tile(f.read(), self._meta['codec'])
+        out[...] = np.frombuffer(data, dtype=self._meta['dtype']).reshape(out.shape)
+
+    def _read_into(self, out: np.ndarray, top: int, left: int, bottom: int, right: int):
+        ts = self.TILE_SIZE
+        for ty in range(top // ts, bottom // ts + 1):
+            for tx in range(left // ts, right // ts + 1):
+                t_top, t_left = ty * ts, tx * ts
+                t_bottom, t_right = min(t_top + ts, self._meta['shape'][0]), min(t_left + ts, self._meta['shape'][1])
+                tile = np.zeros((t_bottom - t_top, t_right - t_left), dtype=self._meta['dtype'])
+                self._read_tile((ty, tx), tile)
+                r0, c0 = max(top, t_top), max(left, t_left)
+                r1, c1 = min(bottom + 1, t_bottom), min(right + 1, t_right)
+                out[r0 - top:r1 - top, c0 - left:c1 - left] = tile[r0 - t_top:r1 - t_top, c0 - t_left:c1 - t_left]
+
+    def _read(self) -> np.ndarray:
+        self._meta = None
+        meta = self._load_meta()
+        label_img = np.zeros(meta['shape'], dtype=meta['dtype'])
+        self._read_into(label_img, 0, 0, meta['shape'][0] - 1, meta['shape'][1] - 1)
+        self._dirty_tiles = set()
+        return label_img
+
+    def read_region(self, top: int, left: int, bottom: int, right: int) -> typing.Optional[np.ndarray]:
+        if not self.exists():
+            return super().read_region(top, left, bottom, right)
+        meta = self._load_meta()
+        bottom, right = min(bottom, meta['shape'][0] - 1), min(right, meta['shape'][1] - 1)
+        region = np.zeros((bottom - top + 1, right - left + 1), dtype=meta['dtype'])
+        self._read_into(region, top, left, bottom, right)
+        return region
+
+    def mark_dirty(self, coords: typing.Optional[typing.Tuple[np.ndarray, np.ndarray]] = None):
+        if coords is None:
+            self._dirty_tiles = None
+        elif self._dirty_tiles is not None:
+            rows, cols = np.asarray(coords[0]) // self.TILE_SIZE, np.asarray(coords[1]) // self.TILE_SIZE
+            self._dirty_tiles.update(zip(rows.tolist(), cols.tolist()))
+
+    def save(self, label_img: np.ndarray) -> np.ndarray:
+        meta = {'shape': list(label_img.shape), 'dtype': str(label_img.dtype), 'tile_size': self.TILE_SIZE,
+                'codec': self.codec}
+        if not self.exists() or self._load_meta() != meta:
+            self._dirty_tiles = None  # new store, different shape (rotation, resizing) or codec
+        self.folder.mkdir(exist_ok=True)
+        ts = self.TILE_SIZE
+        grid = self._tile_grid(label_img.shape)
+        tiles = [(ty, tx) for ty in range(grid[0]) for tx in range(grid[1])] if self._dirty_tiles is None \
+            else sorted(self._dirty_tiles)
+        if self._dirty_tiles is None:
+            for stale in self.folder.glob('*.tile'):  # tiles outside of the new grid
+                ty, tx = map(int, stale.stem.split('_'))
+                if ty >= grid[0] or tx >= grid[1]:
+                    os.remove(stale)
+        for tile in tiles:
+            tile_data = label_img[tile[0] * ts:(tile[0] + 1) * ts, tile[1] * ts:(tile[1] + 1) * ts]
+            tile_path = self._tile_path(tile)
+            if not np.any(tile_data):
+                if tile_path.exists():
+                    os.remove(tile_path)
+                continue
+            with atomic_write_path(tile_path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.write(_encode_tile(np.ascontiguousarray(tile_data).tobytes(), self.codec))
+        if self._meta != meta:
+            with atomic_write_path(self.meta_path) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    json.dump(meta, f, indent=2)
+            self._meta = meta
+        self._dirty_tiles = set()
+        return label_img
+
+
+BACKENDS: typing.Dict[str, typing.Type[LabelStorageBackend]] = {
+    TiffLabelBackend.FORMAT: TiffLabelBackend,
+    NpyLabelBackend.FORMAT: NpyLabelBackend,
+    TiledLabelBackend.FORMAT: TiledLabelBackend,
+}
+
+
+def make_backend(path: Path, storage_format: str) -> LabelStorageBackend:
+    if storage_format not in BACKENDS:
+        raise ValueError(f'Unknown label storage format {storage_format}, available formats: {list(BACKENDS.keys())}')
+    return BACKENDS[storage_format](path)
@@ -114,4 +114,5 @@ class LabelTreeModel(QAbstractItemModel):
         index = self.find_index(label)
         lab_node: Node = index.internalPointer()
         lab_node.color = color.toTuple()[:3]
+        self.state.label_hierarchy.mark_modified()
         self.dataChanged.emit(index, index, Qt.DecorationRole)
@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 from typing import Dict
 
@@ -5,22 +6,43 @@ import typing
 
 import cv2
 import numpy as np
+import qimage2ndarray
 from PIL import Image
 from PySide2.QtGui import QImage
 from skimage import io
 
+from arthropod_describer.common.change_journal import ChangeJournal
 from arthropod_describer.common.label_image import LabelImgInfo, LabelImg
 from arthropod_describer.common.photo import Photo, Subscriber, UpdateContext
+from arthropod_describer.common.residency_manager import ResidencyManager
 from arthropod_describer.common.units import Value
-from arthropod_describer.common.utils import ScaleSetting
+from arthropod_describer.common.utils import ScaleSetting, atomic_write_path
+
+
+class _ApprovalDict(dict):
+    """`dict` that calls `on_change` whenever an approval is set."""
+    def __init__(self, approvals: Dict[str, typing.Optional[str]], on_change: typing.Callable[[], None]):
+        super().__init__(approvals)
+        self._on_change = on_change
+
+    def __setitem__(self, label_name: str, approval: typing.Optional[str]):
+        super().__setitem__(label_name, approval)
+        self._on_change()
 
 
 class LocalPhoto(Photo):
 
-    def __init__(self, folder: Path, img_name: str, lbl_image_info: Dict[str, LabelImgInfo], subs: Subscriber):
+    def __init__(self, folder: Path, img_name: str, lbl_image_info: Dict[str, LabelImgInfo], subs: Subscriber,
+                 image_size: typing.Optional[typing.Tuple[int, int]] = None, image_format: typing.Optional[str] = None,
+                 journal: typing.Optional[ChangeJournal] = None,
+                 residency_manager: typing.Optional[ResidencyManager] = None):
+        self._journal: typing.Optional[ChangeJournal] = journal
+        self._residency_manager: typing.Optional[ResidencyManager] = residency_manager
         self._tags: typing.Set[str] = set()
         self._dirty_flag: bool = False
         self._image: typing.Optional[np.ndarray] = None
+        self._qimage: typing.Optional[QImage] = None  # `self._image` converted for displaying
+        self._image_lock = threading.RLock()  # the image can be decoded by a prefetching thread
         self._image_path = folder / img_name
         self._bug_bbox: typing.Optional[typing.Tuple[int, int, int, int]] = None
 
@@ -31,11 +53,18 @@ class LocalPhoto(Photo):
         self._scale: typing.Optional[Value] = None
         self._scale_setting: typing.Optional[ScaleSetting] = ScaleSetting()
 
-        self._lab_approvals: Dict[str, typing.Optional[str]] = {lbl_name: None for lbl_name in lbl_image_info.keys()}
-        with Image.open(self._image_path) as im:
-            self._image_size = im.size
+        self._lab_approvals: Dict[str, typing.Optional[str]] = _ApprovalDict({lbl_name: None for lbl_name in lbl_image_info.keys()},
+                                                                             self._mark_changed)
+        if image_size is not None and image_format is not None:
+            # size and format are known from the project manifest, no need to touch the file
+            self._image_size = image_size
             self._np_size = self._image_size[::-1]
-            self.format = im.format
+            self.format = image_format
+        else:
+            with Image.open(self._image_path) as im:
+                self._image_size = im.size
+                self._np_size = self._image_size[::-1]
+                self.format = im.format
 
         # create the label images
         for lbl_name in self._label_image_info.keys():
@@ -46,14 +75,37 @@ class LocalPhoto(Photo):
 
     @property
     def image(self) -> np.ndarray:
-        if self._image is None:
-            #self._image = io.imread(str(self._image_path))
-            with Image.open(self._image_path) as im:
-                self._image = np.asarray(im)
-                # This is a workaround around RGBA images
-                if self._image.shape[2] > 3:
-                    self._image = self._image[:, :, :3]
-        return self._image
+        with self._image_lock:
+            hit = self._image is not None
+            if self._image is None:
+                #self._image = io.imread(str(self._image_path))
+                with Image.open(self._image_path) as im:
+                    self._image = np.asarray(im)
+                    # This is a workaround around RGBA images
+                    if self._image.shape[2] > 3:
+                        self._image = self._image[:, :, :3]
+            image = self._image
+            if self._residency_manager is not None:
+                self._residency_manager.access(self, self._resident_nbytes(), hit)
+        return image
+
+    @property
+    def qimage(self) -> QImage:
+        with self._image_lock:
+            image = self.image
+            if self._qimage is None:
+                self._qimage = qimage2ndarray.array2qimage(image)
+                if self._residency_manager is not None:
+                    self._residency_manager.access(self, self._resident_nbytes())
+            return self._qimage
+
+    @property
+    def decoded_data_lock(self) -> threading.RLock:
+        return self._image_lock
+
+    def _resident_nbytes(self) -> int:
+        nbytes = self._image.nbytes if self._image is not None else 0
+        return nbytes + (self._qimage.sizeInBytes() if self._qimage is not None else 0)
 
     @property
     def image_name(self) -> str:
@@ -77,6 +129,8 @@ class LocalPhoto(Photo):
             self._label_images[lab_name] = LabelImg.create2(self._image_path.parent.parent / lab_name / lab_fname,
                                                             self.image_size, label_info=self.label_image_info[lab_name],
                                                             label_name=lab_name)
+            self._label_images[lab_name].on_modified = self._handle_label_image_modified
+            self._label_images[lab_name].residency_manager = self._residency_manager
         lab = self._label_images[lab_name]
         return lab
 
@@ -110,6 +164,7 @@ class LocalPhoto(Photo):
     @image_scale.setter
     def image_scale(self, scale: typing.Optional[Value]):
         self._scale_setting.scale = scale
+        self._mark_changed()
 
     @property
     def scale_setting(self) -> typing.Optional[ScaleSetting]:
@@ -118,6 +173,7 @@ class LocalPhoto(Photo):
     @scale_setting.setter
     def scale_setting(self, setting: typing.Optional[ScaleSetting]):
         self._scale_setting = setting
+        self._mark_changed()
         self._subscriber.notify(self.image_name, UpdateContext.Photo, {'type': 'image_scale'})
 
     @property
@@ -133,6 +189,7 @@ class LocalPhoto(Photo):
             self.scale_setting.scale_line.rotate(ccw, mid)
         self._image = cv2.rotate(self._image, cv2.ROTATE_90_COUNTERCLOCKWISE if ccw else cv2.ROTATE_90_CLOCKWISE) #skimage.transform.rotate(self._image, 90 * (-1 if ccw else 1), order=2)
         self._image = np.ascontiguousarray(self._image, dtype=self._image.dtype)
+        self._qimage = None
         self._dirty_flag = True
         self._np_size = self._image.shape[:2]
         self._image_size = self._np_size[::-1]
@@ -142,6 +199,7 @@ class LocalPhoto(Photo):
             self.save()
             self._image = None
         self.save()
+        self._mark_changed()
         self.__subscriber.notify(self.image_name, UpdateContext.Photo, {'operation':
                                                                             'rot_90_ccw' if ccw else 'rot_90_cw'})
 
@@ -164,6 +222,7 @@ class LocalPhoto(Photo):
         self._np_size = self._image_size[::-1]
         im = im.resize(self._image_size, resample=2)
         self._image = np.asarray(im)
+        self._qimage = None
         for lbl_img in self._label_images.values():
             lbl_img.resize(factor)
         if not loaded:
@@ -173,6 +232,7 @@ class LocalPhoto(Photo):
             mid = (round(self.image_size[0] * 0.5), round(self.image_size[1] * 0.5))
             self.scale_setting.scale_line.scale(factor, (0, 0))
 
+        self._mark_changed()
         self.__subscriber.notify(self.image_name, UpdateContext.Photo,
                                  {'operation': 'resize',
                                   'factor': factor})
@@ -183,26 +243,41 @@ class LocalPhoto(Photo):
                 if self._image is not None:
                     #im = Image.fromarray(self._image)
                     #im.save(self._image_path)
-                    if self.format != 'TIFF':
-                        bgr = cv2.cvtColor(self._image, cv2.COLOR_BGR2RGB)
-                        cv2.imwrite(str(self._image_path), bgr)
-                    else:
-                        im = Image.fromarray(self._image)
-                        im.save(self._image_path)
+                    with atomic_write_path(self._image_path) as tmp_path:
+                        if self.format != 'TIFF':
+                            bgr = cv2.cvtColor(self._image, cv2.COLOR_BGR2RGB)
+                            cv2.imwrite(str(tmp_path), bgr)
+                        else:
+                            im = Image.fromarray(self._image)
+                            im.save(tmp_path, format='TIFF')
             for lab_img in self._label_images.values():
                 lab_img.save()
         self._dirty_flag = False
 
     def unload(self):
         self.save()
-        self._image = None
+        self.drop_decoded_data()
 
         for lab_img in self._label_images.values():
             lab_img.unload()
 
+    def drop_decoded_data(self):
+        self._image = None
+        self._qimage = None
+        if self._residency_manager is not None:
+            self._residency_manager.release(self)
+
     def has_segmentation_for(self, label_name: str) -> bool:
         return self._label_images[label_name].is_segmented
 
+    def _mark_changed(self):
+        if self._journal is not None:
+            self._journal.photo_changed(self)
+
+    def _handle_label_image_modified(self, label_img: LabelImg):
+        if self._journal is not None:
+            self._journal.label_image_changed(self, label_img.label_semantic)
+
     @property
     def has_unsaved_changes(self) -> bool:
         return self._dirty_flag or any([lab.has_unsaved_changed for lab in self._label_images.values()])
@@ -217,17 +292,20 @@ class LocalPhoto(Photo):
 
     @tags.setter
     def tags(self, _tags: typing.Set[str]):
+        old_tags = self._tags
         self._tags = {tag for tag in _tags if not tag.isspace() and len(tag) > 0}
+        self._mark_changed()
         self._subscriber.notify(self.image_name, UpdateContext.Photo,
                                 {'tags': {
-                                    'added': list(self._tags),
-                                    'removed': []
+                                    'added': list(self._tags - old_tags),
+                                    'removed': list(old_tags - self._tags)
                                 }})
 
     def add_tag(self, tag: str):
         if tag in self._tags or len(tag) == 0 or tag.isspace():
             return
         self._tags.add(tag)
+        self._mark_changed()
         self._subscriber.notify(self.image_name, UpdateContext.Photo,
                                 {'tags': {
                                     'added': [tag],
@@ -239,12 +317,20 @@ class LocalPhoto(Photo):
             return
 
         self._tags.remove(tag)
+        self._mark_changed()
         self._subscriber.notify(self.image_name, UpdateContext.Photo,
                                 {'tags': {
                                     'added': [],
                                     'removed': [tag]
                                 }})
 
+    def restore_state(self, tags: typing.Set[str], approvals: Dict[str, typing.Optional[str]],
+                      scale_setting: typing.Optional[ScaleSetting]):
+        """Sets the persisted tags, approvals and scale setting without notifying the subscriber or the journal."""
+        self._tags = {tag for tag in tags if not tag.isspace() and len(tag) > 0}
+        dict.update(self._lab_approvals, approvals)
+        self._scale_setting = scale_setting
+
     def toggle_tag(self, tag: str, enabled: bool):
         if enabled:
             self.add_tag(tag)
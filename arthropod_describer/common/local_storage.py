@@ -1,12 +1,11 @@
 import abc
-import collections
 import functools
 import json
 import logging
 import os
 import re
 from pathlib import Path
-from typing import List, Dict, Optional, Any, Union, Set
+from typing import List, Dict, Optional, Union, Set
 
 import cv2 as cv
 import numpy as np
@@ -16,13 +15,19 @@ from PySide2.QtCore import QObject
 from PySide2.QtGui import QImage
 from PySide2.QtWidgets import QMessageBox, QWidget
 
+from arthropod_describer.common.change_journal import ChangeJournal
+from arthropod_describer.common.inverted_index import InvertedIndex
 from arthropod_describer.common.label_hierarchy import LabelHierarchy
 from arthropod_describer.common.label_image import LabelImgInfo, RegionProperty
+from arthropod_describer.common.label_storage import BACKENDS
 from arthropod_describer.common.local_photo import LocalPhoto
 from arthropod_describer.common.photo import Photo, Subscriber, UpdateContext
+from arthropod_describer.common.residency_manager import ResidencyManager, DEFAULT_MEMORY_BUDGET_MB
+from arthropod_describer.common.project_manifest import ProjectManifest, PhotoRecord, MANIFEST_FILENAME, \
+    record_from_legacy_dict
 from arthropod_describer.common.storage import IMAGE_REFEX, TIF_REGEX, Storage
 from arthropod_describer.common.units import Value, CompoundUnit, BaseUnit, SIPrefix, Unit
-from arthropod_describer.common.utils import ScaleSetting, ScaleLineInfo
+from arthropod_describer.common.utils import ScaleSetting, ScaleLineInfo, atomic_write_path
 
 logger = logging.getLogger("model.photo_loader")
 
@@ -53,7 +58,8 @@ def get_image_names(folder: Path, image_regex: re.Pattern=TIF_REGEX) -> List[str
 
 class LocalStorage(Storage):
     def __init__(self, folder: Path, lbl_images_info: Path,
-                 image_regex: re.Pattern=IMAGE_REFEX, scale: Optional[float] = None, parent: Optional[QObject] = None):
+                 image_regex: re.Pattern=IMAGE_REFEX, scale: Optional[float] = None, parent: Optional[QObject] = None,
+                 lazy: bool = True, memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB):
         super().__init__(parent)
         self._location = folder
         # if isinstance(lbl_images_info, Path):
@@ -73,73 +79,130 @@ class LocalStorage(Storage):
 
         self._label_hierarchy: Optional[LabelHierarchy] = None
 
-        self._images: List[Photo] = []
+        # In the lazy mode `LocalPhoto` objects are created on the first request in `get_photo_by_idx`, until then
+        # the photo is represented by its entry in `self.photo_info`.
+        self._lazy = lazy
+        self._images: List[Optional[LocalPhoto]] = [None for _ in self._image_names]
 
-        self._loaded_photo: Optional[LocalPhoto] = None #only for now
+        # decoded photos and label images are kept within `memory_budget_mb`
+        self._residency_manager: ResidencyManager = ResidencyManager(memory_budget_mb)
 
-        self._images = [self._load_photo(img_name) for img_name in self._image_names]
         self._image_paths = [self._image_folder / img_name for img_name in self._image_names]
 
-        self.photo_info: Dict[str, Any] = {}
+        self._journal: ChangeJournal = ChangeJournal()
 
         self._label_hierarchies: Dict[str, LabelHierarchy] = {}
         self._load_label_hierarchies()
         self._label_names: Set[str] = set(self._lbl_img_info.keys())
 
-        if not (path := self.location / 'photo_info.json').exists():
-            for img in self._images:
-                for lbl_name in self._lbl_img_info.keys():
-                    img.approved[lbl_name] = None
-                    img[lbl_name].is_segmented = False
-                img.image_scale = scale
-            self.save()
-
-        with open(self.location / 'photo_info.json') as f:
-            photo_info = json.load(f)
-
-        self._tag_useg_counter: collections.Counter = collections.Counter()
-
-        for img in self._images:
-            img.tags = set(photo_info[img.image_name].setdefault('tags', list()))
-            for lbl_name in self._label_names:
-                img.approved[lbl_name] = photo_info[img.image_name]['label_images_info'][lbl_name]['approved']
-                if 'segmented' not in photo_info[img.image_name]['label_images_info'][lbl_name]:
-                    _lab = img[lbl_name].label_image  # just to initialize LabelImg.is_segmented, see property label_image
-                else:
-                    img[lbl_name].is_segmented = photo_info[img.image_name]['label_images_info'][lbl_name]['segmented']
-                if (maybe_scale := photo_info[img.image_name]['scale']) is not None:
-                    img.image_scale = eval(maybe_scale)
-                else:
-                    img.image_scale = maybe_scale
-                scale_info = photo_info[img.image_name]['scale_info']
-                # img.scale_setting = ScaleSetting(reference_length=eval(scale_info['reference_length']),
-                #                                  scale=eval(scale_info['scale']),
-                #                                  scale_line=eval(scale_info['scale_line']))
-                img.scale_setting = ScaleSetting.from_dict(photo_info[img.image_name]['scale_info'])
+        self.photo_info: Dict[str, PhotoRecord] = {}
+        manifest_exists = (self.location / MANIFEST_FILENAME).exists()
+        self._manifest = ProjectManifest(self.location / MANIFEST_FILENAME)
+        if manifest_exists:
+            self.photo_info, self._manifest_rows = self._manifest.load_records()
+        else:
+            # project from an older version, import the per-photo info from `photo_info.json`
+            self._manifest_rows: Dict[str, typing.Tuple] = {}
+            if (path := self.location / 'photo_info.json').exists():
+                with open(path) as f:
+                    photo_info = json.load(f)
+                self.photo_info = {name: record_from_legacy_dict(name, info) for name, info in photo_info.items()}
+                logger.info(f'importing {path} into {self._manifest.path}')
+                self._manifest.write_records(self.photo_info.values(), self._manifest_rows)
+
+        new_records = []
+        for img_name in self._image_names:
+            if img_name not in self.photo_info:
+                self.photo_info[img_name] = self._default_record(img_name, scale)
+                new_records.append(self.photo_info[img_name])
+        self._manifest.write_records(new_records, self._manifest_rows)
+
+        # tag -> photos, maintained in `notify`
+        self._tag_index: InvertedIndex = InvertedIndex()
+        for img_name in self._image_names:
+            self._tag_index.set_keys(img_name, self.photo_info[img_name].tags)
+
+        # label image name -> (label -> photos), maintained through the change journal, see `_refresh_label_usage`
+        self._label_usage: Dict[str, InvertedIndex] = {label_name: InvertedIndex() for label_name in self._label_names}
+        for label_name, usage in self._manifest.load_label_usage().items():
+            if label_name not in self._label_usage:
+                continue
+            for img_name, labels in usage.items():
+                if img_name in self._image_names_indices:
+                    self._label_usage[label_name].set_keys(img_name, labels)
+
+        if not self._lazy:
+            for idx in range(len(self._image_names)):
+                self._materialize_photo(idx)
 
         self._properties: typing.Dict[str, typing.Dict[str, RegionProperty]]
 
+    def _default_record(self, img_name: str, scale: Optional[Value]) -> PhotoRecord:
+        return PhotoRecord(name=img_name,
+                           approved={lbl_name: None for lbl_name in self._lbl_img_info.keys()},
+                           segmented={lbl_name: False for lbl_name in self._lbl_img_info.keys()},
+                           scale_setting=ScaleSetting(scale=scale))
+
+    def _record_for(self, img: LocalPhoto) -> PhotoRecord:
+        return PhotoRecord(name=img.image_name,
+                           image_size=tuple(img.image_size),
+                           format=img.format,
+                           tags=set(img.tags),
+                           approved={lbl_name: img.approved[lbl_name] for lbl_name in self._label_names},
+                           segmented={lbl_name: img.has_segmentation_for(lbl_name) for lbl_name in self._label_names},
+                           scale_setting=img.scale_setting)
+
+    def _materialize_photo(self, idx: int) -> LocalPhoto:
+        """Creates the `LocalPhoto` for the image at `idx` and restores its state from `self.photo_info`."""
+        img_name = self._image_names[idx]
+        record = self.photo_info[img_name]
+        img = self._load_photo(img_name, record.image_size, record.format)
+        for lbl_name in self._label_names:
+            if record.segmented.get(lbl_name) is None:
+                _lab = img[lbl_name].label_image  # just to initialize LabelImg.is_segmented, see property label_image
+            else:
+                img[lbl_name].is_segmented = record.segmented[lbl_name]
+        img.restore_state(record.tags, {lbl_name: record.approved.get(lbl_name) for lbl_name in self._label_names},
+                          record.scale_setting)
+        self._images[idx] = img
+        return img
+
+    def export_photo_info(self, path: Optional[Path] = None):
+        """Writes the per-photo info in the JSON format of `photo_info.json`."""
+        self.save()
+        self._manifest.export_json(self.location / 'photo_info.json' if path is None else path)
+
     def _load_label_hierarchies(self):
         for label_name in self._lbl_img_info.keys():
             if (lab_hier_path := self._location / f'{label_name}_labels.json').exists():
                 self._label_hierarchies[label_name] = LabelHierarchy.load(lab_hier_path)
+                self._label_hierarchies[label_name].on_modified = functools.partial(self._journal.label_hierarchy_changed,
+                                                                                    label_name)
 
     def get_label_hierarchy2(self, label_name: str) -> Optional[LabelHierarchy]:
         return self._label_hierarchies.get(label_name, None)
 
     def set_label_hierarchy2(self, label_name: str, lab_hier: LabelHierarchy):
         self._label_hierarchies[label_name] = lab_hier
+        lab_hier.on_modified = functools.partial(self._journal.label_hierarchy_changed, label_name)
+        self._journal.label_hierarchy_changed(label_name)
 
-    def _load_photo(self, img_name: str) -> LocalPhoto:
-        return LocalPhoto(self._location / 'images', img_name, self._lbl_img_info, self) # TODO handle loading masks
+    def _load_photo(self, img_name: str, image_size: Optional[typing.Tuple[int, int]] = None,
+                    image_format: Optional[str] = None) -> LocalPhoto:
+        return LocalPhoto(self._location / 'images', img_name, self._lbl_img_info, self,
+                          image_size=tuple(image_size) if image_size is not None else None,
+                          image_format=image_format, journal=self._journal,
+                          residency_manager=self._residency_manager) # TODO handle loading masks
 
     @property
     def location(self) -> Path:
         return self._location
 
     @classmethod
-    def load_from(cls, folder: Path, image_regex: re.Pattern=IMAGE_REFEX) -> 'LocalStorage':
-        strg = LocalStorage(folder, lbl_images_info=folder / 'label_images_info.json', image_regex=image_regex)
+    def load_from(cls, folder: Path, image_regex: re.Pattern=IMAGE_REFEX, lazy: bool = True,
+                  memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB) -> 'LocalStorage':
+        strg = LocalStorage(folder, lbl_images_info=folder / 'label_images_info.json', image_regex=image_regex,
+                            lazy=lazy, memory_budget_mb=memory_budget_mb)
         return strg
 
     # TODO REMOVE
@@ -159,7 +222,8 @@ class LocalStorage(Storage):
         for label_name, label_info in lbl_imgs_info['label_images'].items():
             lbl_infos[label_name] = LabelImgInfo(label_name, is_default=label_name == lbl_imgs_info['default_label_image'],
                                                  always_constrain_to=label_info['always_constrain_to'],
-                                                 allow_constrain_to=label_info['allow_constrain_to'])
+                                                 allow_constrain_to=label_info['allow_constrain_to'],
+                                                 storage_format=label_info.get('storage_format', 'tif'))
         return lbl_imgs_info['default_label_image'], lbl_infos
 
     @property
@@ -169,16 +233,9 @@ class LocalStorage(Storage):
     def get_photo_by_idx(self, idx: int, load_image: bool=True) -> Photo:
         #assert 0 <= idx < len(self._image_names)
         photo = self._images[idx]
-        #if load_image and self._loaded_photo is not None and self._loaded_photo.image_name != photo.image_name:
-        #    self._loaded_photo.unload()
-        #    self._loaded_photo = None
-        #    self._loaded_photo = photo
-        #if load_image:
-        #    if self._loaded_photo is not None and self._loaded_photo._dirty_flag:
-        #        self._loaded_photo.save()
-        #        self._loaded_photo._image = None
-        #    photo._image = io.imread(str(photo.image_path)) #QImage(str(photo.image_path))
-        #    self._loaded_photo = photo
+        if photo is None:
+            photo = self._materialize_photo(idx)
+        # decoded images are unloaded by `self._residency_manager` once the memory budget is exceeded
         for label_name in self._lbl_img_info.keys():
             photo[label_name].label_hierarchy = self._label_hierarchies[label_name]
         return photo
@@ -199,13 +256,31 @@ class LocalStorage(Storage):
     def image_names(self) -> List[str]:
         return self._image_names
 
+    def index_of(self, img_name: str) -> typing.Optional[int]:
+        return self._image_names_indices.get(img_name)
+
     @property
     def images(self) -> List[Photo]:
-        return self._images
+        # materializes every photo, prefer `get_photo_by_idx` where possible
+        return [self.get_photo_by_idx(idx, load_image=False) for idx in range(self.image_count)]
 
     def reset_photo(self, photo: Photo):
         pass
 
+    @property
+    def residency_manager(self) -> ResidencyManager:
+        return self._residency_manager
+
+    def pin_photo(self, photo: Photo):
+        self._residency_manager.pin(photo)
+        for label_name in self._label_names:
+            self._residency_manager.pin(photo[label_name])
+
+    def unpin_photo(self, photo: Photo):
+        self._residency_manager.unpin(photo)
+        for label_name in self._label_names:
+            self._residency_manager.unpin(photo[label_name])
+
     @property
     def label_hierarchy(self) -> LabelHierarchy:
         return self._label_hierarchy
@@ -215,50 +290,47 @@ class LocalStorage(Storage):
         # TODO handle changes to the label image
         self._label_hierarchy = lab_hier
         for photo in self._images:
+            if photo is None:
+                continue
             #photo.regions_image.label_hierarchy = self._label_hierarchy
             for label_name, lab_img in photo.label_images_.items():
                 lab_img.label_hierarchy = lab_hier
 
     def is_approved(self, index: int) -> bool:
         lb_h = self.get_label_hierarchy2('Labels')
-        return self._images[index].approved['Labels'] == lb_h.mask_names[-1]
+        if (photo := self._images[index]) is not None:
+            return photo.approved['Labels'] == lb_h.mask_names[-1]
+        return self.photo_info[self._image_names[index]].approved.get('Labels') == lb_h.mask_names[-1]
+
+    def is_segmented(self, index: int, label_name: str) -> bool:
+        # answered from the manifest record unless the photo is already materialized or the record does not know
+        if self._images[index] is None and \
+                (segmented := self.photo_info[self._image_names[index]].segmented.get(label_name)) is not None:
+            return segmented
+        return super().is_segmented(index, label_name)
 
     def save(self) -> bool:
         #try:
-        for photo in self._images:
+        # only what registered itself in the change journal since the last save is written
+        changed_photos = self._journal.changed_photos
+        for photo in changed_photos:
             if photo.has_unsaved_changes:
                 photo.save()
-        if self._loaded_photo is not None:
-            self._loaded_photo.save()
-            for _, lbl_img in self._loaded_photo.label_images_.items():
-                lbl_img.save()
-        photo_info = {img.image_name: {
-            # 'px/mm': img.image_scale,
-            'scale': repr(img.image_scale),
-            'scale_info': {
-                'reference_length': repr(img.scale_setting.reference_length),
-                'scale': repr(img.scale_setting.scale),
-                'scale_line': repr(img.scale_setting.scale_line),
-                'scale_marker_bbox': repr(img.scale_setting.scale_marker_bbox)
-            },
-            'approved': {
-                lbl_name: img.approved[lbl_name] for lbl_name in self._label_names
-            },
-            'label_images_info': {lbl_name: {
-                'approved': img.approved[lbl_name],
-                'segmented': img.has_segmentation_for(lbl_name)
-            } for lbl_name in self._label_names},
-            'tags': list(img.tags)
-        } for img in self._images}
-        with open(self.location / 'photo_info.json', 'w') as f:
-            json.dump(photo_info, f, indent=2)
-
-        for label_name in self._label_names:
+        records = [self._record_for(img) for img in changed_photos]
+        for record in records:
+            self.photo_info[record.name] = record
+        # from the changed photos only the rows that differ from the stored ones are written
+        self._manifest.write_records(records, self._manifest_rows)
+        self._manifest.write_label_usage(self._refresh_label_usage())
+
+        for label_name in self._journal.changed_label_hierarchies:
             if label_name not in self._label_hierarchies:
                 continue
-            with open(self._location / f'{label_name}_labels.json', 'w') as f:
-                lab_hier: LabelHierarchy = self._label_hierarchies[label_name]
-                json.dump(lab_hier.to_dict(), f, indent=2)
+            with atomic_write_path(self._location / f'{label_name}_labels.json') as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    lab_hier: LabelHierarchy = self._label_hierarchies[label_name]
+                    json.dump(lab_hier.to_dict(), f, indent=2)
+        self._journal.clear()
 
         #except IOError as e:
         #    logger.error(e.strerror)
@@ -270,14 +342,13 @@ class LocalStorage(Storage):
         return True
 
     def include_photos(self, photo_names: List[str], scale: Optional[int]):
-        new_images = [self._load_photo(img_name) for img_name in photo_names]
         new_paths = [self._image_folder / img_name for img_name in photo_names]
 
-        for img in new_images:
-            for lbl_name in self._label_names:
-                img.approved[lbl_name] = None
-                img.image_scale = scale
-        self._images.extend(new_images)
+        for img_name in photo_names:
+            self.photo_info[img_name] = self._default_record(img_name, scale)
+            self._tag_index.set_keys(img_name, set())
+        self._manifest.write_records([self.photo_info[img_name] for img_name in photo_names], self._manifest_rows)
+        self._images.extend([None for _ in photo_names])
         self._image_paths.extend(new_paths)
         self._image_names.extend(photo_names)
         self._image_names_indices = {name: i for i, name in enumerate(self._image_names)}
@@ -300,11 +371,49 @@ class LocalStorage(Storage):
             photo = self.get_photo_by_idx(name_or_index)
         return photo.approved[label_name]
 
+    def _refresh_label_usage(self, label_name: Optional[str] = None) -> typing.List[typing.Tuple[str, str, Set[int]]]:
+        """Updates `self._label_usage` for the label images modified since the last save and returns the updated
+        entries as (image name, label name, used labels)."""
+        updated = []
+        for img_name, lbl_name in self._journal.changed_label_images:
+            if (label_name is not None and lbl_name != label_name) or img_name not in self._image_names_indices:
+                continue
+            if (photo := self._images[self._image_names_indices[img_name]]) is None:
+                continue
+            labels = photo[lbl_name].used_labels
+            self._label_usage.setdefault(lbl_name, InvertedIndex()).set_keys(img_name, labels)
+            updated.append((img_name, lbl_name, labels))
+        return updated
+
     def used_regions(self, label_name: str) -> Set[int]:
-        regions = set()
-        for photo in self._images:
-            regions = regions.union(photo[label_name].used_labels)
-        return regions
+        usage = self._label_usage.setdefault(label_name, InvertedIndex())
+        self._refresh_label_usage(label_name)
+        # photos whose label images were never indexed, e.g. in projects from older versions
+        new_entries = []
+        for img_name in self._image_names:
+            if img_name in usage:
+                continue
+            if self._images[self._image_names_indices[img_name]] is None and \
+                    self.photo_info[img_name].segmented.get(label_name) is False and \
+                    not self._label_image_stored(img_name, label_name):
+                labels = {0}
+            else:
+                labels = self.get_photo_by_name(img_name, load_image=False)[label_name].used_labels
+            usage.set_keys(img_name, labels)
+            new_entries.append((img_name, label_name, labels))
+        self._manifest.write_label_usage(new_entries)
+        return usage.keys
+
+    def _label_image_stored(self, img_name: str, label_name: str) -> bool:
+        """Returns whether there is a stored label image `label_name` for `img_name`, in any of the formats."""
+        image_path = Path(self._image_paths[self._image_names_indices[img_name]])
+        path = image_path.parent.parent / label_name / (image_path.name + '.tif')
+        return any(backend_cls(path).exists() for backend_cls in BACKENDS.values())
+
+    def photos_using_label(self, label_name: str, label: int) -> Set[str]:
+        """Returns the names of the photos whose label image `label_name` contains `label`."""
+        self.used_regions(label_name)
+        return self._label_usage[label_name].photos_with(label)
 
     @property
     def label_image_names(self) -> Set[str]:
@@ -322,12 +431,12 @@ class LocalStorage(Storage):
         if 'tags' in data:
             storage_update_data['tags'] = {}
             for tag in data['tags']['added']:
-                if tag not in self._tag_useg_counter:
+                if self._tag_index.count(tag) == 0:
                     storage_update_data['tags'].setdefault('new', set()).add(tag)
-                self._tag_useg_counter.update([tag])
+                self._tag_index.add_key(img_name, tag)
             for tag in data['tags']['removed']:
-                self._tag_useg_counter.subtract([tag])
-                if self._tag_useg_counter[tag] < 1:
+                self._tag_index.remove_key(img_name, tag)
+                if self._tag_index.count(tag) == 0:
                     storage_update_data['tags'].setdefault('deleted', set()).add(tag)
         self.update_photo.emit(img_name, ctx, data)
         self.storage_update.emit(storage_update_data)
@@ -340,6 +449,10 @@ class LocalStorage(Storage):
         self._images = [photo for i, photo in enumerate(self._images) if i != idx]
         self._image_paths = [path for i, path in enumerate(self._image_paths) if i != idx]
         self._image_names.remove(photo.image_name)
+        self.photo_info.pop(photo.image_name, None)
+        self._manifest_rows.pop(photo.image_name, None)
+        self._journal.discard_photo(photo.image_name)
+        self._manifest.delete_records([photo.image_name])
         # del self._image_names_indices[photo.image_name]
         self._image_names_indices = {name: i for i, name in enumerate(self._image_names)}
 
@@ -356,33 +469,43 @@ class LocalStorage(Storage):
             QMessageBox.critical(parent, "Failure", f'The file {photo.image_path} no longer exists!',
                                  QMessageBox.Ok, QMessageBox.Ok)
         photo_tags = list(photo.tags)
-        # Update the counts for individual tags, if a tag reaches the count 0, emit a signal
-        self._tag_useg_counter.subtract(photo_tags)
-        deleted_tags = [tag for tag in photo_tags if self._tag_useg_counter[tag] == 0]
+        # Update the tag index, if a tag is no longer used by any photo, emit a signal
+        self._tag_index.remove_photo(photo.image_name)
+        for usage in self._label_usage.values():
+            usage.remove_photo(photo.image_name)
+        deleted_tags = [tag for tag in photo_tags if self._tag_index.count(tag) == 0]
         self.storage_update.emit({'tags': {'deleted': deleted_tags}})
 
         for lbl_img in photo.label_images_.values():
-            if lbl_img.path.exists():
-                delete_file(lbl_img.path, parent)
+            lbl_img.drop_decoded_data()  # a memory-mapped file can not be deleted on Windows
+            for lbl_path in lbl_img.storage_files:
+                if lbl_path.exists():
+                    delete_file(lbl_path, parent)
+            try:
+                lbl_img.backend.delete()  # whatever is left, e.g. the folder of a tiled label image
+            except OSError as e:
+                logger.warning(f'could not remove the storage of {lbl_img.path}: {e}')
             if (meas_path := Path(f'{lbl_img.path}_measurements.json')).exists():
                 delete_file(meas_path, parent)
+            if lbl_img.index_path.exists():
+                delete_file(lbl_img.index_path, parent)
 
         return True
 
     @property
     def used_tags(self) -> typing.Set[str]:
-        tags: typing.Set[str] = set()
-        for photo in self._images:
-            tags = tags.union(photo.tags)
-        return tags
+        return self._tag_index.keys
+
+    def photo_names_with_tags(self, tags: typing.Set[str]) -> typing.Set[str]:
+        return self._tag_index.photos_with_all(tags)
+
+    @property
+    def tag_index_version(self) -> int:
+        return self._tag_index.version
 
     def photos_satisfying_tags(self, tags: typing.Set[str]) -> typing.List[Photo]:
-        tag_photos_map: typing.Dict[str, typing.Set[Photo]] = {}
-        for photo in self._images:
-            for tag in photo.tags:
-                tag_photos_map.setdefault(tag, set()).add(photo)
-        sat = functools.reduce(set.intersection, [tag_photos_map.setdefault(tag, set()) for tag in tags], set(self._images))
-        return list(sat)
+        sat = sorted(self._image_names_indices[img_name] for img_name in self._tag_index.photos_with_all(tags))
+        return [self.get_photo_by_idx(idx, load_image=False) for idx in sat]
 
     @property
     def properties(self) -> typing.Dict[str, typing.Dict[str, RegionProperty]]:
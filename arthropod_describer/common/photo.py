@@ -8,6 +8,7 @@ from typing import Dict, Optional
 import PySide2
 import cv2
 import numpy as np
+import qimage2ndarray
 from PIL import Image
 from PySide2.QtCore import QObject
 from PySide2.QtGui import QImage
@@ -59,6 +60,11 @@ class Photo(abc.ABC):
     def image(self) -> np.ndarray:
         pass
 
+    @property
+    def qimage(self) -> QImage:
+        """The photo converted to `QImage`, ready to be displayed."""
+        return qimage2ndarray.array2qimage(self.image)
+
     @property
     @abc.abstractmethod
     def image_size(self) -> typing.Tuple[int, int]:
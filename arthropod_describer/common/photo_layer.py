@@ -1,7 +1,6 @@
 from typing import Optional
 
 import PySide2
-import qimage2ndarray
 from PySide2.QtCore import QRectF, QRect, QPointF
 from PySide2.QtGui import QPixmap, QImage, Qt
 from PySide2.QtWidgets import QGraphicsPixmapItem
@@ -57,7 +56,7 @@ class PhotoLayer(Layer):
             self.setVisible(True)
             self.image_gpixmap.setVisible(True)
         # img = nd2qimage(photo.image)
-        img = qimage2ndarray.array2qimage(photo.image)
+        img = photo.qimage  # possibly already prepared by `PhotoPrefetcher`
         self._set_pixmaps(img,
                           self._image_pixmap,
                           self.image_gpixmap)
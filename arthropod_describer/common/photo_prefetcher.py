@@ -0,0 +1,63 @@
+import logging
+import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from arthropod_describer.common.label_image import LabelImg
+from arthropod_describer.common.photo import Photo
+
+logger = logging.getLogger("model.photo_prefetcher")
+
+
+DEFAULT_PREFETCH_RADIUS: int = 2
+
+
+def _decode(photo: Photo, label_imgs: typing.List[LabelImg]):
+    _ = photo.qimage  # decodes the image as well
+    for label_img in label_imgs:
+        _ = label_img.label_image
+
+
+class PhotoPrefetcher:
+    """Decodes photos, their label images and their `QImage`s in worker threads before they are needed.
+
+    `prefetch` is called from the GUI thread with the photos that are likely to be shown next, e.g. the neighbours
+    of the current photo in the image list. Tasks for photos that are no longer requested and have not started yet
+    are cancelled, so jumping through the list does not pile up work. The decoded data is kept by the photos
+    themselves, so it is subject to the memory budget of the storage's `ResidencyManager`.
+    """
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='photo_prefetch')
+        self._futures: typing.Dict[str, Future] = {}
+
+    def prefetch(self, photos: typing.List[Photo], label_names: typing.Iterable[str]):
+        """Schedules decoding of `photos`, ordered from the most to the least likely to be shown next.
+
+        Must be called from the GUI thread, the label images are created here as `Photo.__getitem__` is not
+        thread-safe."""
+        wanted = {photo.image_name for photo in photos}
+        for img_name, future in list(self._futures.items()):
+            if img_name not in wanted:
+                future.cancel()
+                del self._futures[img_name]
+        for photo in photos:
+            if photo.image_name in self._futures:
+                continue
+            label_imgs = [photo[label_name] for label_name in label_names]
+            self._futures[photo.image_name] = self._executor.submit(self._run, photo, label_imgs)
+
+    @staticmethod
+    def _run(photo: Photo, label_imgs: typing.List[LabelImg]):
+        try:
+            _decode(photo, label_imgs)
+        except Exception as e:  # the photo will be decoded again when it is shown, where the error is reported
+            logger.warning(f'prefetching {photo.image_name} failed: {e}')
+
+    def cancel(self):
+        """Cancels all tasks that have not started yet."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
@@ -4,6 +4,7 @@ import typing
 from typing import Optional, Set, List, Union
 
 from arthropod_describer.common.common import Info
+from arthropod_describer.common.intermediates import parse_requirements
 from arthropod_describer.common.label_image import RegionProperty, LabelImg
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.regions_cache import RegionsCache
@@ -42,6 +43,8 @@ class PropertyComputation:
         self._user_params = UserParam.load_params_from_doc_str(self.__doc__)
         self._region_restricted = self.__doc__ is not None and "REGION_RESTRICTED" in self.__doc__
         self._group = doc_dict['GROUP'] if 'GROUP' in doc_dict else 'General'
+        self._requires = parse_requirements(doc_dict['REQUIRES']) if 'REQUIRES' in doc_dict else []
+        self._version = doc_dict['VERSION'] if 'VERSION' in doc_dict else '1'
         self._px_unit: Unit = Unit(BaseUnit.px, prefix=SIPrefix.none, dim=1)
         self._no_unit: Unit = Unit(BaseUnit.none, prefix=SIPrefix.none, dim=0)
 
@@ -57,6 +60,18 @@ class PropertyComputation:
     def region_restricted(self) -> bool:
         return self._region_restricted
 
+    @property
+    def requires(self) -> List[str]:
+        """The intermediates, see `intermediates.INTERMEDIATES`, the computation takes from
+        `RegionsCache.intermediates`, declared by the `REQUIRES` key of the docstring."""
+        return self._requires
+
+    @property
+    def version(self) -> str:
+        """The `VERSION` key of the docstring, to be increased whenever the computed values change, so that results
+        cached in `ResultCache` are not reused."""
+        return self._version
+
     @property
     @abc.abstractmethod
     def computes(self) -> typing.Dict[str, Info]:
@@ -0,0 +1,247 @@
+import dataclasses
+import json
+import logging
+import sqlite3
+import typing
+from pathlib import Path
+
+from arthropod_describer.common.units import Value, Unit, BaseUnit, CompoundUnit, SIPrefix
+from arthropod_describer.common.utils import ScaleSetting, ScaleLineInfo
+
+logger = logging.getLogger("model.project_manifest")
+
+
+MANIFEST_FILENAME = 'project_manifest.sqlite'
+
+
+@dataclasses.dataclass
+class PhotoRecord:
+    """Persisted state of one photo of a project."""
+    name: str
+    image_size: typing.Optional[typing.Tuple[int, int]] = None  # (width, height)
+    format: typing.Optional[str] = None
+    tags: typing.Set[str] = dataclasses.field(default_factory=set)
+    approved: typing.Dict[str, typing.Optional[str]] = dataclasses.field(default_factory=dict)
+    segmented: typing.Dict[str, typing.Optional[bool]] = dataclasses.field(default_factory=dict)  # None = unknown
+    scale_setting: ScaleSetting = dataclasses.field(default_factory=ScaleSetting)
+
+
+def _unit_to_dict(unit: typing.Union[Unit, CompoundUnit]) -> typing.Dict[str, typing.Any]:
+    if isinstance(unit, CompoundUnit):
+        return {
+            'numerator': [_unit_to_dict(u) for u in unit.numerator],
+            'denominator': [_unit_to_dict(u) for u in unit.denominator]
+        }
+    return {'base_unit': int(unit.base_unit), 'prefix': int(unit.prefix), 'dim': unit.dim}
+
+
+def _unit_from_dict(unit_dict: typing.Dict[str, typing.Any]) -> typing.Union[Unit, CompoundUnit]:
+    if 'numerator' in unit_dict:
+        return CompoundUnit(numerator={_unit_from_dict(u) for u in unit_dict['numerator']},
+                            denominator={_unit_from_dict(u) for u in unit_dict['denominator']})
+    return Unit(BaseUnit(unit_dict['base_unit']), SIPrefix(unit_dict['prefix']), unit_dict['dim'])
+
+
+def _value_to_dict(value: typing.Optional[Value]) -> typing.Optional[typing.Dict[str, typing.Any]]:
+    if value is None:
+        return None
+    if not isinstance(value, Value):  # plain number, e.g. scale entered during import
+        return {'value': value}
+    val = value.value if isinstance(value.value, int) else float(value.value)
+    return {'value': val, 'unit': _unit_to_dict(value.unit)}
+
+
+def _value_from_dict(value_dict: typing.Optional[typing.Dict[str, typing.Any]]) -> typing.Optional[Value]:
+    if value_dict is None:
+        return None
+    if 'unit' not in value_dict:
+        return value_dict['value']
+    return Value(value_dict['value'], _unit_from_dict(value_dict['unit']))
+
+
+def scale_setting_to_dict(setting: typing.Optional[ScaleSetting]) -> typing.Dict[str, typing.Any]:
+    if setting is None:
+        setting = ScaleSetting()
+    line = setting.scale_line
+    return {
+        'reference_length': _value_to_dict(setting.reference_length),
+        'scale': _value_to_dict(setting.scale),
+        'scale_line': None if line is None else {'p1': list(line.p1), 'p2': list(line.p2),
+                                                 'length': _value_to_dict(line.length)},
+        'scale_marker_bbox': None if setting.scale_marker_bbox is None else [int(v) for v in setting.scale_marker_bbox]
+    }
+
+
+def scale_setting_from_dict(setting_dict: typing.Dict[str, typing.Any]) -> ScaleSetting:
+    line = setting_dict.get('scale_line')
+    bbox = setting_dict.get('scale_marker_bbox')
+    return ScaleSetting(reference_length=_value_from_dict(setting_dict.get('reference_length')),
+                        scale=_value_from_dict(setting_dict.get('scale')),
+                        scale_line=None if line is None else ScaleLineInfo(p1=tuple(line['p1']), p2=tuple(line['p2']),
+                                                                           length=_value_from_dict(line['length'])),
+                        scale_marker_bbox=None if bbox is None else tuple(bbox))
+
+
+def record_from_legacy_dict(name: str, info: typing.Dict[str, typing.Any]) -> PhotoRecord:
+    """Converts an entry of the legacy `photo_info.json` into `PhotoRecord`."""
+    lbl_infos = info.get('label_images_info', {})
+    return PhotoRecord(name=name,
+                       image_size=tuple(info['image_size']) if 'image_size' in info else None,
+                       format=info.get('format'),
+                       tags=set(info.get('tags', [])),
+                       approved={lbl_name: lbl_info['approved'] for lbl_name, lbl_info in lbl_infos.items()},
+                       segmented={lbl_name: lbl_info.get('segmented') for lbl_name, lbl_info in lbl_infos.items()},
+                       scale_setting=ScaleSetting.from_dict(info['scale_info']))
+
+
+def record_to_legacy_dict(record: PhotoRecord) -> typing.Dict[str, typing.Any]:
+    """Converts `record` into the format of `photo_info.json`."""
+    setting = record.scale_setting
+    return {
+        'scale': repr(setting.scale),
+        'scale_info': {
+            'reference_length': repr(setting.reference_length),
+            'scale': repr(setting.scale),
+            'scale_line': repr(setting.scale_line),
+            'scale_marker_bbox': repr(setting.scale_marker_bbox)
+        },
+        'approved': dict(record.approved),
+        'label_images_info': {lbl_name: {
+            'approved': record.approved.get(lbl_name),
+            'segmented': bool(record.segmented.get(lbl_name))
+        } for lbl_name in record.approved.keys()},
+        'tags': list(sorted(record.tags)),
+        'image_size': None if record.image_size is None else list(record.image_size),
+        'format': record.format
+    }
+
+
+class ProjectManifest:
+    """Versioned SQLite database holding `PhotoRecord`s of a project.
+
+    Every photo is one row, so updating the state of a single photo rewrites only that row. The table `label_usage`
+    stores the labels used in every label image, so that project-wide label queries do not need to open label images.
+    """
+    VERSION: int = 2
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._connection = sqlite3.connect(str(path))
+        self._ensure_schema()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _ensure_schema(self):
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version > self.VERSION:
+            raise ValueError(f'{self._path} has manifest version {version}, only versions up to {self.VERSION} '
+                             f'are supported.')
+        if version == 0:
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS photos (
+                    name TEXT PRIMARY KEY,
+                    width INTEGER,
+                    height INTEGER,
+                    format TEXT,
+                    tags TEXT NOT NULL,
+                    label_images TEXT NOT NULL,
+                    scale_setting TEXT NOT NULL
+                );
+            ''')
+        if version < 2:
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS label_usage (
+                    photo TEXT NOT NULL,
+                    label_image TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    PRIMARY KEY (photo, label_image)
+                );
+            ''')
+        if version < self.VERSION:
+            self._connection.execute(f'PRAGMA user_version = {self.VERSION}')
+            self._connection.commit()
+
+    @staticmethod
+    def _to_row(record: PhotoRecord) -> typing.Tuple:
+        width, height = record.image_size if record.image_size is not None else (None, None)
+        label_images = {lbl_name: {'approved': approval, 'segmented': record.segmented.get(lbl_name)}
+                        for lbl_name, approval in record.approved.items()}
+        return (record.name, width, height, record.format, json.dumps(list(sorted(record.tags))),
+                json.dumps(label_images, sort_keys=True), json.dumps(scale_setting_to_dict(record.scale_setting)))
+
+    @staticmethod
+    def _from_row(row: typing.Tuple) -> PhotoRecord:
+        name, width, height, fmt, tags, label_images, scale_setting = row
+        label_images = json.loads(label_images)
+        return PhotoRecord(name=name,
+                           image_size=None if width is None else (width, height),
+                           format=fmt,
+                           tags=set(json.loads(tags)),
+                           approved={lbl_name: info['approved'] for lbl_name, info in label_images.items()},
+                           segmented={lbl_name: info['segmented'] for lbl_name, info in label_images.items()},
+                           scale_setting=scale_setting_from_dict(json.loads(scale_setting)))
+
+    def load_records(self) -> typing.Tuple[typing.Dict[str, PhotoRecord], typing.Dict[str, typing.Tuple]]:
+        """Returns the records and the rows they were decoded from, the rows can be passed to `write_records`
+        to skip writing unchanged records."""
+        records: typing.Dict[str, PhotoRecord] = {}
+        rows: typing.Dict[str, typing.Tuple] = {}
+        for row in self._connection.execute('SELECT name, width, height, format, tags, label_images, scale_setting '
+                                            'FROM photos'):
+            records[row[0]] = self._from_row(row)
+            rows[row[0]] = tuple(row)
+        return records, rows
+
+    def write_records(self, records: typing.Iterable[PhotoRecord],
+                      stored_rows: typing.Optional[typing.Dict[str, typing.Tuple]] = None) -> int:
+        """Writes `records` in one transaction and returns the number of rows written.
+
+        If `stored_rows` is provided, records whose row is equal to the stored one are skipped and `stored_rows`
+        is updated with the new rows."""
+        rows = [self._to_row(record) for record in records]
+        if stored_rows is not None:
+            rows = [row for row in rows if stored_rows.get(row[0]) != row]
+        if len(rows) == 0:
+            return 0
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO photos '
+                                         '(name, width, height, format, tags, label_images, scale_setting) '
+                                         'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        if stored_rows is not None:
+            stored_rows.update({row[0]: row for row in rows})
+        return len(rows)
+
+    def delete_records(self, names: typing.Iterable[str]):
+        names = [(name,) for name in names]
+        with self._connection:
+            self._connection.executemany('DELETE FROM photos WHERE name = ?', names)
+            self._connection.executemany('DELETE FROM label_usage WHERE photo = ?', names)
+
+    def load_label_usage(self) -> typing.Dict[str, typing.Dict[str, typing.Set[int]]]:
+        """Returns label image name -> (photo name -> labels used in the label image of the photo)."""
+        usage: typing.Dict[str, typing.Dict[str, typing.Set[int]]] = {}
+        for photo, label_image, labels in self._connection.execute('SELECT photo, label_image, labels '
+                                                                   'FROM label_usage'):
+            usage.setdefault(label_image, {})[photo] = set(json.loads(labels))
+        return usage
+
+    def write_label_usage(self, usage: typing.Iterable[typing.Tuple[str, str, typing.Set[int]]]):
+        """Writes (photo name, label image name, used labels) triples in one transaction."""
+        rows = [(photo, label_image, json.dumps(sorted(int(label) for label in labels)))
+                for photo, label_image, labels in usage]
+        if len(rows) == 0:
+            return
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO label_usage (photo, label_image, labels) '
+                                         'VALUES (?, ?, ?)', rows)
+
+    def export_json(self, path: Path):
+        """Exports the manifest in the format of `photo_info.json`."""
+        records, _ = self.load_records()
+        with open(path, 'w') as f:
+            json.dump({name: record_to_legacy_dict(record) for name, record in sorted(records.items())}, f, indent=2)
+
+    def close(self):
+        self._connection.close()
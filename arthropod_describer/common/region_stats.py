@@ -0,0 +1,129 @@
+import dataclasses
+import math
+import typing
+
+import numpy as np
+from scipy import ndimage
+from skimage.color import rgb2hsv
+
+
+# `skimage.measure.perimeter` with 4-connectivity: every border pixel gets the code 1 + 2 * (number of 4-neighbours
+# that are border pixels of the same region) + 10 * (number of such diagonal neighbours), the codes are weighted by
+# the length of the boundary they represent
+_PERIMETER_CODE_WEIGHTS: typing.Dict[typing.Tuple[int, int], int] = {
+    (-1, -1): 10, (-1, 0): 2, (-1, 1): 10,
+    (0, -1): 2, (0, 1): 2,
+    (1, -1): 10, (1, 0): 2, (1, 1): 10,
+}
+_PERIMETER_WEIGHTS = np.zeros(50, dtype=np.float64)
+_PERIMETER_WEIGHTS[[5, 7, 15, 17, 25, 27]] = 1
+_PERIMETER_WEIGHTS[[21, 33]] = math.sqrt(2)
+_PERIMETER_WEIGHTS[[13, 23]] = (1 + math.sqrt(2)) / 2
+
+
+@dataclasses.dataclass
+class RegionStats:
+    label: int
+    area: int  # px
+    perimeter: float  # px, the same as `skimage.measure.perimeter` of the region's mask
+    bbox: typing.Tuple[int, int, int, int]  # top, left, height, width
+    centroid: typing.Tuple[float, float]  # row, column
+    mean_rgb: typing.Optional[typing.List[float]]  # over the pixels that are not reflections, None if there are none
+    mean_hsv: typing.Optional[typing.List[float]]  # H as the circular mean in degrees, S and V in %, see `MeanHSV`
+    circularity: float  # 4 pi area / perimeter^2 clipped to [0, 1], 0 for a zero perimeter
+
+
+def level_region_ids(level_img: np.ndarray, level_labels: np.ndarray) -> np.ndarray:
+    """Returns an image where the pixels of the i-th label of the sorted `level_labels` are i + 1 and the pixels of
+    other labels are 0."""
+    positions = np.searchsorted(level_labels, level_img)
+    np.minimum(positions, len(level_labels) - 1, out=positions)
+    return np.where(level_labels[positions] == level_img, positions + 1, 0)
+
+
+def _perimeters(region_ids: np.ndarray, count: int) -> np.ndarray:
+    """Perimeters of the regions 1..`count` of `region_ids`, indexed by the region id."""
+    padded = np.pad(region_ids, 1)
+    height, width = region_ids.shape
+
+    def shifted(image: np.ndarray, dy: int, dx: int) -> np.ndarray:
+        return image[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+
+    # a pixel is on the border if one of its 4-neighbours belongs to another region or lies outside of the image
+    interior = region_ids > 0
+    for dy, dx in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+        interior &= shifted(padded, dy, dx) == region_ids
+    border = (region_ids > 0) & ~interior
+    del interior
+
+    border_padded = np.pad(border, 1)
+    codes = border.astype(np.uint8)
+    for (dy, dx), weight in _PERIMETER_CODE_WEIGHTS.items():
+        codes += weight * (shifted(border_padded, dy, dx) & (shifted(padded, dy, dx) == region_ids)).astype(np.uint8)
+    return np.bincount(region_ids[border], weights=_PERIMETER_WEIGHTS[codes[border]], minlength=count + 1)
+
+
+def compute_region_stats(level_img: np.ndarray, labels: typing.Iterable[int], image: np.ndarray,
+                         reflections: typing.Optional[np.ndarray] = None) -> typing.Dict[int, RegionStats]:
+    """Computes the `RegionStats` of all the regions `labels` of `level_img`, the label image of one hierarchy
+    level, with a fixed number of vectorised passes over the image regardless of the number of regions. The mean
+    colours of `image` exclude the pixels marked in `reflections`. Labels without any pixels are left out."""
+    level_labels = np.array(sorted(set(labels) - {0}), dtype=np.uint32)
+    if len(level_labels) == 0:
+        return {}
+    region_ids = level_region_ids(level_img, level_labels)
+    slices = ndimage.find_objects(region_ids, max_label=len(level_labels))
+    present = [slc for slc in slices if slc is not None]
+    if len(present) == 0:
+        return {}
+
+    # everything else is computed only in the bounding box of all the regions
+    top, left = min(slc[0].start for slc in present), min(slc[1].start for slc in present)
+    bottom, right = max(slc[0].stop for slc in present), max(slc[1].stop for slc in present)
+    region_ids = region_ids[top:bottom, left:right]
+    count = len(level_labels)
+
+    pixels = np.flatnonzero(region_ids)
+    pixel_ids = region_ids.ravel()[pixels]
+    areas = np.bincount(pixel_ids, minlength=count + 1)
+    rows, cols = np.divmod(pixels, region_ids.shape[1])
+    row_sums = np.bincount(pixel_ids, weights=rows, minlength=count + 1)
+    col_sums = np.bincount(pixel_ids, weights=cols, minlength=count + 1)
+    perimeters = _perimeters(region_ids, count)
+
+    if reflections is not None:
+        colour_pixels = reflections[top:bottom, left:right].ravel()[pixels] == 0
+        pixels, pixel_ids = pixels[colour_pixels], pixel_ids[colour_pixels]
+    colour_counts = np.bincount(pixel_ids, minlength=count + 1)
+    divisors = np.maximum(colour_counts, 1)
+    rgb = image[top:bottom, left:right].reshape(-1, image.shape[2])[pixels]
+    mean_rgb = np.stack([np.bincount(pixel_ids, weights=rgb[:, channel], minlength=count + 1) / divisors
+                         for channel in range(rgb.shape[1])], axis=1)
+    hsv = rgb2hsv(rgb[:, np.newaxis, :3])[:, 0, :]
+    hue_radians = 2 * np.pi * hsv[:, 0]
+    avg_sin = np.bincount(pixel_ids, weights=np.sin(hue_radians), minlength=count + 1) / divisors
+    avg_cos = np.bincount(pixel_ids, weights=np.cos(hue_radians), minlength=count + 1) / divisors
+    mean_sat = np.bincount(pixel_ids, weights=hsv[:, 1], minlength=count + 1) / divisors
+    mean_val = np.bincount(pixel_ids, weights=hsv[:, 2], minlength=count + 1) / divisors
+    hue_degrees = np.mod(np.degrees(np.arctan2(avg_sin, avg_cos)), 360)
+    vector_lengths = np.sqrt(avg_sin * avg_sin + avg_cos * avg_cos)
+
+    stats: typing.Dict[int, RegionStats] = {}
+    for region_id, (label, slc) in enumerate(zip(level_labels.tolist(), slices), start=1):
+        if slc is None:
+            continue
+        area, perimeter = int(areas[region_id]), float(perimeters[region_id])
+        circularity = 0.0 if perimeter == 0 else float(np.clip(4 * np.pi * area / perimeter ** 2, 0.0, 1.0))
+        has_colour = colour_counts[region_id] > 0
+        stats[label] = RegionStats(
+            label=label,
+            area=area,
+            perimeter=perimeter,
+            bbox=(slc[0].start, slc[1].start, slc[0].stop - slc[0].start, slc[1].stop - slc[1].start),
+            centroid=(float(top + row_sums[region_id] / area), float(left + col_sums[region_id] / area)),
+            mean_rgb=mean_rgb[region_id].tolist() if has_colour else None,
+            mean_hsv=[float(hue_degrees[region_id]),
+                      100 * float(mean_sat[region_id] * vector_lengths[region_id]),
+                      100 * float(mean_val[region_id])] if has_colour else None,
+            circularity=circularity)
+    return stats
@@ -1,9 +1,15 @@
+import collections
 import dataclasses
 import typing
 
 import numpy as np
+from scipy import ndimage
 
+from arthropod_describer.common.derived_images import DerivedImages
+from arthropod_describer.common.intermediates import Intermediates
+from arthropod_describer.common.label_image import LabelImg
 from arthropod_describer.common.photo import Photo
+from arthropod_describer.common.region_stats import level_region_ids
 
 
 @dataclasses.dataclass
@@ -11,27 +17,185 @@ class Region:
     label: int
     mask: np.ndarray
     image: np.ndarray
-    bbox: typing.Tuple[int, int, int, int]  # top, left, bottom, right
+    bbox: typing.Tuple[int, int, int, int]  # top, left, height, width
+
+
+def _build_per_label(region_labels: typing.Set[int], photo: Photo, label_img: LabelImg) -> typing.Dict[int, Region]:
+    """Searches the whole label image once for every label."""
+    regions: typing.Dict[int, Region] = {}
+    regions_by_level = label_img.label_hierarchy.group_by_level(region_labels)
+
+    for level, labels in regions_by_level.items():
+        label_img_on_level = label_img[level]
+        for label in labels:
+            region_mask = label_img_on_level == label
+            yy, xx = np.nonzero(region_mask)
+            if len(yy) == 0:
+                continue
+            top, left, bottom, right = np.min(yy), np.min(xx), np.max(yy), np.max(xx)
+
+            mask_roi = region_mask[top:bottom+1, left:right+1]
+            image_roi = photo.image[top:bottom+1, left:right+1]
+
+            regions[label] = Region(label, mask_roi, image_roi, (top, left, bottom-top+1, right-left+1))
+    return regions
+
+
+def _indexed_region(label: int, index_bbox: typing.Tuple[int, int, int, int], level_mask: int, photo: Photo,
+                    label_img: LabelImg) -> typing.Optional[Region]:
+    """Builds the region `label` by searching only `index_bbox`, the bounding box of the region in the label index."""
+    region_mask = np.bitwise_and(label_img.read_region(*index_bbox), level_mask) == label
+    yy, xx = np.nonzero(region_mask)
+    if len(yy) == 0:
+        return None
+    # the bbox from the index might not be tight after incremental updates
+    top, left = index_bbox[0] + np.min(yy), index_bbox[1] + np.min(xx)
+    bottom, right = index_bbox[0] + np.max(yy), index_bbox[1] + np.max(xx)
+
+    mask_roi = region_mask[top - index_bbox[0]:bottom - index_bbox[0] + 1,
+                           left - index_bbox[1]:right - index_bbox[1] + 1]
+    image_roi = photo.image[top:bottom+1, left:right+1]
+
+    return Region(label, mask_roi, image_roi, (top, left, bottom-top+1, right-left+1))
+
+
+def _build_indexed(region_labels: typing.Set[int], photo: Photo, label_img: LabelImg) -> typing.Dict[int, Region]:
+    """Searches only the bounding boxes of the regions, which are taken from the label index of `label_img`."""
+    regions: typing.Dict[int, Region] = {}
+    lab_hier = label_img.label_hierarchy
+    label_index = label_img.label_index
+
+    for level, labels in lab_hier.group_by_level(region_labels).items():
+        level_mask = lab_hier.level_mask(level)
+        for label in labels:
+            count, index_bbox = label_index.region(label, lab_hier)
+            if count == 0:
+                continue
+            if (region := _indexed_region(label, index_bbox, level_mask, photo, label_img)) is not None:
+                regions[label] = region
+    return regions
+
+
+def _build_single_pass(region_labels: typing.Set[int], photo: Photo, label_img: LabelImg) -> typing.Dict[int, Region]:
+    """Finds the bounding boxes of all the regions of one hierarchy level with a single pass of
+    `ndimage.find_objects`, so the whole label image is traversed a fixed number of times per level, regardless of
+    the number of regions."""
+    regions: typing.Dict[int, Region] = {}
+    regions_by_level = label_img.label_hierarchy.group_by_level(region_labels)
+
+    for level, labels in regions_by_level.items():
+        level_labels = np.array(sorted(labels), dtype=np.uint32)
+        label_img_on_level = label_img[level]
+        region_ids = level_region_ids(label_img_on_level, level_labels)
+
+        slices = ndimage.find_objects(region_ids, max_label=len(level_labels))
+        for region_id, (label, slc) in enumerate(zip(level_labels.tolist(), slices), start=1):
+            if slc is None:
+                continue
+            top, left, bottom, right = slc[0].start, slc[1].start, slc[0].stop - 1, slc[1].stop - 1
+
+            mask_roi = region_ids[slc] == region_id
+            image_roi = photo.image[top:bottom+1, left:right+1]
+
+            regions[label] = Region(label, mask_roi, image_roi, (top, left, bottom-top+1, right-left+1))
+    return regions
+
+
+BUILDERS: typing.Dict[str, typing.Callable[[typing.Set[int], Photo, LabelImg], typing.Dict[int, Region]]] = {
+    'per_label': _build_per_label,
+    'indexed': _build_indexed,
+    'single_pass': _build_single_pass,
+}
+
+
+def default_builder(label_img: LabelImg) -> str:
+    """'indexed' for label images that can be read partially, as then only the regions' bounding boxes are read from
+    the disk, 'single_pass' otherwise."""
+    return 'indexed' if label_img.backend.PARTIAL_READS else 'single_pass'
+
+
+class LazyRegions(typing.Mapping[int, Region]):
+    """A mapping of labels to regions which builds a region on its first access.
+
+    Which regions are present and their bounding boxes are taken from the label index, so `in` and `len` do not
+    touch the pixels. Built regions are memoised, if `byte_budget` is set, the least recently used ones are dropped
+    (and built again when accessed) once their masks take more than `byte_budget` bytes. The image ROIs are views of
+    the photo, so they do not count towards the budget.
+    """
+    def __init__(self, region_labels: typing.Set[int], photo: Photo, label_img: LabelImg,
+                 byte_budget: typing.Optional[int] = None):
+        self._photo = photo
+        self._label_img = label_img
+        self.byte_budget = byte_budget
+        self._regions: typing.OrderedDict[int, Region] = collections.OrderedDict()
+        self._nbytes: int = 0
+        self._index_bboxes: typing.Dict[int, typing.Tuple[int, int, int, int]] = {}
+        lab_hier = label_img.label_hierarchy
+        label_index = label_img.label_index
+        for label in region_labels:
+            count, index_bbox = label_index.region(label, lab_hier)
+            if count > 0:
+                self._index_bboxes[label] = index_bbox
+
+    def __contains__(self, label: object) -> bool:
+        return label in self._index_bboxes
+
+    def __len__(self) -> int:
+        return len(self._index_bboxes)
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(self._index_bboxes)
+
+    def __getitem__(self, label: int) -> Region:
+        if (region := self._regions.get(label)) is not None:
+            self._regions.move_to_end(label)
+            return region
+        index_bbox = self._index_bboxes[label]  # raises KeyError for regions that are not present
+        lab_hier = self._label_img.label_hierarchy
+        region = _indexed_region(label, index_bbox, lab_hier.level_mask(lab_hier.get_level(label)), self._photo,
+                                 self._label_img)
+        if region is None:  # cannot happen unless the label image was modified after the index was read
+            raise KeyError(label)
+        self._regions[label] = region
+        self._nbytes += region.mask.nbytes
+        self._evict()
+        return region
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes taken by the masks of the built regions."""
+        return self._nbytes
+
+    def _evict(self):
+        if self.byte_budget is None:
+            return
+        while self._nbytes > self.byte_budget and len(self._regions) > 1:
+            _, region = self._regions.popitem(last=False)
+            self._nbytes -= region.mask.nbytes
 
 
 class RegionsCache:
-    def __init__(self, region_labels: typing.Set[int], photo: Photo, label_name: str):
-        self.regions: typing.Dict[int, Region] = {}
+    """Masks and image ROIs of the regions `region_labels` in `photo[label_name]`.
+
+    `builder` selects how the regions are found, see `BUILDERS`. All of the builders produce identical regions,
+    `benchmarks/bench_regions_cache.py` compares their speed. None selects the builder with `default_builder`.
+
+    With `lazy`, `regions` is a `LazyRegions` mapping, which builds only the regions that are accessed, `builder` is
+    ignored then and `byte_budget` limits the memory the built regions may take.
+
+    `data_storage` holds the images derived from the photo (HSV, grayscale, ...) that the computations share,
+    `intermediates` the per-region intermediate products the computations declare in `PropertyComputation.requires`.
+    """
+    def __init__(self, region_labels: typing.Set[int], photo: Photo, label_name: str,
+                 builder: typing.Optional[str] = None, lazy: bool = False, byte_budget: typing.Optional[int] = None):
         label_img = photo[label_name]
-        regions_by_level = label_img.label_hierarchy.group_by_level(region_labels)
-
-        for level, labels in regions_by_level.items():
-            label_img_on_level = label_img[level]
-            for label in labels:
-                region_mask = label_img_on_level == label
-                yy, xx = np.nonzero(region_mask)
-                if len(yy) == 0:
-                    continue
-                top, left, bottom, right = np.min(yy), np.min(xx), np.max(yy), np.max(xx)
-
-                mask_roi = region_mask[top:bottom+1, left:right+1]
-                image_roi = photo.image[top:bottom+1, left:right+1]
-
-                region = Region(label, mask_roi, image_roi, (top, left, bottom-top+1, right-left+1))
-                self.regions[label] = region
-        self.data_storage: typing.Dict[str, typing.Any] = {}
+        self.data_storage: DerivedImages = DerivedImages(photo, label_img)
+        self.intermediates: Intermediates = Intermediates(self, photo)
+        if lazy:
+            self.regions: typing.Mapping[int, Region] = LazyRegions(set(region_labels), photo, label_img, byte_budget)
+            return
+        if builder is None:
+            builder = default_builder(label_img)
+        if builder not in BUILDERS:
+            raise ValueError(f'Unknown regions builder {builder}, available builders: {list(BUILDERS.keys())}')
+        self.regions = BUILDERS[builder](set(region_labels), photo, label_img)
@@ -0,0 +1,125 @@
+import collections
+import logging
+import threading
+import typing
+
+logger = logging.getLogger("model.residency_manager")
+
+
+DEFAULT_MEMORY_BUDGET_MB: float = 2048.0
+
+
+class ResidencyManager:
+    """Keeps the decoded photo and label image arrays within a memory budget.
+
+    Owners (`LocalPhoto`, `LabelImg`) report every access to their decoded array via `access`. When the total size
+    exceeds the budget, the least recently used owners are asked to drop their arrays, clean ones first, dirty ones
+    are flushed with `save()` before dropping. Owners are expected to provide:
+
+        `has_unsaved_changes` - property, whether `save()` needs to be called before dropping the data
+        `save()`
+        `drop_decoded_data()` - releases the decoded array, it will be decoded again on the next access
+        `decoded_data_lock` - property, the lock held while the array is decoded, it is held while saving and dropping
+
+    Pinned owners, e.g. the photo shown in the editor, are never evicted. The manager can be used from several
+    threads, e.g. by the prefetching workers, but only the main thread flushes dirty owners.
+    """
+
+    def __init__(self, budget_mb: float = DEFAULT_MEMORY_BUDGET_MB):
+        self.budget_bytes: int = int(budget_mb * 1024 * 1024)
+        self._entries: typing.OrderedDict[int, typing.Tuple[typing.Any, int]] = collections.OrderedDict()
+        self._pinned: typing.Set[int] = set()
+        self.used_bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._lock = threading.RLock()
+
+    @property
+    def budget_mb(self) -> float:
+        return self.budget_bytes / (1024 * 1024)
+
+    @budget_mb.setter
+    def budget_mb(self, budget: float):
+        with self._lock:
+            self.budget_bytes = int(budget * 1024 * 1024)
+            self._evict_to_budget(None)
+
+    def access(self, owner: typing.Any, nbytes: int, hit: typing.Optional[bool] = None):
+        """Records that `owner` accessed its decoded data of size `nbytes`, `hit` is False if the data had to be
+        decoded, None if the data was replaced by the owner and the access should not count as a hit or a miss."""
+        with self._lock:
+            if hit is not None:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            key = id(owner)
+            if (entry := self._entries.pop(key, None)) is not None:
+                self.used_bytes -= entry[1]
+            self._entries[key] = (owner, nbytes)
+            self.used_bytes += nbytes
+            if self.used_bytes > self.budget_bytes:
+                self._evict_to_budget(key)
+
+    def release(self, owner: typing.Any):
+        """Should be called when `owner` dropped its decoded data on its own."""
+        with self._lock:
+            if (entry := self._entries.pop(id(owner), None)) is not None:
+                self.used_bytes -= entry[1]
+
+    def pin(self, owner: typing.Any):
+        with self._lock:
+            self._pinned.add(id(owner))
+
+    def unpin(self, owner: typing.Any):
+        with self._lock:
+            self._pinned.discard(id(owner))
+            if self.used_bytes > self.budget_bytes:
+                self._evict_to_budget(None)
+
+    def is_resident(self, owner: typing.Any) -> bool:
+        with self._lock:
+            return id(owner) in self._entries
+
+    def _evict_to_budget(self, keep: typing.Optional[int]):
+        # first pass evicts only clean entries, the second one flushes the dirty ones as well. The GUI thread modifies
+        # the owners without locking, so dirty owners are flushed only in the main thread, evictions requested by
+        # other threads drop clean entries only and the rest waits for the next access from the main thread, which
+        # finds the budget still exceeded
+        flush_dirty = threading.current_thread() is threading.main_thread()
+        for evict_dirty in ((False, True) if flush_dirty else (False,)):
+            for key in list(self._entries.keys()):
+                if self.used_bytes <= self.budget_bytes:
+                    return
+                if key == keep or key in self._pinned:
+                    continue
+                owner, _ = self._entries[key]
+                # an owner that is being decoded or saved by another thread is in use, not worth evicting, and
+                # waiting for it could deadlock with that thread waiting for `self._lock`
+                if not owner.decoded_data_lock.acquire(blocking=False):
+                    continue
+                try:
+                    if owner.has_unsaved_changes:
+                        if not evict_dirty:
+                            continue
+                        owner.save()
+                    self.release(owner)
+                    owner.drop_decoded_data()
+                    self.evictions += 1
+                finally:
+                    owner.decoded_data_lock.release()
+
+    @property
+    def stats(self) -> typing.Dict[str, typing.Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'resident_count': len(self._entries),
+            'used_mb': self.used_bytes / (1024 * 1024),
+            'budget_mb': self.budget_mb
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
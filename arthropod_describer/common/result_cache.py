@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import pickle
+import sqlite3
+import typing
+from pathlib import Path
+
+import numpy as np
+
+from arthropod_describer.common.label_image import RegionProperty
+from arthropod_describer.common.photo import Photo
+from arthropod_describer.common.plugin import PropertyComputation
+
+logger = logging.getLogger("model.result_cache")
+
+
+RESULT_CACHE_FILENAME = 'result_cache.sqlite'
+
+
+def _update_with_array(digest, arr: np.ndarray):
+    digest.update(f'{arr.dtype.str}{arr.shape}'.encode())
+    digest.update(np.ascontiguousarray(arr).data)
+
+
+def region_content_hash(photo: Photo, label_name: str, label: int) -> str:
+    """Hash of everything a property of the region `label` of `photo[label_name]` is computed from: the position of the
+    region's bounding box, the contents of the bounding box in the photo and in all of its label images, and the scale
+    of the photo."""
+    label_img = photo[label_name]
+    _, bbox = label_img.label_index.region(label, label_img.label_hierarchy)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{label_name}:{label}:{bbox}:{photo.image_scale!r}'.encode())
+    if bbox is None:  # the region is not present in the label image
+        return digest.hexdigest()
+    rows, cols = slice(bbox[0], bbox[2] + 1), slice(bbox[1], bbox[3] + 1)
+    _update_with_array(digest, photo.image[rows, cols])
+    for name in sorted(photo.label_image_info.keys()):
+        digest.update(name.encode())
+        _update_with_array(digest, photo[name].label_image[rows, cols])
+    return digest.hexdigest()
+
+
+def computation_fingerprint(computation: PropertyComputation) -> str:
+    """Identifies `computation`, the version of its plugin (see `PropertyComputation.version`) and the values of its
+    user parameters."""
+    param_values = sorted((param.param_key, repr(param.value)) for param in computation.user_params)
+    return f'{computation.info.key}|{computation.version}|{param_values}'
+
+
+def result_key(content_hash: str, fingerprint: str) -> str:
+    return hashlib.blake2b(f'{content_hash}|{fingerprint}'.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Persistent cache of `RegionProperty`s computed for regions, stored in a SQLite database in the project folder.
+
+    The results are keyed by `result_key`, i.e. by the contents of the region and by the computation, so the
+    results of a region stay valid until the region, its photo, the computation's version or its parameters change,
+    and there is no need to invalidate them explicitly.
+    """
+    VERSION: int = 1
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._connection = sqlite3.connect(str(path))
+        self._ensure_schema()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _ensure_schema(self):
+        version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        if version > self.VERSION:
+            raise ValueError(f'{self._path} has result cache version {version}, only versions up to {self.VERSION} '
+                             f'are supported.')
+        if version == 0:
+            self._connection.executescript('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    props BLOB NOT NULL
+                );
+            ''')
+            self._connection.execute(f'PRAGMA user_version = {self.VERSION}')
+            self._connection.commit()
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, typing.List[RegionProperty]]:
+        """Returns the properties stored for those of `keys` that are present in the cache."""
+        keys = list(keys)
+        found: typing.Dict[str, typing.List[RegionProperty]] = {}
+        for i in range(0, len(keys), 500):  # stays below SQLite's limit on the number of query parameters
+            chunk = keys[i:i + 500]
+            rows = self._connection.execute(f'SELECT key, props FROM results '
+                                            f'WHERE key IN ({", ".join("?" * len(chunk))})', chunk)
+            for key, props in rows:
+                try:
+                    found[key] = pickle.loads(props)
+                except Exception as e:  # e.g. stored by a version of the application with different classes
+                    logger.warning(f'could not load the cached result {key}: {e}')
+        return found
+
+    def put_many(self, results: typing.Iterable[typing.Tuple[str, typing.List[RegionProperty]]]):
+        """Stores (key, properties of one region) pairs in one transaction."""
+        rows = [(key, pickle.dumps(props, protocol=pickle.HIGHEST_PROTOCOL)) for key, props in results]
+        if len(rows) == 0:
+            return
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO results (key, props) VALUES (?, ?)', rows)
+
+    def clear(self):
+        with self._connection:
+            self._connection.execute('DELETE FROM results')
+
+    def close(self):
+        self._connection.close()
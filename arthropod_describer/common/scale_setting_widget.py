@@ -16,8 +16,8 @@ from PySide2.QtGui import QImage, QPixmap
 from PySide2.QtWidgets import QWidget, QHBoxLayout, QLabel, QSpinBox, QPushButton, QComboBox, QDoubleSpinBox, QDialog, \
     QDialogButtonBox, QVBoxLayout, QStyleOptionViewItem
 
-from arthropod_describer.common.blocking_operation import BlockingOperation
 from arthropod_describer.common.image_operation_binding import ImageOperation
+from arthropod_describer.common.job_engine import JobEngine, PhotoJob
 from arthropod_describer.common.photo import Photo, UpdateContext
 from arthropod_describer.common.photo_layer import PhotoLayer
 from arthropod_describer.common.state import State
@@ -55,11 +55,12 @@ class ScaleSettingWidget(QWidget):
     cancelled = Signal()
 
     def __init__(self, state: State, parent: typing.Optional[PySide2.QtWidgets.QWidget] = None,
-                 f: PySide2.QtCore.Qt.WindowFlags = Qt.WindowFlags()):
+                 f: PySide2.QtCore.Qt.WindowFlags = Qt.WindowFlags(), job_engine: typing.Optional[JobEngine] = None):
         super().__init__(parent, f)
 
         self.state = state
         self._state = self.state
+        self.job_engine = job_engine if job_engine is not None else JobEngine(parent=self)
         self.photo: typing.Optional[Photo] = None
         self._storage: typing.Optional[Storage] = None
 
@@ -529,11 +530,14 @@ class ScaleSettingWidget(QWidget):
             self._lblScaleValue.setText(str(scale_setting.scale))
 
     def _extract_scales(self):
-        block_op = BlockingOperation(self.state.storage, list(range(self.state.storage.image_count)),
-                                     operation=self._scale_extraction_operation,
-                                     result_handler=self._scale_extraction_result_processing,
-                                     parent=self)
-        block_op.start()
+        # the extraction reads the photos from their files, so the photos are not prepared and run in parallel
+        job = PhotoJob('Extracting scales', self.state.storage, list(range(self.state.storage.image_count)),
+                       operation=self._scale_extraction_operation,
+                       result_handler=self._scale_extraction_result_processing,
+                       max_parallel=self.job_engine.max_threads, prepare_photos=False)
+        self._btnExtractScales.setEnabled(False)
+        job.finished.connect(lambda _: self._btnExtractScales.setEnabled(True))
+        self.job_engine.submit(job)
 
     def _scale_extraction_operation(self, storage: Storage, idx: int) -> typing.Optional[ScaleExtractionResult]:
         dig_re = re.compile(r'([0-9]+)\s*([a-zA-Z]m)')
@@ -306,7 +306,7 @@ class State(QObject):
         self.tags_filter_changed.emit(self._active_tags_filter)
 
     def _update_hidden_photos_count(self):
-        shown_photos = self.storage.photos_satisfying_tags(set(self._active_tags_filter))
+        shown_photos = self.storage.photo_names_with_tags(set(self._active_tags_filter))
         self._hidden_photos_count = self.storage.image_count - len(shown_photos)
 
     def _handle_storage_update(self, data: typing.Dict[str, typing.Any]):
@@ -61,6 +61,13 @@ class Storage(Subscriber):
     def images(self) -> List[Photo]:
         return []
 
+    def index_of(self, img_name: str) -> typing.Optional[int]:
+        """Returns the index of the photo `img_name` in `image_names`, None if there is no such photo."""
+        try:
+            return self.image_names.index(img_name)
+        except ValueError:
+            return None
+
     @abc.abstractmethod
     def get_photo_by_name(self, name: str, load_image: bool=True) -> Photo:
         return Photo()
@@ -76,6 +83,13 @@ class Storage(Subscriber):
     def reset_photo(self, photo: Photo):
         pass
 
+    def pin_photo(self, photo: Photo):
+        """Keeps the decoded data of `photo` in memory until `unpin_photo` is called."""
+        pass
+
+    def unpin_photo(self, photo: Photo):
+        pass
+
     @property
     def label_hierarchy(self) -> LabelHierarchy:
         return LabelHierarchy()
@@ -97,6 +111,10 @@ class Storage(Subscriber):
     def is_approved(self, index: int) -> bool:
         return False
 
+    def is_segmented(self, index: int, label_name: str) -> bool:
+        """Returns whether the label image `label_name` of the photo at `index` contains any labels."""
+        return self.get_photo_by_idx(index, load_image=False).has_segmentation_for(label_name)
+
     def save(self) -> bool:
         return False
 
@@ -136,6 +154,14 @@ class Storage(Subscriber):
     def photos_satisfying_tags(self, tags: typing.Set[str]) -> typing.List[Photo]:
         return list()
 
+    def photo_names_with_tags(self, tags: typing.Set[str]) -> typing.Set[str]:
+        return {photo.image_name for photo in self.photos_satisfying_tags(tags)}
+
+    @property
+    def tag_index_version(self) -> int:
+        """Changes whenever the tags of any photo change, results of tag queries can be cached until then."""
+        return 0
+
     @property
     def tag_prefixes(self) -> typing.Set[str]:
         return {TAG_PREFIX_REGEX.match(tag).groups()[0] for tag in self.used_tags}
@@ -1,4 +1,6 @@
+import contextlib
 import dataclasses
+import os
 import typing
 from copy import deepcopy
 from pathlib import Path
@@ -41,6 +43,22 @@ def is_valid_annotation_project(path: Path, req_folders: typing.List[str]) -> bo
     return all([(path / folder).exists() for folder in req_folders])
 
 
+@contextlib.contextmanager
+def atomic_write_path(path: Path) -> typing.Iterator[Path]:
+    """Yields a temporary path in the folder of `path`. When the block finishes without an exception, the temporary
+    file replaces `path` in one step, so `path` never holds a partially written file.
+
+    The temporary path keeps the suffix of `path`, so writers deducing the format from the extension work as usual.
+    """
+    tmp_path = path.with_name(f'.{path.name}.tmp{path.suffix}')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
 def get_scale_marker_roi(img: np.ndarray) -> typing.Tuple[np.ndarray, typing.Tuple[int, int, int, int]]:
     gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
 
@@ -66,8 +66,7 @@ class ImageListModel(QAbstractListModel):
             return self.storage.image_names[index.row()]
 
         if role == ROLE_THUMBNAIL and index.column() == 0:
-            photo = self.storage.get_photo_by_idx(index.row(), load_image=False)
-            return photo.thumbnail
+            return self.thumbnail_storage.thumbnail(self.storage.image_names[index.row()])
 
         if role == ROLE_IS_APPROVED:
             return self.storage.is_approved(index.row())
@@ -116,12 +115,12 @@ class ImageListModel(QAbstractListModel):
         self.dataChanged.emit(fidx, lidx, [ROLE_THUMBNAIL])
 
     def handle_approval_changed(self, photo: Photo):
-        idx = self.storage.image_names.index(photo.image_name)
+        idx = self.storage.index_of(photo.image_name)
         index = self.index(idx, 0)
         self.dataChanged.emit(index, index, [ROLE_IS_APPROVED])
 
     def _handle_photo_update(self, img_name: str, ctx: UpdateContext, data: typing.Dict[str, typing.Any]):
-        index = self.index(self.storage.image_names.index(img_name), 0)
+        index = self.index(self.storage.index_of(img_name), 0)
         if 'tags' in data:
             self.dataChanged.emit(index, index, [ROLE_TAGS])
 
@@ -132,7 +131,8 @@ class ImageListModel(QAbstractListModel):
                 self.endResetModel()
 
     def _handle_thumbnail_update(self, img_name: str, ctx: UpdateContext, data: typing.Dict[str, typing.Any]):
-        i = self.storage.image_names.index(img_name)
+        if (i := self.storage.index_of(img_name)) is None:  # the photo was deleted while its thumbnail was loading
+            return
         idx = self.index(i, 0)
         self.dataChanged.emit(idx, idx, [ROLE_THUMBNAIL])
 
@@ -141,9 +141,18 @@ class ImageListSortFilterProxyModel(QSortFilterProxyModel):
     def __init__(self, state: State, parent: typing.Optional[PySide2.QtCore.QObject] = None):
         super().__init__(parent)
         self._state = state
+        self._accepted_names: typing.Set[str] = set()
+        self._accepted_key: typing.Optional[typing.Tuple] = None  # (storage, tags filter, tag index version)
+
+    def _accepted(self) -> typing.Set[str]:
+        storage = self._state.storage
+        key = (id(storage), tuple(self._state.active_tags_filter), storage.tag_index_version)
+        if key != self._accepted_key:
+            self._accepted_names = storage.photo_names_with_tags(set(self._state.active_tags_filter))
+            self._accepted_key = key
+        return self._accepted_names
 
     def filterAcceptsRow(self, source_row: int, source_parent: PySide2.QtCore.QModelIndex) -> bool:
         index = self.sourceModel().index(source_row, 0, source_parent)
-        tags: typing.Set[str] = self.sourceModel().data(index, ROLE_TAGS)
         # return self.filterRegExp().pattern() in tags
-        return set(self._state.active_tags_filter).issubset(tags)
+        return self.sourceModel().data(index, ROLE_IMAGE_NAME) in self._accepted()
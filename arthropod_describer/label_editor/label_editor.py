@@ -545,8 +545,9 @@ class LabelEditor(QObject):
         labels_changed = set()
         for change in command.change_chain:
             label_img = self.state.current_photo[change.label_name].label_image
+            old_values = label_img[change.coords[0], change.coords[1]]
             self.change_labels(label_img, change)
-            self.state.current_photo[change.label_name].set_dirty()
+            self.state.current_photo[change.label_name].set_dirty(change.coords, old_values)
             reverse_command.add_label_change(change.swap_labels())
             labels_changed.add(change.label_name)
         reverse_command.do_type = DoType.Undo if command.do_type == DoType.Do else DoType.Do
@@ -823,6 +824,7 @@ class LabelEditor(QObject):
 
     def _handle_label_color_changed(self, label: int, color: QColor):
         self.state.colormap[label] = color.toTuple()[:3]
+        self.state.label_hierarchy.mark_modified()
         self.label_layer._recolor_image()
 
     def _handle_label_node_modified(self, label: int, name: str, color: QColor):
@@ -832,6 +834,7 @@ class LabelEditor(QObject):
             label_node.color = color.toTuple()[:3]
             self.state.colormap[label] = label_node.color
             self.label_layer._recolor_image()
+        self.state.label_hierarchy.mark_modified()
         index = self._label_tree_model.find_index(label)
         self._label_tree_model.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.DecorationRole])
 
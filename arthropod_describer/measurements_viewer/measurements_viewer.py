@@ -1,5 +1,5 @@
 import csv
-import functools
+import logging
 import time
 import typing
 from typing import List, Tuple, Dict
@@ -12,10 +12,11 @@ from PySide2.QtWidgets import QWidget, QTableWidgetItem, QTableView, QHBoxLayout
     QMenu, QAction, QTextEdit, QVBoxLayout, QTabWidget, QTableWidget, QSizePolicy, QAbstractScrollArea, QLabel
 import openpyxl
 
-from arthropod_describer.common.blocking_operation import ProgressReport
+from arthropod_describer.common.computations_scheduler import ComputationsScheduler
+from arthropod_describer.common.job_engine import ExternalJob, JobEngine
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.plugin import PropertyComputation, local_property_key, global_computation_key
-from arthropod_describer.common.regions_cache import RegionsCache
+from arthropod_describer.common.result_cache import ResultCache, RESULT_CACHE_FILENAME
 from arthropod_describer.common.state import State
 from arthropod_describer.common.units import convert_value, CompoundUnit, Unit, Value
 from arthropod_describer.label_editor.computation_widget import ComputationWidget
@@ -23,13 +24,15 @@ from arthropod_describer.measurements_viewer.measurement_assign_dialog import Me
 from arthropod_describer.measurements_viewer.measurements_model import MeasurementsTableModel
 from arthropod_describer.measurements_viewer.ui_measurements_viewer import Ui_MeasurementsViewer
 
+logger = logging.getLogger("MeasurementsViewer")
+
 
 class MeasurementsViewer(QWidget):
     open_project_folder = Signal()
     unsaved_changes = Signal()
 
     def __init__(self, state: State, parent: typing.Optional[PySide2.QtWidgets.QWidget] = None,
-                 f: PySide2.QtCore.Qt.WindowFlags=Qt.WindowFlags()):
+                 f: PySide2.QtCore.Qt.WindowFlags=Qt.WindowFlags(), job_engine: typing.Optional[JobEngine] = None):
         super().__init__(parent, f)
         self.all_props: typing.List[typing.Tuple[str, str]] = []
         self.ui = Ui_MeasurementsViewer()
@@ -70,6 +73,14 @@ class MeasurementsViewer(QWidget):
         self.ui.tableView.doubleClicked.connect(self._handle_index_double_clicked)
         self.nd_browser = None
 
+        self.job_engine = job_engine if job_engine is not None else JobEngine(parent=self)
+        self.scheduler = ComputationsScheduler(parent=self)
+        self.scheduler.progress.connect(self._handle_measurements_progress)
+        self.scheduler.finished.connect(self._handle_measurements_done)
+        self.scheduler.cancelled.connect(lambda: self._handle_measurements_done(cancelled=True))
+        self._measurements_job: typing.Optional[ExternalJob] = None
+        self._result_cache: typing.Optional[ResultCache] = None
+
     def register_computation(self, comp: PropertyComputation):
         pass
 
@@ -79,25 +90,7 @@ class MeasurementsViewer(QWidget):
         if len(to_compute) == 0:
             return
 
-        all_labels: typing.Set[int] = set(functools.reduce(set().union, to_compute.values()))
-
-        progress_dialog = ProgressReport(self.state.storage.image_count, 'Computing properties', self)
-
-        for i in range(self.state.storage.image_count):
-            photo = self.state.storage.get_photo_by_idx(i)
-            regions_cache = RegionsCache(all_labels, photo, self.state.storage.default_label_image)
-            for prop_path, labels in to_compute.items():
-                region_props: List[RegionProperty] = []
-                # for prop_path in prop_paths:
-                comp_key, prop_key = global_computation_key(prop_path), local_property_key(prop_path)
-                computation = self.computation_widget.computations_model.computations_dict[prop_path]
-                # props_ = computation(photo, {label: {prop_key}}, regions_cache)
-                props_ = computation(photo, labels, regions_cache)
-                region_props.extend(props_)
-                for prop in region_props:
-                    photo[self.state.storage.default_label_image].set_region_prop(prop.label, prop)
-            progress_dialog.increment()
-        self.update_measurements_view()
+        self.compute_measurements([(i, to_compute) for i in range(self.state.storage.image_count)])
         return
 
         photo_wise_assignments = [(i, to_compute) for i in range(self.state.storage.image_count)]
@@ -383,41 +376,54 @@ class MeasurementsViewer(QWidget):
         self.compute_measurements(assignments)
 
     def compute_measurements(self, photo_assignments: typing.List[typing.Tuple[int, typing.Dict[str, typing.Set[int]]]]):
-        progr_dialog = QProgressDialog(minimum=0, maximum=len(photo_assignments), parent=self)
-        progr_dialog.setWindowModality(Qt.WindowModal)
-        progr_dialog.setCancelButton(None)
-        progr_dialog.setMinimumDuration(0)
-        progr_dialog.setValue(0)
-        progr_dialog.setLabelText('Preparing to compute properties...')
-        progr_dialog.setWindowTitle('Computing properties')
-        time.sleep(0.01)
-        progr_dialog.setValue(0)
-        QCoreApplication.processEvents()
-        for progress_value, (i, to_compute) in enumerate(photo_assignments):
-            photo = self.state.storage.get_photo_by_idx(i)
-            computations = {}
-            # for prop_key, labels in to_compute.items():
-            #     dot_splits = prop_key.split('.')
-            #     prop_name = dot_splits.pop()
-            #     comp_key = '.'.join(dot_splits)
-            #     prop_labels = computations.setdefault(prop_key, labels)
-            #     # prop_labels[prop_name] = labels
-            all_labels = set(functools.reduce(set.union, to_compute.values()))
-            regs_cache = RegionsCache(all_labels, photo, 'Labels')
-            for prop_key, prop_labels in to_compute.items():
-                computation: PropertyComputation = self.computation_widget.computations_model.computations_dict[prop_key]
-                progr_dialog.setLabelText(f'Computing {computation.info.name} for {photo.image_name}')
-                progr_dialog.setValue(progress_value + 1)
-                reg_props = computation(photo, list(prop_labels), regs_cache)
-                for prop in reg_props:
-                    # prop.info.key = f'{computation_key}.{prop.info.key}'
-                    prop.info.key = computation.info.key
-                    photo['Labels'].set_region_prop(prop.label, prop)
-            progr_dialog.setValue(progress_value + 1)
-        progr_dialog.hide()
+        """Starts computing the measurements in the background, `photo_assignments` is a list of
+        (photo index, {computation key: region labels})."""
+        if self.scheduler.is_running or self._measurements_job is not None:
+            return
+        computations_dict = self.computation_widget.computations_model.computations_dict
+        computations: typing.Dict[str, PropertyComputation] = {prop_key: computations_dict[prop_key]
+                                                               for _, to_compute in photo_assignments
+                                                               for prop_key in to_compute.keys()}
+        result_cache = self._project_result_cache()
+        storage = self.state.storage
+        # the scheduler runs its own pool of processes, the job only shows it next to the other jobs
+        self._measurements_job = ExternalJob(f'Computing properties using {self.scheduler.max_workers} processes',
+                                             sum(len(to_compute) for _, to_compute in photo_assignments),
+                                             start_fn=lambda: self.scheduler.start(storage,
+                                                                                   storage.default_label_image,
+                                                                                   photo_assignments, computations,
+                                                                                   result_cache),
+                                             cancel_fn=self.scheduler.cancel)
+        self._measurements_job.finished.connect(self._handle_measurements_job_finished)
+        self.job_engine.submit(self._measurements_job)
+
+    def _project_result_cache(self) -> typing.Optional[ResultCache]:
+        """The result cache in the folder of the current project, opened on the first use."""
+        path = self.state.storage.location / RESULT_CACHE_FILENAME
+        if self._result_cache is not None and self._result_cache.path != path:
+            self._result_cache.close()
+            self._result_cache = None
+        if self._result_cache is None:
+            try:
+                self._result_cache = ResultCache(path)
+            except Exception as e:
+                logger.warning(f'could not open the result cache {path}, all properties will be computed: {e}')
+        return self._result_cache
+
+    def _handle_measurements_progress(self, done: int, total: int):
+        if self._measurements_job is not None:
+            self._measurements_job.set_progress(done, total)
+
+    def _handle_measurements_done(self, cancelled: bool = False):
+        if self._measurements_job is not None:
+            self._measurements_job.complete(cancelled)
         self.update_measurements_view()
         self.unsaved_changes.emit()
 
+    def _handle_measurements_job_finished(self, _):
+        # also when the job is cancelled before it started
+        self._measurements_job = None
+
     def _handle_index_double_clicked(self, index: QModelIndex):
         prop: RegionProperty = self.model.data(index, Qt.UserRole + 4)
         if prop.prop_type != PropertyType.NDArray:
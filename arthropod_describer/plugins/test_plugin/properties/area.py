@@ -2,13 +2,12 @@ import copy
 import typing
 from typing import List, Optional
 
-import numpy as np
-
 from arthropod_describer.common.common import Info
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.plugin import PropertyComputation
-from arthropod_describer.common.regions_cache import RegionsCache, Region
+from arthropod_describer.common.region_stats import RegionStats
+from arthropod_describer.common.regions_cache import RegionsCache
 from arthropod_describer.common.units import Value
 from arthropod_describer.common.user_params import UserParam
 
@@ -19,6 +18,7 @@ class Area(PropertyComputation):
     NAME: Area
     DESCRIPTION: Area of the region (px or mm\u00b2)
     KEY: area
+    REQUIRES: region_stats
 
     USER_PARAMS:
         PARAM_NAME: Magic number
@@ -49,13 +49,15 @@ class Area(PropertyComputation):
         for region_label in region_labels:
             if region_label not in regions_cache.regions:
                 continue
-            region: Region = regions_cache.regions[region_label]
+            stats: RegionStats = regions_cache.intermediates.get('region_stats', region_label)
+            if stats is None:
+                continue
 
             prop = RegionProperty()
-            prop.label = region.label
+            prop.label = stats.label
             prop.info = copy.deepcopy(self.info)
             # prop.value = int(np.count_nonzero(lab_img == label))
-            value = Value(int(np.count_nonzero(region.mask)), self._px_unit * self._px_unit)
+            value = Value(stats.area, self._px_unit * self._px_unit)
             if photo.image_scale is not None and photo.image_scale.value > 0:
                 prop.value = value / (photo.image_scale * photo.image_scale)
                 # prop.unit = 'mm\u00b2'  # TODO sync unit with the units in Photo
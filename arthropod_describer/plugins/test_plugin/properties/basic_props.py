@@ -361,11 +361,12 @@ class BasicProperties:
         return props
 
     def _compute_mean_hsv(self, lab_img: np.ndarray, labels: typing.Set[int], photo: Photo,
-                                        lab_hier: LabelHierarchy) -> List[RegionProperty]:
+                          lab_hier: LabelHierarchy, hsv_img: Optional[np.ndarray] = None) -> List[RegionProperty]:
+        """`hsv_img` is the HSV version of `photo.image`, e.g. from `RegionsCache.data_storage`, it is not modified."""
         props: List[RegionProperty] = []
 
-        hsv_img = rgb2hsv(photo.image)
-        hsv_img[:, :, 0] = 360 * hsv_img[:, :, 0]
+        if hsv_img is None:
+            hsv_img = rgb2hsv(photo.image)
 
         reflection = photo['Reflections'].label_image
 
@@ -376,7 +377,7 @@ class BasicProperties:
             if len(ys) == 0:
                 continue
 
-            hues = hsv_img[ys, xs, 0]
+            hues = 360 * hsv_img[ys, xs, 0]
 
             hue_radians = np.pi * hues / 180.0
 
@@ -443,7 +444,7 @@ class BasicProperties:
 
 
         for level, level_labels in level_groups.items():
-            level_img = reg_img[level]
+            level_img = regions_cache.data_storage.level_image(level)
             for prop_str, labels in prop_labels.items():
                 level_labels_for_prop = labels.intersection(level_labels)
                 if prop_str == 'mean_intensity':
@@ -463,7 +464,8 @@ class BasicProperties:
                     _props = self._compute_contour_feature_vector(level_img, level_labels_for_prop, photo,
                                                                   reg_img.label_hierarchy)
                 elif prop_str == 'mean_hsv':
-                    _props = self._compute_mean_hsv(level_img, level_labels_for_prop, photo, reg_img.label_hierarchy)
+                    _props = self._compute_mean_hsv(level_img, level_labels_for_prop, photo, reg_img.label_hierarchy,
+                                                    regions_cache.data_storage.hsv)
                 else:
                     print(f'property {prop_str} not fully implemented')
                     _props = []
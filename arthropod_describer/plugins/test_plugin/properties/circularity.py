@@ -2,14 +2,12 @@ import copy
 import typing
 from typing import List, Optional
 
-import numpy as np
-import skimage
-
 from arthropod_describer.common.common import Info
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.plugin import PropertyComputation
-from arthropod_describer.common.regions_cache import RegionsCache, Region
+from arthropod_describer.common.region_stats import RegionStats
+from arthropod_describer.common.regions_cache import RegionsCache
 from arthropod_describer.common.units import Value, Unit, BaseUnit, SIPrefix
 from arthropod_describer.common.user_params import UserParam
 
@@ -20,6 +18,8 @@ class Circularity(PropertyComputation):
     NAME: Circularity
     DESCRIPTION: Circularity (0.0 to 1.0, where 1.0 = perfect circle)
     KEY: circularity
+    REQUIRES: region_stats
+    VERSION: 2
     """
     def __init__(self, info: Optional[Info] = None):
         super().__init__(info)
@@ -27,30 +27,19 @@ class Circularity(PropertyComputation):
     def __call__(self, photo: Photo, region_labels: typing.List[int], regions_cache: RegionsCache) -> \
             typing.List[RegionProperty]:
 
-        lab_img = photo['Labels'].label_image
-        reg_props = skimage.measure.regionprops_table(lab_img, photo.image,
-                                                      properties=['label', 'perimeter'])  #perimeter_measurement_flavor])
         props: List[RegionProperty] = []
 
-        for idx, label in enumerate(reg_props['label']):
-            if label not in region_labels:
+        for label in region_labels:
+            if label not in regions_cache.regions:
+                continue
+            stats: RegionStats = regions_cache.intermediates.get('region_stats', label)
+            if stats is None:
                 continue
-
-            perimeter = reg_props['perimeter'][idx]#[perimeter_measurement_flavor][idx]
-            area = int(np.count_nonzero(lab_img == label))
-            if perimeter == 0:
-                circularity = 0 # TODO: Careful about division by zero (can we somehow return N/A here?)
-            else:
-                circularity = np.clip((4 * np.pi * area) / (perimeter ** 2), 0.0, 1.0)
-            #print(f'idx: {idx}, label: {label}')
-            #print(f'  perimeter: {perimeter}')
-            #print(f'  area: {area}')
-            #print(f'  circularity: {circularity}')
 
             prop = RegionProperty()
             prop.label = int(label)
             prop.info = copy.deepcopy(self.info)
-            prop.value = Value(float(circularity), self._no_unit)
+            prop.value = Value(stats.circularity, self._no_unit)
             # prop.unit = '' # TODO: Is this ok for a unitless property?
             prop.prop_type = PropertyType.Scalar
             prop.val_names = [self.info.name]
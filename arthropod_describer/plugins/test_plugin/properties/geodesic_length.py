@@ -12,8 +12,8 @@ from arthropod_describer.common.plugin import PropertyComputation
 from arthropod_describer.common.regions_cache import RegionsCache, Region
 from arthropod_describer.common.units import Value
 from arthropod_describer.common.user_params import UserParam
-from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import compute_longest_geodesic, \
-    compute_longest_geodesic_perf
+# imported for its side effect: the module registers the geodesic `@intermediate`s this computation requires
+from arthropod_describer.plugins.test_plugin.properties import geodesic_utils  # noqa: F401
 
 
 class GeodesicLength(PropertyComputation):
@@ -22,6 +22,7 @@ class GeodesicLength(PropertyComputation):
     NAME: Geodesic length
     DESCRIPTION: Geodesic length (px or mm)
     KEY: geodesic_length
+    REQUIRES: longest_geodesic
     """
 
     def __init__(self, info: Optional[Info] = None):
@@ -35,10 +36,9 @@ class GeodesicLength(PropertyComputation):
             # _, length = get_longest_geodesic(lab_img, label)
             if label not in regions_cache.regions:
                 continue
-            region_obj = regions_cache.regions[label]
             # length, _, _ = compute_longest_geodesic(region_obj.mask)
             # skeleton = skeletonize(region_obj.mask)
-            length = compute_longest_geodesic_perf(region_obj.mask)
+            length, _, _ = regions_cache.intermediates.get('longest_geodesic', label)
             # compute_longest_geodesic(lab_img == label)
             if length < 0:
                 continue
@@ -1,5 +1,4 @@
 import math
-import queue
 import time
 from pathlib import Path
 
@@ -13,9 +12,13 @@ import skimage
 from skimage import io
 from skimage.morphology import skeletonize
 from skimage.measure import regionprops_table
+import scipy.sparse
 from scipy.ndimage import binary_fill_holes
+from scipy.sparse import csgraph
 import networkx
 
+from arthropod_describer.common.intermediates import intermediate, Intermediates
+
 
 golay_e: List[np.ndarray] = [
     np.array([
@@ -101,96 +104,14 @@ def find_skeleton_endpoints(skeleton: np.ndarray, e_letter_codes: List[int]) ->
 
 
 def geodesic_distance_for_skeleton(sk: np.ndarray, src: typing.Tuple[int, int]) -> np.ndarray:
-    pixels = np.argwhere(sk > 0)[:, ::-1]
-    q = queue.PriorityQueue()
-    unvisited: typing.Set[typing.Tuple[int, int]] = set()
-
-    dst_f = 99999999 * np.ones_like(sk, dtype=np.float32)
-
-    for pixel in pixels:
-        priority = 99999999
-        if pixel[0] == src[0] and pixel[1] == src[1]:
-            priority = 0
-            dst_f[pixel[1], pixel[0]] = 0
-        node = (int(pixel[0]), int(pixel[1]))
-        q.put((priority, node))
-        unvisited.add(node)
-
-    while not q.empty():
-        node_dst, node = q.get()
-        if node not in unvisited:
-            continue
-        dst_f[node[1], node[0]] = node_dst
-        unvisited.remove(node)
-
-        neighs = neighbors(node)
-
-        for neigh in neighs:
-            if neigh not in unvisited:
-                continue
-            dst = math.sqrt((neigh[0] - node[0]) * (neigh[0] - node[0]) +
-                            (neigh[1] - node[1]) * (neigh[1] - node[1]))
-            if (upd_dst := dst_f[node[1], node[0]] + dst) < dst_f[neigh[1], neigh[0]]:
-                dst_f[neigh[1], neigh[0]] = upd_dst
-                q.put((upd_dst, neigh))
-
-    dst_f = np.where(dst_f >= 99999, -1, dst_f)
-
-    return dst_f
+    """The geodesic distances of the pixels of `sk` from the pixel `src` (x, y), -1 outside `sk` and for the pixels
+    not reachable from `src`."""
+    return GeodesicGraph(sk > 0).distance_map(src)
 
 
 def find_shortest_path(bin_img: np.ndarray, src: Tuple[int, int], dst: Tuple[int, int]) -> List[Tuple[int, int]]:
-    pixels = np.argwhere(bin_img > 0)[:, ::-1]
-    q = queue.PriorityQueue()
-    unvisited: typing.Set[typing.Tuple[int, int]] = set()
-
-    dst_f = 99999999 * np.ones_like(bin_img, dtype=np.float32)
-
-    for pixel in pixels:
-        priority = 99999999
-        if pixel[0] == src[0] and pixel[1] == src[1]:
-            priority = 0
-            dst_f[pixel[1], pixel[0]] = 0
-        node = (int(pixel[0]), int(pixel[1]))
-        q.put((priority, node))
-        unvisited.add(node)
-
-    parents: typing.Dict[Tuple[int, int], Tuple[int, int]] = {src: src}
-
-    while not q.empty():
-        node_dst, node = q.get()
-        if node not in unvisited:
-            continue
-        dst_f[node[1], node[0]] = node_dst
-        unvisited.remove(node)
-
-        if node == dst:
-            break
-
-        neighs = neighbors(node)
-
-        for neigh in neighs:
-            if neigh not in unvisited:
-                continue
-            dist = math.sqrt((neigh[0] - node[0]) * (neigh[0] - node[0]) +
-                            (neigh[1] - node[1]) * (neigh[1] - node[1]))
-            if (upd_dst := dst_f[node[1], node[0]] + dist) < dst_f[neigh[1], neigh[0]]:
-                dst_f[neigh[1], neigh[0]] = upd_dst
-                q.put((upd_dst, neigh))
-                parents[neigh] = node
-
-    # dst_f = np.where(dst_f >= 99999, -1, dst_f)
-
-    px_path: List[Tuple[int, int]] = []
-
-    curr_px = dst
-
-    while curr_px != src:
-        px_path.append(curr_px)
-        curr_px = parents[curr_px]
-    px_path.append(src)
-
-    return px_path
+    """The pixels (x, y) of the shortest path in `bin_img` from `dst` back to `src`."""
+    return GeodesicGraph(bin_img > 0).shortest_path(dst, src)
 
 
 def get_graph(bin_region: np.ndarray) -> networkx.Graph:
@@ -413,52 +334,116 @@ def compute_longest_geodesic_perf(region: np.ndarray) -> float:
 
 
 def compute_longest_geodesic(region: np.ndarray) -> Tuple[float, Tuple[int, int], Tuple[int, int]]:
-    # path = Path('C:\\Users\\radoslav\\Desktop\\')
-    # bbox = cv2.boundingRect(region.astype(np.uint8))
-    _region = region  #region[bbox[1]:bbox[1]+bbox[3], bbox[0]:bbox[0]+bbox[2]]
-
-    yy, xx = np.nonzero(_region)
-
-    if len(yy) == 0:
-        return -1.0, (0, 0), (0, 0)
-
-    min_idx = np.argmin(xx)
-    out_pixel = (yy[min_idx], xx[min_idx])
-
-    gdist1 = geodesic_distance_for_skeleton(_region, out_pixel[::-1])
-
-    dst_pix = np.unravel_index(np.argmax(gdist1), gdist1.shape)
-
-    gdist2 = geodesic_distance_for_skeleton(_region, dst_pix[::-1])
-
-    dst_pix2 = np.unravel_index(np.argmax(gdist2), gdist2.shape)
-
-    gdist3 = geodesic_distance_for_skeleton(_region, dst_pix2[::-1])
-
-    dst_pix3 = np.unravel_index(np.argmax(gdist3), gdist3.shape)
-
-    # prop_func = gdist2 + gdist3
-    #
-    # prop_max = np.max(prop_func)
-    #
-    # path_pixels = np.nonzero(np.abs(prop_func - prop_max) < 1e-4)
-    #
-
-    # path_pixels = find_shortest_path(_region, dst_pix2[::-1], dst_pix3[::-1])
-    # path_pixels = ([px[1] for px in path_pixels], [px[0] for px in path_pixels])
-
-    # bgr_region = cv2.cvtColor(255 * _region.astype(np.uint8), cv2.COLOR_GRAY2BGR)
-    #
-    # bgr_region[path_pixels[0], path_pixels[1]] = [0, 255, 255]
-    # bgr_region[out_pixel[0], out_pixel[1]] = [0, 255, 0]
-    # bgr_region[dst_pix[0], dst_pix[1]] = [255, 0, 0]
-    # bgr_region[dst_pix2[0], dst_pix2[1]] = [0, 0, 255]
-    # bgr_region[dst_pix3[0], dst_pix3[1]] = [255, 0, 255]
-    #
-    # cv2.imwrite(str(path / 'region.png'), 255 * _region.astype(np.uint8))
-    # cv2.imwrite(str(path / 'out_pixel.png'), bgr_region)
-    # cv2.imshow('bgr_', bgr_region)
-    # cv2.waitKey(0)
-    # cv2.destroyAllWindows()
-
-    return np.max(gdist3), dst_pix2[::-1], dst_pix3[::-1]
+    """The length and the end pixels (x, y) of the longest geodesic of `region`, see `GeodesicGraph.longest_geodesic`,
+    the length is -1 for an empty region."""
+    return GeodesicGraph(region > 0).longest_geodesic()
+
+
+class GeodesicGraph:
+    """The 8-connected graph of the pixels of a binary mask, weighted by the distances of the pixels, stored as a
+    sparse CSR matrix, so that the geodesic distances are computed by `scipy.sparse.csgraph.dijkstra`.
+
+    The nodes are the pixels of the mask in row-major order, pixels are passed in and returned as (x, y).
+    """
+    # (dy, dx, weight) of the neighbours every edge is created from, so that every edge is created once
+    EDGE_OFFSETS: List[Tuple[int, int, float]] = [(0, 1, 1.0), (1, -1, math.sqrt(2)), (1, 0, 1.0),
+                                                  (1, 1, math.sqrt(2))]
+
+    def __init__(self, mask: np.ndarray):
+        mask = mask.astype(bool, copy=False)
+        self.shape: Tuple[int, int] = mask.shape
+        self.yy, self.xx = np.nonzero(mask)
+        # node indices of the pixels, -1 for the background and the 1 pixel wide border around the mask
+        self._node_ids = np.full((mask.shape[0] + 2, mask.shape[1] + 2), -1, dtype=np.int64)
+        self._node_ids[1:-1, 1:-1][self.yy, self.xx] = np.arange(len(self.yy))
+        height, width = mask.shape
+        srcs, dsts, weights = [], [], []
+        for dy, dx, weight in self.EDGE_OFFSETS:
+            src_ids = self._node_ids[1:-1, 1:-1]
+            dst_ids = self._node_ids[1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx]
+            valid = np.logical_and(src_ids >= 0, dst_ids >= 0)
+            srcs.append(src_ids[valid])
+            dsts.append(dst_ids[valid])
+            weights.append(np.full(len(srcs[-1]), weight))
+        self.csr = scipy.sparse.csr_matrix((np.concatenate(weights), (np.concatenate(srcs), np.concatenate(dsts))),
+                                           shape=(self.node_count, self.node_count))
+
+    @property
+    def node_count(self) -> int:
+        return len(self.yy)
+
+    def node(self, pixel: Tuple[int, int]) -> int:
+        """The node of the pixel (x, y), -1 if the pixel is not in the mask."""
+        x, y = pixel
+        if not (0 <= y < self.shape[0] and 0 <= x < self.shape[1]):
+            return -1
+        return int(self._node_ids[y + 1, x + 1])
+
+    def pixel(self, node: int) -> Tuple[int, int]:
+        return int(self.xx[node]), int(self.yy[node])
+
+    def distances(self, src: Tuple[int, int], return_predecessors: bool = False):
+        """The geodesic distances of all the nodes from the pixel `src`, inf for unreachable nodes, and optionally
+        the predecessors of the nodes on the shortest paths from `src`."""
+        return csgraph.dijkstra(self.csr, directed=False, indices=self.node(src),
+                                return_predecessors=return_predecessors)
+
+    def distance_map(self, src: Tuple[int, int]) -> np.ndarray:
+        """The geodesic distances from the pixel `src` as an image, -1 outside the mask and for unreachable pixels."""
+        dst_f = -np.ones(self.shape, dtype=np.float32)
+        if self.node(src) < 0:
+            return dst_f
+        dists = self.distances(src)
+        dst_f[self.yy, self.xx] = np.where(np.isinf(dists), -1, dists)
+        return dst_f
+
+    def shortest_path(self, src: Tuple[int, int], dst: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """The pixels (x, y) of the shortest path from `src` to `dst`, both included, empty if there is none."""
+        src_node, dst_node = self.node(src), self.node(dst)
+        if src_node < 0 or dst_node < 0:
+            return []
+        _, predecessors = self.distances(dst, return_predecessors=True)
+        if src_node != dst_node and predecessors[src_node] < 0:
+            return []
+        path = [src_node]
+        while path[-1] != dst_node:
+            path.append(int(predecessors[path[-1]]))
+        return [self.pixel(node) for node in path]
+
+    def longest_geodesic(self) -> Tuple[float, Tuple[int, int], Tuple[int, int]]:
+        """Approximates the longest geodesic by three sweeps, each from the pixel farthest from the previous start,
+        the first one from the leftmost pixel. Returns the length and the end pixels (x, y), the length is -1 for an
+        empty mask."""
+        if self.node_count == 0:
+            return -1.0, (0, 0), (0, 0)
+        src = self.pixel(int(np.argmin(self.xx)))
+        for _ in range(2):
+            src = self.pixel(self._farthest(self.distances(src)))
+        dists = self.distances(src)
+        dst = self._farthest(dists)
+        return float(dists[dst]), src, self.pixel(dst)
+
+    @staticmethod
+    def _farthest(dists: np.ndarray) -> int:
+        return int(np.argmax(np.where(np.isinf(dists), -1, dists)))
+
+
+@intermediate('geodesic_graph', requires=('mask',))
+def _geodesic_graph(intermediates: Intermediates, label: int) -> GeodesicGraph:
+    return GeodesicGraph(intermediates.get('mask', label))
+
+
+@intermediate('longest_geodesic', requires=('geodesic_graph',))
+def _longest_geodesic(intermediates: Intermediates, label: int) -> Tuple[float, Tuple[int, int], Tuple[int, int]]:
+    """The length and the end pixels (x, y), in the coordinates of the region's bounding box, of the longest geodesic
+    of the region, see `GeodesicGraph.longest_geodesic`. The length is -1 for an empty region."""
+    return intermediates.get('geodesic_graph', label).longest_geodesic()
+
+
+@intermediate('longest_geodesic_path', requires=('geodesic_graph', 'longest_geodesic'))
+def _longest_geodesic_path(intermediates: Intermediates, label: int) -> List[Tuple[int, int]]:
+    """The pixels (x, y) of the longest geodesic of the region, in the coordinates of the region's bounding box."""
+    length, src, dst = intermediates.get('longest_geodesic', label)
+    if length < 0:
+        return []
+    return intermediates.get('geodesic_graph', label).shortest_path(src, dst)
@@ -0,0 +1,185 @@
+import copy
+import math
+import typing
+
+import numba
+import numpy as np
+from skimage import img_as_ubyte
+
+from arthropod_describer.common.common import Info
+from arthropod_describer.common.intermediates import intermediate, Intermediates
+from arthropod_describer.common.label_image import RegionProperty, PropertyType
+from arthropod_describer.common.photo import Photo
+from arthropod_describer.common.regions_cache import RegionsCache
+from arthropod_describer.common.units import UnitStore, convert_value
+
+DISTANCES_IN_MM = [0.02, 0.04, 0.06]  # The GLCM will be calculated for these distances (in mm). TODO: Allow this to be user-specified (at least from some config file).
+ANGLES = [0, np.pi / 2, np.pi, 3 * np.pi / 2]  # The GLCM will be calculated for these angles (in radians). TODO: Maybe turn on the symmetry in graycomatrix(), and only use half the range of the angles?
+GLCM_PROPS = ['contrast', 'dissimilarity', 'homogeneity', 'ASM', 'energy', 'correlation']  # the `graycoprops` properties
+
+
+def glcm_distances(photo: Photo) -> typing.Tuple[int, ...]:
+    """`DISTANCES_IN_MM` in pixels of `photo`, or 1, 2, 3 px if the photo has no scale."""
+    if photo.image_scale is not None and photo.image_scale.value > 0:
+        unit_store = UnitStore()
+        scale_in_px_per_mm = convert_value(photo.image_scale, unit_store.units["px/mm"])
+        return tuple(round(x * scale_in_px_per_mm.value) for x in DISTANCES_IN_MM)
+    return 1, 2, 3
+
+
+def glcm_offsets(distances: typing.Sequence[int], angles: typing.Sequence[float]) -> np.ndarray:
+    """The (row offset, column offset, distance index, angle index) of every pair of `distances` and `angles`,
+    rounded the same way as in `graycomatrix`."""
+    def round_half_away(x: float) -> int:
+        return int(math.copysign(math.floor(abs(x) + 0.5), x))
+
+    return np.array([(round_half_away(math.sin(angle) * distance), round_half_away(math.cos(angle) * distance),
+                      d_idx, a_idx)
+                     for a_idx, angle in enumerate(angles) for d_idx, distance in enumerate(distances)],
+                    dtype=np.int64).reshape(-1, 4)
+
+
+@numba.njit
+def _masked_cooccurrence(values: np.ndarray, mask: np.ndarray, level_indices: np.ndarray, offsets: np.ndarray,
+                         out: np.ndarray):
+    rows, cols = values.shape
+    for r in range(rows):
+        for c in range(cols):
+            if not mask[r, c]:
+                continue
+            i = level_indices[values[r, c]]
+            for k in range(offsets.shape[0]):
+                rr, cc = r + offsets[k, 0], c + offsets[k, 1]
+                if 0 <= rr < rows and 0 <= cc < cols and mask[rr, cc]:
+                    out[i, level_indices[values[rr, cc]], offsets[k, 2], offsets[k, 3]] += 1
+
+
+def masked_cooccurrence(values: np.ndarray, mask: np.ndarray, distances: typing.Sequence[int],
+                        angles: typing.Sequence[float], levels: int = 256) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """The grey level co-occurrence matrix of `values`, integers in [0, `levels`), counting only the pairs of pixels
+    that both lie in `mask`. All the distances and angles are accumulated in one pass over the pixels.
+
+    Only the grey levels present in the region get a row and a column, the others would be all zeros. Returns the
+    present levels (K,) and the matrix (K, K, distances, angles), `graycomatrix`'s matrix restricted to them.
+    """
+    mask = np.ascontiguousarray(mask, dtype=np.bool_)
+    level_values = np.flatnonzero(np.bincount(values[mask], minlength=levels))
+    level_indices = np.zeros(levels, dtype=np.int64)
+    level_indices[level_values] = np.arange(len(level_values))
+    out = np.zeros((len(level_values), len(level_values), len(distances), len(angles)), dtype=np.uint32)
+    _masked_cooccurrence(np.ascontiguousarray(values), mask, level_indices, glcm_offsets(distances, angles), out)
+    return level_values, out
+
+
+def glcm_properties(level_values: np.ndarray, glcm: np.ndarray) -> typing.Dict[str, np.ndarray]:
+    """All the `GLCM_PROPS` (distances, angles) of a matrix of `masked_cooccurrence` whose rows and columns are the
+    grey levels `level_values`, computed as `graycoprops` computes them from the full matrix."""
+    P = glcm.astype(np.float64)
+    glcm_sums = np.sum(P, axis=(0, 1), keepdims=True)
+    glcm_sums[glcm_sums == 0] = 1
+    P /= glcm_sums
+
+    I = level_values.astype(np.float64).reshape((-1, 1, 1, 1))
+    J = level_values.astype(np.float64).reshape((1, -1, 1, 1))
+    props = {
+        'contrast': np.sum(P * (I - J) ** 2, axis=(0, 1)),
+        'dissimilarity': np.sum(P * np.abs(I - J), axis=(0, 1)),
+        'homogeneity': np.sum(P / (1. + (I - J) ** 2), axis=(0, 1)),
+        'ASM': np.sum(P ** 2, axis=(0, 1)),
+    }
+    props['energy'] = np.sqrt(props['ASM'])
+
+    diff_i = I - np.sum(I * P, axis=(0, 1))
+    diff_j = J - np.sum(J * P, axis=(0, 1))
+    std_i = np.sqrt(np.sum(P * diff_i ** 2, axis=(0, 1)))
+    std_j = np.sqrt(np.sum(P * diff_j ** 2, axis=(0, 1)))
+    cov = np.sum(P * (diff_i * diff_j), axis=(0, 1))
+    correlation = np.ones_like(cov)
+    valid = (std_i >= 1e-15) & (std_j >= 1e-15)
+    correlation[valid] = cov[valid] / (std_i[valid] * std_j[valid])
+    props['correlation'] = correlation
+    return props
+
+
+def quantise(channel: np.ndarray, levels: typing.Optional[int] = None) -> typing.Tuple[np.ndarray, int]:
+    """Converts `channel` to uint8 and quantises it to `levels` grey levels, returns the quantised values and the
+    number of levels. With `levels` None, the 255 levels of the former `graycomatrix` based computation are used,
+    the values 254 and 255 sharing the last one."""
+    values = img_as_ubyte(channel)
+    if levels is None:
+        return np.minimum(values, 254), 255
+    return ((values.astype(np.uint16) * levels) >> 8).astype(np.uint8), levels
+
+
+@intermediate('glcm', requires=('mask', 'hsv'))
+def _glcm(intermediates: Intermediates, label: int, distances: typing.Optional[typing.Tuple[int, ...]] = None,
+          levels: typing.Optional[int] = None) -> typing.List[typing.Tuple[np.ndarray, np.ndarray]]:
+    """The GLCMs of the H, S and V channels of the region without the reflections, for `distances`
+    (`glcm_distances` by default) and `ANGLES`, with the channels quantised to `levels` grey levels, see
+    `quantise`. Every GLCM comes with the grey levels of its rows and columns, see `masked_cooccurrence`."""
+    photo = intermediates.photo
+    if distances is None:
+        distances = glcm_distances(photo)
+    top, left, height, width = intermediates.regions_cache.regions[label].bbox
+    refl_roi = photo['Reflections'].label_image[top:top + height, left:left + width]
+
+    current_region_mask = np.logical_and(intermediates.get('mask', label), refl_roi == 0)
+    photo_image_hsv_roi = intermediates.get('hsv', label)
+
+    filtered_glcms: typing.List[typing.Tuple[np.ndarray, np.ndarray]] = []
+    for current_channel in range(3):
+        values, channel_levels = quantise(photo_image_hsv_roi[:, :, current_channel], levels)
+        filtered_glcms.append(masked_cooccurrence(values, current_region_mask, distances, ANGLES, channel_levels))
+    return filtered_glcms
+
+
+@intermediate('glcm_props', requires=('glcm',))
+def _glcm_props(intermediates: Intermediates, label: int,
+                distances: typing.Optional[typing.Tuple[int, ...]] = None) -> typing.Dict[str, np.ndarray]:
+    """All the `GLCM_PROPS` of the region, each as an array (channel, distance, angle), derived from the GLCMs of
+    the region."""
+    filtered_glcms = intermediates.get('glcm', label) if distances is None else \
+        intermediates.get('glcm', label, distances)
+    channel_props = [glcm_properties(level_values, glcm) for level_values, glcm in filtered_glcms]
+    return {glcm_prop: np.array([props[glcm_prop] for props in channel_props]) for glcm_prop in GLCM_PROPS}
+
+
+class GLCMPropertyView:
+    """The common part of the GLCM property computations, each of which only takes its `GLCM_PROP` from the
+    'glcm_props' intermediate, so the GLCMs and their properties are computed once per region for all of them.
+
+    Not a `PropertyComputation` itself, so that the plugin loader does not register it, the computations derive from
+    both.
+    """
+    GLCM_PROP: str = ''
+
+    def __call__(self, photo: Photo, region_labels: typing.List[int], regions_cache: RegionsCache) -> \
+            typing.List[RegionProperty]:
+        props: typing.List[RegionProperty] = []
+        for label in region_labels:
+            if label not in regions_cache.regions:
+                continue
+            prop = self.example(self.info.key)
+            prop.label = int(label)
+            prop.value = (regions_cache.intermediates.get('glcm_props', label)[self.GLCM_PROP], self._no_unit)
+            props.append(prop)
+        return props
+
+    @property
+    def computes(self) -> typing.Dict[str, Info]:
+        return {self.info.key: self.info}
+
+    def example(self, prop_name: str) -> RegionProperty:
+        prop = RegionProperty()
+        prop.label = 0
+        prop.value = None
+        prop.val_names = ['H', 'S', 'V']
+        prop.row_names = [f'distance {distance} mm' for distance in DISTANCES_IN_MM]
+        prop.col_names = ['angle 0°', 'angle 90°', 'angle 180°', 'angle 270°']
+        prop.num_vals = 3
+        prop.prop_type = PropertyType.NDArray
+        prop.info = copy.deepcopy(self.info)
+        return prop
+
+    def target_worksheet(self, prop_name: str) -> str:
+        return "GLCM"
@@ -2,10 +2,8 @@ import copy
 import typing
 from typing import Optional
 
-import numpy as np
-import skimage
-
 from arthropod_describer.common.common import Info
+from arthropod_describer.common.feret import FeretDiameters
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.plugin import PropertyComputation
@@ -20,6 +18,7 @@ class MaxFeret(PropertyComputation):
     NAME: Max feret diameter
     DESCRIPTION: Maximum Feret diameter (px or mm)
     KEY: max_feret
+    REQUIRES: feret
     """
     def __init__(self, info: Optional[Info] = None):
         super().__init__(info)
@@ -31,14 +30,12 @@ class MaxFeret(PropertyComputation):
         for label in region_labels:
             if label not in regions_cache.regions:
                 continue
-            region_obj = regions_cache.regions[label]
-            reg_props = skimage.measure.regionprops_table(region_obj.mask.astype(np.uint8), region_obj.image,
-                                                          properties=['label', 'feret_diameter_max'])
+            feret: FeretDiameters = regions_cache.intermediates.get('feret', label)
 
             prop = RegionProperty()
             prop.label = int(label)
             prop.info = copy.deepcopy(self.info)
-            prop.value = Value(float(reg_props['feret_diameter_max'][0]), self._px_unit)
+            prop.value = Value(feret.max, self._px_unit)
             if photo.image_scale is not None and photo.image_scale.value > 0:
                 prop.value = prop.value / photo.image_scale
                 prop.unit = 'mm'  # TODO sync unit with the units in Photo
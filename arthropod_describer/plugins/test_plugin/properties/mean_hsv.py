@@ -2,14 +2,12 @@ import copy
 import typing
 from typing import Optional
 
-import numpy as np
-from skimage.color import rgb2hsv
-
 from arthropod_describer.common.common import Info
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.plugin import PropertyComputation
-from arthropod_describer.common.regions_cache import RegionsCache, Region
+from arthropod_describer.common.region_stats import RegionStats
+from arthropod_describer.common.regions_cache import RegionsCache
 from arthropod_describer.common.user_params import UserParam
 
 
@@ -19,6 +17,7 @@ class MeanHSV(PropertyComputation):
     NAME: Mean HSV
     DESCRIPTION: Mean HSV of a region
     KEY: mean_hsv
+    REQUIRES: region_stats
     """
     def __init__(self, info: Optional[Info] = None):
         super().__init__(info)
@@ -28,40 +27,15 @@ class MeanHSV(PropertyComputation):
 
         props: typing.List[RegionProperty] = []
 
-        lab_img = photo['Labels']
-        hsv_img = rgb2hsv(photo.image)
-        hsv_img[:, :, 0] = 360 * hsv_img[:, :, 0]
-
-        reflection = photo['Reflections'].label_image
-
         for label in region_labels:
-            region_mask = np.logical_and(lab_img.mask_for(label), reflection == 0)
-            ys, xs = np.nonzero(region_mask)
-
-            if len(ys) == 0:
+            if label not in regions_cache.regions:
+                continue
+            stats: RegionStats = regions_cache.intermediates.get('region_stats', label)
+            if stats is None or stats.mean_hsv is None:
                 continue
-
-            hues = hsv_img[ys, xs, 0]
-
-            hue_radians = np.pi * hues / 180.0
-
-            avg_sin = np.mean(np.sin(hue_radians))
-            avg_cos = np.mean(np.cos(hue_radians))
-
-            average_vector_angle = np.arctan2(avg_sin, avg_cos)
-
-            average_vector_degrees = np.mod((180.0 / np.pi) * average_vector_angle, 360)
-
-            average_vector_length = np.sqrt(avg_sin * avg_sin + avg_cos * avg_cos)
-
-            mean_sat = np.mean(hsv_img[ys, xs, 1])
-            mean_val = np.mean(hsv_img[ys, xs, 2])
 
             prop = copy.deepcopy(self.example('mean_hsv'))
-            prop.value = ([float(average_vector_degrees),
-                           100 * float(mean_sat * average_vector_length),
-                           100 * float(mean_val)],
-                          self._no_unit)
+            prop.value = (stats.mean_hsv, self._no_unit)
             prop.label = label
             props.append(prop)
 
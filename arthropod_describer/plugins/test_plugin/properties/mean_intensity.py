@@ -2,13 +2,12 @@ import copy
 import typing
 from typing import Optional
 
-import numpy as np
-
 from arthropod_describer.common.common import Info
 from arthropod_describer.common.label_image import RegionProperty, PropertyType
 from arthropod_describer.common.photo import Photo
 from arthropod_describer.common.plugin import PropertyComputation
-from arthropod_describer.common.regions_cache import RegionsCache, Region
+from arthropod_describer.common.region_stats import RegionStats
+from arthropod_describer.common.regions_cache import RegionsCache
 from arthropod_describer.common.user_params import UserParam
 
 
@@ -18,6 +17,8 @@ class MeanIntensity(PropertyComputation):
     NAME: Mean intensity
     DESCRIPTION: Mean intensity (R, G, B)
     KEY: mean_intensity
+    REQUIRES: region_stats
+    VERSION: 2
     """
     def __init__(self, info: Optional[Info] = None):
         super().__init__(info)
@@ -26,28 +27,18 @@ class MeanIntensity(PropertyComputation):
             typing.List[RegionProperty]:
 
         props: typing.List[RegionProperty] = []
-        refl = photo['Reflections'].label_image
 
         for region_label in region_labels:
             if region_label not in regions_cache.regions:
                 continue
-            region: Region = regions_cache.regions[region_label]
-
-            top, left, height, width = region.bbox
-            refl_roi = refl[top:top + height, left:left + width]
-
-            mask = np.logical_xor(region.mask, refl_roi > 0)
-
-            yy, xx = np.nonzero(mask)
-
-            pixels = region.image[yy, xx]
-
-            mean_intensity = np.mean(pixels, axis=0)
+            stats: RegionStats = regions_cache.intermediates.get('region_stats', region_label)
+            if stats is None or stats.mean_rgb is None:
+                continue
 
             prop = RegionProperty()
             prop.info = copy.deepcopy(self.example('mean_intensity').info)
-            prop.label = int(region.label)
-            prop.value = (mean_intensity.tolist(), self._no_unit)
+            prop.label = int(stats.label)
+            prop.value = (stats.mean_rgb, self._no_unit)
             prop.prop_type = PropertyType.Intensity
             prop.num_vals = 3
             prop.val_names = ['R', 'G', 'B']
@@ -13,8 +13,26 @@ from arthropod_describer.common.plugin import PropertyComputation
 from arthropod_describer.common.regions_cache import RegionsCache, Region
 from arthropod_describer.common.units import Value
 from arthropod_describer.common.user_params import UserParam
-from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import compute_longest_geodesic, \
-    find_shortest_path
+# imported for its side effect: the module registers the geodesic `@intermediate`s this computation requires
+from arthropod_describer.plugins.test_plugin.properties import geodesic_utils  # noqa: F401
+
+
+def region_mean_width(mask: np.ndarray, bbox: typing.Tuple[int, int, int, int], image_shape: typing.Tuple[int, int],
+                      path: typing.List[typing.Tuple[int, int]]) -> float:
+    """Twice the mean distance of the pixels (x, y) of `path`, in the coordinates of the bounding box `bbox`, from the
+    background of the eroded region `mask`, NaN for an empty path. Only the bounding box padded by one pixel, where it
+    does not touch the border of the image of `image_shape` (height, width), is processed, which gives the same
+    distances as processing the whole image."""
+    if len(path) == 0:
+        return float('nan')
+    top, left, height, width = bbox
+    pad_top, pad_left = min(top, 1), min(left, 1)
+    pad_bottom, pad_right = min(image_shape[0] - top - height, 1), min(image_shape[1] - left - width, 1)
+    roi = np.pad(mask, ((pad_top, pad_bottom), (pad_left, pad_right)))
+    eroded = binary_erosion(roi, footprint=np.ones((3, 3), dtype=np.uint8))
+    dst: np.ndarray = scipy.ndimage.distance_transform_edt(eroded)
+    rows, cols = [pad_top + px[1] for px in path], [pad_left + px[0] for px in path]
+    return float(np.mean(2.0 * dst[rows, cols]))
 
 
 class MeanWidth(PropertyComputation):
@@ -23,6 +41,7 @@ class MeanWidth(PropertyComputation):
     NAME: Mean width
     DESCRIPTION: Mean width of a region (px or mm)
     KEY: mean_width
+    REQUIRES: longest_geodesic_path
     """
 
     def __init__(self, info: Optional[Info] = None):
@@ -30,21 +49,15 @@ class MeanWidth(PropertyComputation):
 
     def __call__(self, photo: Photo, region_labels: typing.List[int], regions_cache: RegionsCache) -> \
             typing.List[RegionProperty]:
-        lab_img = photo['Labels']
         props: typing.List[RegionProperty] = []
 
         for label in region_labels:
-            bin_img = lab_img.mask_for(label)
-            if not np.any(bin_img):
+            if label not in regions_cache.regions:
                 continue
-            # geodesic, length, bbox = get_longest_geodesic2(bin_img)
-            # bin_roi = bin_img[bbox[0]:bbox[1]+1, bbox[2]:bbox[3]+1]
-            gdist, px1, px2 = compute_longest_geodesic(bin_img)
-            geodesic = find_shortest_path(bin_img, px1, px2)
-            geodesic = ([px[1] for px in geodesic], [px[0] for px in geodesic])
-            outline = np.logical_and(bin_img, binary_erosion(bin_img, footprint=np.ones((3, 3), dtype=np.uint8)))
-            dst: np.ndarray = scipy.ndimage.distance_transform_edt(outline)
-            mean_width = np.mean(2.0 * dst[geodesic[0], geodesic[1]])
+            region: Region = regions_cache.regions[label]
+            geodesic = regions_cache.intermediates.get('longest_geodesic_path', label)
+            mean_width = region_mean_width(region.mask, region.bbox, (photo.image_size[1], photo.image_size[0]),
+                                           geodesic)
             if np.isnan(mean_width):
                 # TODO inspect `get_longest_geodesic2` function
                 mean_width = -42.0
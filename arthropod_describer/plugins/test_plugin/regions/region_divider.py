@@ -8,8 +8,7 @@ from arthropod_describer.common.label_image import LabelImg
 from arthropod_describer.common.photo import Photo
 
 from arthropod_describer.common.plugin import RegionComputation
-from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import get_longest_geodesic2, \
-    geodesic_distance_for_skeleton
+from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import get_longest_geodesic2, GeodesicGraph
 
 
 class RegionDivider(RegionComputation):
@@ -45,9 +44,10 @@ class RegionDivider(RegionComputation):
 
             geod_dsts: np.ndarray = np.zeros((region_.shape[0], region_.shape[1], num_sections+1), dtype=np.float32)
             geod_dsts[:, :, 0] = 99999.0
+            graph = GeodesicGraph(region_)
             for i, lab_child in enumerate(lab_hier.children[label]):
                 section_mid = geodesic[i * step + step // 2]
-                geod_dst = geodesic_distance_for_skeleton(region_, section_mid)
+                geod_dst = graph.distance_map((int(section_mid[0]), int(section_mid[1])))
                 geod_dst = np.where(geod_dst < 0, 999999.0, geod_dst)
                 geod_dsts[:, :, i+1] = geod_dst
 
@@ -1,23 +1,41 @@
+import itertools
+import logging
 import os
+import queue
 import re
+import threading
 import typing
 from pathlib import Path
 from typing import List, Optional
 
 from PIL import Image
 from PySide2 import QtGui, QtCore
-from PySide2.QtCore import QObject, Qt, QSize, QRectF
-from PySide2.QtGui import QImage
+from PySide2.QtCore import QObject, Qt, QSize, QRectF, Signal
+from PySide2.QtGui import QImage, QColor
 from PySide2.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QWidget
 
 from arthropod_describer.common.local_storage import Storage
 from arthropod_describer.common.photo import UpdateContext, Photo
 from arthropod_describer.common.storage import IMAGE_REFEX
 
+logger = logging.getLogger("model.thumbnail_storage")
+
+
+PRIORITY_VISIBLE = 0
+PRIORITY_DEFAULT = 1
+
 
 class ThumbnailStorage_(Storage):
+    """Loads the thumbnails from `<project>/.thumbnails`, generating the missing ones, in worker threads.
+
+    Until its thumbnail is ready, a photo is represented by a placeholder. Finished thumbnails are announced with
+    `update_photo`. Thumbnails of the rows visible in the image list can be moved to the front of the queue with
+    `prioritize`.
+    """
+    _thumbnail_ready = Signal(str, QImage)  # emitted from the worker threads, delivered in the GUI thread
+
     def __init__(self, storage: Storage, thumbnail_size: typing.Tuple[int, int] = (248, 128),
-                 parent: Optional[QObject] = None):
+                 parent: Optional[QObject] = None, worker_count: int = min(4, os.cpu_count() or 1)):
         super().__init__(parent)
         self._main_storage: Storage = storage
         self._main_storage.storage_update.connect(self._handle_storage_update)
@@ -28,22 +46,96 @@ class ThumbnailStorage_(Storage):
             os.mkdir(self._location)
 
         self.thumbnail_size: typing.Tuple[int, int] = thumbnail_size
+        self._placeholder = QImage(QSize(*thumbnail_size), QImage.Format_RGB32)
+        self._placeholder.fill(QColor.fromRgb(200, 200, 200))
+        self._thumbnails: typing.Dict[str, QImage] = {}
+
+        # (priority, sequence number, image name, path to the photo, whether to generate the thumbnail again)
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._done: typing.Set[str] = set()  # accessed from the worker threads, guarded by `self._lock`
+        self._prioritized: typing.Set[str] = set()  # queued by `prioritize`, used in the GUI thread only
+        self._thumbnail_ready.connect(self._handle_thumbnail_ready)
+        self._workers = [threading.Thread(target=self._work, name=f'thumbnails_{i}', daemon=True)
+                         for i in range(max(1, worker_count))]
+        for worker in self._workers:
+            worker.start()
         self._load_thumbnails()
 
     def _load_thumbnails(self):
-        for img in self._main_storage.images:
-            if not (self._location / img.image_path.name).exists():
-                self._generate_thumbnail(img)
-            else:
-                with Image.open(self._location / img.image_name) as im:
-                    img.thumbnail = im.toqimage()
-
-    def _generate_thumbnail(self, photo: Photo):
-        with Image.open(photo.image_path) as im:
+        for img_name, img_path in zip(self._main_storage.image_names, self._main_storage.image_paths):
+            self._request(img_name, Path(img_path), PRIORITY_DEFAULT)
+
+    def _request(self, img_name: str, img_path: Path, priority: int, regenerate: bool = False):
+        if regenerate:
+            with self._lock:
+                self._done.discard(img_name)
+        self._queue.put((priority, next(self._sequence), img_name, img_path, regenerate))
+
+    def prioritize(self, img_names: typing.Iterable[str]):
+        """Moves the thumbnails of `img_names`, e.g. of the rows visible in the image list, to the front of the queue.
+        Thumbnails already queued with the visible priority are not queued again."""
+        with self._lock:
+            pending = [img_name for img_name in img_names
+                       if img_name not in self._done and img_name not in self._prioritized]
+        for img_name in pending:
+            if (idx := self._main_storage.index_of(img_name)) is None:
+                continue
+            self._prioritized.add(img_name)
+            self._request(img_name, Path(self._main_storage.image_paths[idx]), PRIORITY_VISIBLE)
+
+    def thumbnail(self, img_name: str) -> QImage:
+        """Returns the thumbnail of `img_name` or a placeholder if it is not loaded yet."""
+        return self._thumbnails.get(img_name, self._placeholder)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item[2] is None:  # sentinel sent by `stop`
+                break
+            _, _, img_name, img_path, regenerate = item
+            with self._lock:
+                if img_name in self._done:
+                    continue
+                self._done.add(img_name)
+            try:
+                thumb_path = self._location / img_name
+                if regenerate or not thumb_path.exists():
+                    thumbnail = self._generate_thumbnail_file(img_path, thumb_path)
+                else:
+                    with Image.open(thumb_path) as im:
+                        thumbnail = im.toqimage()
+            except Exception as e:
+                logger.error(f'could not create the thumbnail for {img_name}: {e}')
+                with self._lock:  # a later request for the thumbnail tries again
+                    self._done.discard(img_name)
+                continue
+            self._thumbnail_ready.emit(img_name, thumbnail)
+
+    def _generate_thumbnail_file(self, img_path: Path, thumb_path: Path) -> QImage:
+        with Image.open(img_path) as im:
             im.thumbnail(self.thumbnail_size, resample=1)
             im = im.convert('RGB')
-            im.save(self._location / photo.image_path.name, 'JPEG')
-            photo.thumbnail = im.toqimage()
+            im.save(thumb_path, 'JPEG')
+            return im.toqimage()
+
+    def _generate_thumbnail(self, photo: Photo):
+        self._request(photo.image_name, photo.image_path, PRIORITY_VISIBLE, regenerate=True)
+
+    def _handle_thumbnail_ready(self, img_name: str, thumbnail: QImage):
+        self._thumbnails[img_name] = thumbnail
+        self.update_photo.emit(img_name, UpdateContext.Photo, {'thumbnail': True})
+
+    def stop(self):
+        """Stops the worker threads, the thumbnails that are not loaded yet stay as placeholders."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        for _ in self._workers:
+            self._queue.put((-1, next(self._sequence), None, None, False))
 
     def _handle_storage_update(self, data: typing.Dict[str, typing.Any]):
         if 'photos' not in data:
@@ -52,6 +144,7 @@ class ThumbnailStorage_(Storage):
             photo = self._main_storage.get_photo_by_name(new_photo_name, load_image=False)
             self._generate_thumbnail(photo)
         for deleted_photo_name in data['photos'].setdefault('deleted', []):
+            self._thumbnails.pop(deleted_photo_name, None)
             if (thumb_path := self._location / deleted_photo_name).exists():
                 os.remove(thumb_path)
 
@@ -59,12 +152,12 @@ class ThumbnailStorage_(Storage):
         if 'operation' not in data or not data['operation'].startswith('rot'):
             return
         photo = self._main_storage.get_photo_by_name(photo_name, load_image=False)
+        # `update_photo` is emitted once the new thumbnail is ready
         self._generate_thumbnail(photo)
         # with Image.open(self._location / photo.image_name) as im:
         #     im = im.rotate(90 if ccw else -90, 1, expand=True)
         #     im.save(self._location / photo.image_name)
         #     photo.thumbnail = im.toqimage()
-        self.update_photo.emit(photo_name, ctx, {})
 
     @property
     def location(self) -> Path:
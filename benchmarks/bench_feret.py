@@ -0,0 +1,46 @@
+"""Compares `feret_diameters` (convex hull by the monotone chain and rotating calipers, in numba) to
+`regionprops_table(..., properties=['feret_diameter_max'])` per region, as MaxFeret formerly computed it. Checks that
+the maximum Feret diameters agree and reports the time per region.
+
+Run from the repository root:
+    python -m benchmarks.bench_feret --regions 500 --size 200
+"""
+import argparse
+import time
+
+import numpy as np
+from skimage.measure import regionprops_table
+
+from arthropod_describer.common.feret import batch_feret_diameters, feret_diameters
+from benchmarks.bench_glcm import make_region
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feret diameters: rotating calipers vs. regionprops')
+    parser.add_argument('--regions', type=int, default=500)
+    parser.add_argument('--size', type=int, default=200, help='size of the bounding boxes of the regions')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    masks = [make_region(rng, args.size) for _ in range(args.regions)]
+    feret_diameters(masks[0])  # compiles the kernels
+
+    start = time.perf_counter()
+    expected = [float(regionprops_table(mask.astype(np.uint8), properties=['feret_diameter_max'])
+                      ['feret_diameter_max'][0]) for mask in masks]
+    former = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = batch_feret_diameters(enumerate(masks))
+    calipers = time.perf_counter() - start
+
+    max_diff = max(abs(actual[i].max - diameter) for i, diameter in enumerate(expected))
+    print(f'{args.regions} regions of {args.size}x{args.size} px')
+    print(f'{"regionprops":>16} {1000 * former / args.regions:>8.3f} ms per region')
+    print(f'{"calipers":>16} {1000 * calipers / args.regions:>8.3f} ms per region  ({former / calipers:.1f}x)')
+    print(f'max difference of the maximum Feret diameters: {max_diff:.2e}')
+    print(f'mean min/max Feret ratio: {np.mean([f.min / f.max for f in actual.values()]):.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Compares the longest geodesic of leg-like masks computed by `GeodesicGraph` (CSR adjacency and
+`scipy.sparse.csgraph.dijkstra`) to the implementations it replaced: the pure-Python Dijkstra with
+`queue.PriorityQueue` formerly used by `geodesic_distance_for_skeleton` and `compute_longest_geodesic`, the networkx
+graph built pixel by pixel by `compute_longest_geodesic_perf` and the networkx graph of `mask_graph`, formerly used by
+the 'longest_geodesic' intermediate. All of them run three Dijkstra sweeps per mask.
+
+Run from the repository root:
+    python -m benchmarks.bench_geodesic --masks 10 --length 400 --width 12
+"""
+import argparse
+import contextlib
+import io
+import math
+import queue
+import time
+import typing
+
+import cv2
+import networkx
+import numpy as np
+
+from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import GeodesicGraph, \
+    compute_longest_geodesic_perf, get_node_with_longest_shortest_path, neighbors
+
+
+def make_leg_mask(rng: np.random.Generator, length: int, width: int) -> np.ndarray:
+    """A leg-like mask: a thick polyline of three segments of random directions, cropped to its bounding box."""
+    size = 2 * length + 4 * width
+    points = [np.array([size / 2, size / 2])]
+    angle = rng.uniform(0, 2 * math.pi)
+    for segment_length in rng.dirichlet([4, 4, 3]) * length:
+        angle += rng.uniform(-math.pi / 3, math.pi / 3)
+        points.append(points[-1] + segment_length * np.array([math.cos(angle), math.sin(angle)]))
+    mask = np.zeros((size, size), np.uint8)
+    cv2.polylines(mask, [np.round(np.array(points)).astype(np.int32)], False, 1, thickness=width)
+    rr, cc = np.nonzero(mask)
+    return mask[rr.min():rr.max() + 1, cc.min():cc.max() + 1] > 0
+
+
+def priority_queue_distance_map(sk: np.ndarray, src: typing.Tuple[int, int]) -> np.ndarray:
+    """The former `geodesic_distance_for_skeleton`."""
+    pixels = np.argwhere(sk > 0)[:, ::-1]
+    q = queue.PriorityQueue()
+    unvisited: typing.Set[typing.Tuple[int, int]] = set()
+
+    dst_f = 99999999 * np.ones_like(sk, dtype=np.float32)
+
+    for pixel in pixels:
+        priority = 99999999
+        if pixel[0] == src[0] and pixel[1] == src[1]:
+            priority = 0
+            dst_f[pixel[1], pixel[0]] = 0
+        node = (int(pixel[0]), int(pixel[1]))
+        q.put((priority, node))
+        unvisited.add(node)
+
+    while not q.empty():
+        node_dst, node = q.get()
+        if node not in unvisited:
+            continue
+        dst_f[node[1], node[0]] = node_dst
+        unvisited.remove(node)
+        for neigh in neighbors(node):
+            if neigh not in unvisited:
+                continue
+            dst = math.sqrt((neigh[0] - node[0]) * (neigh[0] - node[0]) +
+                            (neigh[1] - node[1]) * (neigh[1] - node[1]))
+            if (upd_dst := dst_f[node[1], node[0]] + dst) < dst_f[neigh[1], neigh[0]]:
+                dst_f[neigh[1], neigh[0]] = upd_dst
+                q.put((upd_dst, neigh))
+
+    return np.where(dst_f >= 99999, -1, dst_f)
+
+
+def priority_queue_longest_geodesic(region: np.ndarray) -> float:
+    """The former `compute_longest_geodesic`."""
+    yy, xx = np.nonzero(region)
+    min_idx = np.argmin(xx)
+    src = (int(xx[min_idx]), int(yy[min_idx]))
+    for _ in range(2):
+        gdist = priority_queue_distance_map(region, src)
+        src = np.unravel_index(np.argmax(gdist), gdist.shape)[::-1]
+    return float(np.max(priority_queue_distance_map(region, src)))
+
+
+def networkx_perf_longest_geodesic(region: np.ndarray) -> float:
+    with contextlib.redirect_stdout(io.StringIO()):  # `get_graph` prints its timings
+        return float(compute_longest_geodesic_perf(region))
+
+
+def mask_graph(bin_region: np.ndarray) -> networkx.Graph:
+    """The former `geodesic_utils.mask_graph`: the 8-connected graph of the pixels (x, y) of `bin_region`, weighted
+    by the distances of the pixels."""
+    yy, xx = np.nonzero(bin_region)
+    G = networkx.Graph()
+    G.add_nodes_from(zip(xx.tolist(), yy.tolist()))
+    for px, py in zip(xx.tolist(), yy.tolist()):
+        # every edge is added once, from its left or upper pixel
+        for j, i, weight in [(1, 0, 1.0), (-1, 1, math.sqrt(2)), (0, 1, 1.0), (1, 1, math.sqrt(2))]:
+            if (px + j, py + i) in G:
+                G.add_edge((px, py), (px + j, py + i), weight=weight)
+    return G
+
+
+def networkx_mask_graph_longest_geodesic(region: np.ndarray) -> float:
+    """The former 'longest_geodesic' intermediate."""
+    G = mask_graph(region)
+    src = min(G.nodes, key=lambda node: (node[0], node[1]))
+    for _ in range(2):
+        src = get_node_with_longest_shortest_path(networkx.shortest_path_length(G, source=src, weight='weight'))
+    lengths = networkx.shortest_path_length(G, source=src, weight='weight')
+    return float(lengths[get_node_with_longest_shortest_path(lengths)])
+
+
+def csgraph_longest_geodesic(region: np.ndarray) -> float:
+    return GeodesicGraph(region).longest_geodesic()[0]
+
+
+IMPLEMENTATIONS: typing.Dict[str, typing.Callable[[np.ndarray], float]] = {
+    'csgraph (GeodesicGraph)': csgraph_longest_geodesic,
+    'PriorityQueue': priority_queue_longest_geodesic,
+    'networkx get_graph': networkx_perf_longest_geodesic,
+    'networkx mask_graph': networkx_mask_graph_longest_geodesic,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Longest geodesic of leg-like masks')
+    parser.add_argument('--masks', type=int, default=10)
+    parser.add_argument('--length', type=int, default=400, help='length of the legs in pixels')
+    parser.add_argument('--width', type=int, default=12, help='width of the legs in pixels')
+    parser.add_argument('--skip', nargs='*', default=[], choices=list(IMPLEMENTATIONS.keys()),
+                        help='implementations not to run, e.g. the slow ones on large masks')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    masks = [make_leg_mask(rng, args.length, args.width) for _ in range(args.masks)]
+    print(f'{args.masks} masks, {np.mean([np.count_nonzero(mask) for mask in masks]):.0f} pixels on average')
+
+    lengths: typing.Dict[str, typing.List[float]] = {}
+    seconds: typing.Dict[str, float] = {}
+    for name, implementation in IMPLEMENTATIONS.items():
+        if name in args.skip:
+            continue
+        start = time.perf_counter()
+        lengths[name] = [implementation(mask) for mask in masks]
+        seconds[name] = time.perf_counter() - start
+
+    reference = 'csgraph (GeodesicGraph)'
+    print(f'{"implementation":>24} {"ms per mask":>12} {"vs csgraph":>11} {"max length diff":>16}')
+    for name, secs in seconds.items():
+        relative = secs / seconds[reference] if reference in seconds else float('nan')
+        diff = (max(abs(a - b) for a, b in zip(lengths[name], lengths[reference]))
+                if reference in lengths else float('nan'))
+        print(f'{name:>24} {1000 * secs / len(masks):>12.2f} {relative:>10.1f}x {diff:>16.4f}')
+    print('get_graph weighs the diagonal edges by 1.41, the others by sqrt(2)')
+
+
+if __name__ == '__main__':
+    main()
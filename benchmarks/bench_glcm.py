@@ -0,0 +1,102 @@
+"""Compares the GLCM properties of a region computed by `masked_cooccurrence` and `glcm_properties`, which handle
+only the grey levels present in the region, to the former computation: `graycomatrix` of the region's bounding box
+with the background set to an extra grey level that is stripped afterwards, and `graycoprops` of the dense
+255x255 matrix for each of the six properties. Checks that the matrices and the properties agree and reports the
+time per channel.
+
+The channels are smooth noise spanning `--spread` grey levels, as the H, S and V channels of a region of a photo
+usually span a part of the range only; `--spread 256` is the worst case, where all the levels are present.
+
+Run from the repository root:
+    python -m benchmarks.bench_glcm --regions 20 --size 300 --spread 64
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import ndimage
+from skimage.feature import graycomatrix, graycoprops
+from skimage.morphology import disk
+
+from arthropod_describer.plugins.test_plugin.properties.glcm_utils import ANGLES, GLCM_PROPS, glcm_properties, \
+    masked_cooccurrence, quantise
+
+
+def graycomatrix_glcm(channel: np.ndarray, mask: np.ndarray, distances) -> np.ndarray:
+    """The former computation, see `glcm_utils._glcm` before the kernel was introduced."""
+    values = channel.copy()
+    values[values == 255] = 254
+    values_masked = values + 1
+    values_masked[mask == 0] = 0
+    return graycomatrix(values_masked, list(distances), ANGLES)[1:, 1:, :, :]
+
+
+def make_region(rng: np.random.Generator, size: int) -> np.ndarray:
+    """A blob made of a few overlapping disks, about half of its bounding box."""
+    mask = np.zeros((size, size), bool)
+    for _ in range(5):
+        radius = int(rng.integers(size // 8, size // 4))
+        r, c = rng.integers(radius, size - radius, 2)
+        mask[r - radius:r + radius + 1, c - radius:c + radius + 1] |= disk(radius).astype(bool)
+    return mask
+
+
+def make_channel(rng: np.random.Generator, size: int, spread: int) -> np.ndarray:
+    """Smooth noise spanning `spread` grey levels at a random offset."""
+    noise = ndimage.gaussian_filter(rng.random((size, size)), 2)
+    noise = (noise - noise.min()) / (noise.max() - noise.min() + 1e-12)
+    offset = int(rng.integers(0, 256 - spread + 1))
+    return (offset + noise * (spread - 1)).round().astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Masked co-occurrence kernel vs. graycomatrix')
+    parser.add_argument('--regions', type=int, default=20)
+    parser.add_argument('--size', type=int, default=300, help='size of the bounding boxes of the regions')
+    parser.add_argument('--distances', type=int, nargs='+', default=[3, 6, 9])
+    parser.add_argument('--spread', type=int, default=64, help='number of grey levels the channels span')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    channels = [make_channel(rng, args.size, args.spread) for _ in range(args.regions)]
+    masks = [make_region(rng, args.size) for _ in range(args.regions)]
+    masked_cooccurrence(quantise(channels[0])[0], masks[0], args.distances, ANGLES, 255)  # compiles the kernel
+
+    start = time.perf_counter()
+    expected = []
+    for channel, mask in zip(channels, masks):
+        glcm = graycomatrix_glcm(channel, mask, args.distances)
+        expected.append((glcm, {prop: graycoprops(glcm, prop=prop) for prop in GLCM_PROPS}))
+    former = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = []
+    for channel, mask in zip(channels, masks):
+        values, levels = quantise(channel)
+        level_values, glcm = masked_cooccurrence(values, mask, args.distances, ANGLES, levels)
+        actual.append((level_values, glcm, glcm_properties(level_values, glcm)))
+    kernel = time.perf_counter() - start
+
+    identical = True
+    max_diff = 0.0
+    for (level_values, glcm, props), (expected_glcm, expected_props) in zip(actual, expected):
+        dense = np.zeros_like(expected_glcm)
+        dense[np.ix_(level_values, level_values)] = glcm
+        identical &= np.array_equal(dense, expected_glcm)
+        max_diff = max(max_diff, max(np.max(np.abs(props[prop] - expected_props[prop])) for prop in GLCM_PROPS))
+
+    mean_levels = np.mean([len(level_values) for level_values, _, _ in actual])
+    print(f'{args.regions} regions of {args.size}x{args.size} px, distances {args.distances}, {len(ANGLES)} angles, '
+          f'{mean_levels:.0f} grey levels present on average')
+    print(f'{"graycomatrix":>14} {1000 * former / args.regions:>8.2f} ms per channel (matrix and 6 properties)')
+    print(f'{"kernel":>14} {1000 * kernel / args.regions:>8.2f} ms per channel  ({former / kernel:.1f}x)')
+    print(f'identical matrices: {identical}, max property difference: {max_diff:.2e}')
+    for levels in [64, 32, 16]:
+        start = time.perf_counter()
+        for channel, mask in zip(channels, masks):
+            glcm_properties(*masked_cooccurrence(quantise(channel, levels)[0], mask, args.distances, ANGLES, levels))
+        print(f'{f"{levels} levels":>14} {1000 * (time.perf_counter() - start) / args.regions:>8.2f} ms per channel')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compares computing all the property computations of test_plugin with a fresh `RegionsCache` per computation, i.e.
+every computation computing the intermediates it requires on its own, to computing them with one `RegionsCache` per
+photo, where every intermediate is computed once, as `ComputationsScheduler` does.
+
+Run from the repository root:
+    python -m benchmarks.bench_intermediates --photos 4 --size 1024
+    python -m benchmarks.bench_intermediates --only glcm_  # the six GLCM properties share one set of GLCMs
+"""
+import argparse
+import tempfile
+import time
+import typing
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from arthropod_describer.common.computations_scheduler import instantiate_computation
+from arthropod_describer.common.intermediates import make_plan
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.local_storage import LocalStorage
+from arthropod_describer.common.plugin import PropertyComputation
+from arthropod_describer.common.regions_cache import RegionsCache
+from benchmarks.synthetic_project import PACKAGE_FOLDER, make_hierarchical_label_image, make_project
+
+PROPERTIES_PACKAGE = 'arthropod_describer.plugins.test_plugin.properties'
+
+
+def load_computations() -> typing.Dict[str, PropertyComputation]:
+    """All the property computations of test_plugin, skipping the modules that do not define one or whose
+    dependencies are missing."""
+    computations: typing.Dict[str, PropertyComputation] = {}
+    for path in sorted((PACKAGE_FOLDER / 'plugins' / 'test_plugin' / 'properties').glob('*.py')):
+        if path.stem.startswith('_'):
+            continue
+        try:
+            computations[path.stem] = instantiate_computation(f'{PROPERTIES_PACKAGE}.{path.stem}', {})
+        except Exception as e:
+            print(f'skipping {path.stem}: {type(e).__name__}: {e}')
+    return computations
+
+
+def add_counts(total: typing.Dict[str, int], counts: typing.Dict[str, int]):
+    for name, count in counts.items():
+        total[name] = total.get(name, 0) + count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Intermediates computed per computation vs. once per photo')
+    parser.add_argument('--photos', type=int, default=4)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--only', nargs='+', default=None, metavar='PREFIX',
+                        help='benchmark only the computations whose module names start with one of the prefixes')
+    args = parser.parse_args()
+
+    label_hierarchy = LabelHierarchy.load(PACKAGE_FOLDER / 'regions_label_hierarchy.json')
+    region_labels = {label for label in label_hierarchy.labels if label > 0 and label_hierarchy.get_level(label) <= 1}
+    computations = load_computations()
+    if args.only is not None:
+        computations = {name: computation for name, computation in computations.items()
+                        if any(name.startswith(prefix) for prefix in args.only)}
+    print(f'computations: {", ".join(computations.keys())}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = make_project(Path(tmp), args.photos, (args.size, args.size))
+        rng = np.random.default_rng(0)
+        for i in range(args.photos):
+            lab = make_hierarchical_label_image(args.size, rng, label_hierarchy)
+            Image.fromarray(lab).save(folder / 'Labels' / f'photo_{i:05d}.png.tif')
+        storage = LocalStorage.load_from(folder)
+        photos = [storage.get_photo_by_idx(i) for i in range(args.photos)]
+
+        failed: typing.Set[str] = set()
+        separate_counts: typing.Dict[str, int] = {}
+        start = time.perf_counter()
+        for photo in photos:
+            for name, computation in computations.items():
+                regions_cache = RegionsCache(region_labels, photo, 'Labels')
+                try:
+                    computation(photo, list(region_labels), regions_cache)
+                except Exception as e:
+                    print(f'{name} failed on {photo.image_name}: {type(e).__name__}: {e}')
+                    failed.add(name)
+                add_counts(separate_counts, regions_cache.intermediates.counts)
+        separate = time.perf_counter() - start
+
+        shared_counts: typing.Dict[str, int] = {}
+        start = time.perf_counter()
+        for photo in photos:
+            regions_cache = RegionsCache(region_labels, photo, 'Labels')
+            to_compute = {name: computation for name, computation in computations.items() if name not in failed}
+            regions_cache.intermediates.execute(make_plan((computation.requires, region_labels)
+                                                          for computation in to_compute.values()))
+            for computation in to_compute.values():
+                computation(photo, list(region_labels), regions_cache)
+            add_counts(shared_counts, regions_cache.intermediates.counts)
+        shared = time.perf_counter() - start
+
+    print(f'{len(photos)} photos, {len(region_labels)} regions per photo')
+    print(f'{"intermediate":>24} {"separate":>10} {"shared":>10}')
+    for name in sorted(set(separate_counts.keys()) | set(shared_counts.keys())):
+        print(f'{name:>24} {separate_counts.get(name, 0):>10} {shared_counts.get(name, 0):>10}')
+    print(f'{"time [s]":>24} {separate:>10.2f} {shared:>10.2f}')
+    print(f'{"speedup":>24} {"":>10} {separate / shared:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
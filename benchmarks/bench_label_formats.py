@@ -0,0 +1,72 @@
+"""Compares the latency of opening a label image, applying a brush edit and saving it, as well as the disk usage, for
+the on-disk label formats.
+
+Run from the repository root:
+    python -m benchmarks.bench_label_formats --sizes 1024 4096
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from arthropod_describer.common.label_change import LabelChange
+from arthropod_describer.common.label_image import LabelImg, LabelImgInfo
+from arthropod_describer.common.label_storage import BACKENDS
+from benchmarks.synthetic_project import make_label_image
+
+
+def brush_change(size: int, rng: np.random.Generator, radius: int = 5) -> LabelChange:
+    """A circular brush stroke of `radius` at a random position, similar to what the brush tool produces."""
+    r, c = rng.integers(radius, size - radius, 2)
+    yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = yy ** 2 + xx ** 2 <= radius ** 2
+    coords = (yy[inside] + r, xx[inside] + c)
+    return LabelChange(coords, 1 << 24, 0, 'Labels')
+
+
+def measure(folder: Path, size: int, storage_format: str, repeats: int) -> tuple:
+    rng = np.random.default_rng(0)
+    path = folder / f'label_{size}.tif'
+    BACKENDS['tif'](path).save(make_label_image((size, size), rng))
+    info = LabelImgInfo('Labels', True, storage_format=storage_format)
+    LabelImg.create2(path, (size, size), info, 'Labels').label_image  # migrates the label image if needed
+
+    opens, edits, saves = [], [], []
+    for _ in range(repeats):
+        lbl = LabelImg.create2(path, (size, size), info, 'Labels')
+        start = time.perf_counter()
+        label_nd = lbl.label_image
+        opens.append(time.perf_counter() - start)
+
+        change = brush_change(size, rng)
+        start = time.perf_counter()
+        label_nd[change.coords[0], change.coords[1]] = change.new_label  # what `EditCommandExecutor.change_labels` does
+        lbl.set_dirty(change.coords)
+        edits.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        lbl.backend.save(lbl.label_image)  # only the pixel data, measurements are the same for all formats
+        saves.append(time.perf_counter() - start)
+    return statistics.median(opens), statistics.median(edits), statistics.median(saves), lbl.backend.disk_usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Label image open/edit/save latency per storage format')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048, 4096])
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"size":>6} {"format":>7} {"open [ms]":>10} {"edit [ms]":>10} {"save [ms]":>10} {"disk [kB]":>10}')
+    for size in args.sizes:
+        for storage_format in BACKENDS.keys():
+            with tempfile.TemporaryDirectory() as tmp:
+                t_open, t_edit, t_save, disk = measure(Path(tmp), size, storage_format, args.repeats)
+            print(f'{size:>6} {storage_format:>7} {1000 * t_open:>10.2f} {1000 * t_edit:>10.2f} '
+                  f'{1000 * t_save:>10.2f} {disk / 1024:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Compares the mean width of leg-like regions computed by `region_mean_width`, in the bounding boxes of the regions,
+to the former computation of MeanWidth over the whole photo: the full-size mask of the region, its erosion and its
+distance transform. Both use the same longest geodesic, computed once per region. Checks that the widths are equal
+and reports the time per region.
+
+Run from the repository root:
+    python -m benchmarks.bench_mean_width --legs 6 --width 5472 --height 3648
+"""
+import argparse
+import time
+import typing
+
+import numpy as np
+import scipy.ndimage
+from skimage.morphology import binary_erosion
+
+from arthropod_describer.plugins.test_plugin.properties.geodesic_utils import GeodesicGraph
+from arthropod_describer.plugins.test_plugin.properties.mean_width import region_mean_width
+from benchmarks.bench_geodesic import make_leg_mask
+
+
+def full_image_mean_width(lab: np.ndarray, label: int, bbox: typing.Tuple[int, int, int, int],
+                          path: typing.List[typing.Tuple[int, int]]) -> float:
+    """The former `MeanWidth.__call__` for one region."""
+    top, left, _, _ = bbox
+    bin_img = lab == label
+    geodesic = ([top + px[1] for px in path], [left + px[0] for px in path])
+    outline = np.logical_and(bin_img, binary_erosion(bin_img, footprint=np.ones((3, 3), dtype=np.uint8)))
+    dst = scipy.ndimage.distance_transform_edt(outline)
+    return float(np.mean(2.0 * dst[geodesic[0], geodesic[1]]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mean width in bounding boxes vs. over the whole photo')
+    parser.add_argument('--legs', type=int, default=6)
+    parser.add_argument('--width', type=int, default=5472, help='width of the photo in pixels')
+    parser.add_argument('--height', type=int, default=3648, help='height of the photo in pixels')
+    parser.add_argument('--leg-length', type=int, default=900)
+    parser.add_argument('--leg-width', type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lab = np.zeros((args.height, args.width), np.uint32)
+    regions: typing.Dict[int, typing.Tuple[np.ndarray, typing.Tuple[int, int, int, int]]] = {}
+    for label in range(1, args.legs + 1):
+        mask = make_leg_mask(rng, args.leg_length, args.leg_width)
+        height, width = mask.shape
+        top, left = int(rng.integers(0, args.height - height)), int(rng.integers(0, args.width - width))
+        lab[top:top + height, left:left + width][mask] = label
+    for label, slc in enumerate(scipy.ndimage.find_objects(lab), start=1):
+        if slc is not None:
+            bbox = (slc[0].start, slc[1].start, slc[0].stop - slc[0].start, slc[1].stop - slc[1].start)
+            regions[label] = (lab[slc] == label, bbox)
+
+    start = time.perf_counter()
+    paths = {}
+    for label, (mask, _) in regions.items():
+        graph = GeodesicGraph(mask)
+        _, src, dst = graph.longest_geodesic()
+        paths[label] = graph.shortest_path(src, dst)
+    geodesic = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = {label: full_image_mean_width(lab, label, bbox, paths[label]) for label, (_, bbox) in regions.items()}
+    former = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = {label: region_mean_width(mask, bbox, lab.shape, paths[label]) for label, (mask, bbox) in regions.items()}
+    cropped = time.perf_counter() - start
+
+    count = len(regions)
+    print(f'{count} legs in a {args.width}x{args.height} px photo')
+    print(f'{"geodesics":>12} {1000 * geodesic / count:>9.2f} ms per region, shared by both')
+    print(f'{"whole photo":>12} {1000 * former / count:>9.2f} ms per region')
+    print(f'{"bbox":>12} {1000 * cropped / count:>9.2f} ms per region  ({former / cropped:.1f}x)')
+    print(f'max width difference: {max(abs(actual[label] - expected[label]) for label in regions):.2e}')
+
+
+if __name__ == '__main__':
+    main()
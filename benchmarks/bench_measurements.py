@@ -0,0 +1,66 @@
+"""Measures the throughput of `ComputationsScheduler` on a synthetic project as a function of the number of worker
+processes.
+
+Run from the repository root:
+    python -m benchmarks.bench_measurements --photos 32 --workers 1 2 4 8
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from PySide2.QtCore import QCoreApplication
+
+from arthropod_describer.common.computations_scheduler import ComputationsScheduler, instantiate_computation
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.local_storage import LocalStorage
+from benchmarks.synthetic_project import PACKAGE_FOLDER, make_hierarchical_label_image, make_project
+
+PROPERTIES_PACKAGE = 'arthropod_describer.plugins.test_plugin.properties'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measurement throughput vs. the number of worker processes')
+    parser.add_argument('--photos', type=int, default=16)
+    parser.add_argument('--size', type=int, default=2048)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--computations', nargs='+', default=['area', 'mean_intensity', 'mean_hsv', 'glcm_contrast'],
+                        help=f'modules from {PROPERTIES_PACKAGE}')
+    args = parser.parse_args()
+
+    _ = QCoreApplication.instance() or QCoreApplication([])
+    label_hierarchy = LabelHierarchy.load(PACKAGE_FOLDER / 'regions_label_hierarchy.json')
+    region_labels = {label for label in label_hierarchy.labels if label > 0 and label_hierarchy.get_level(label) <= 1}
+    computations = {name: instantiate_computation(f'{PROPERTIES_PACKAGE}.{name}', {}) for name in args.computations}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = make_project(Path(tmp), args.photos, (args.size, args.size))
+        rng = np.random.default_rng(0)
+        for i in range(args.photos):
+            lab = make_hierarchical_label_image(args.size, rng, label_hierarchy)
+            Image.fromarray(lab).save(folder / 'Labels' / f'photo_{i:05d}.png.tif')
+        storage = LocalStorage.load_from(folder)
+        assignments = [(i, {name: region_labels for name in computations.keys()}) for i in range(args.photos)]
+        task_count = args.photos * len(computations)
+
+        print(f'{task_count} tasks, {len(region_labels)} regions per photo')
+        print(f'{"workers":>8} {"time [s]":>10} {"tasks/s":>10} {"speedup":>8}')
+        baseline = None
+        for workers in args.workers:
+            scheduler = ComputationsScheduler(max_workers=workers)
+            # starts the worker processes and imports the plugins in them
+            scheduler.start(storage, 'Labels', assignments[:workers], computations)
+            scheduler.wait()
+            start = time.perf_counter()
+            scheduler.start(storage, 'Labels', assignments, computations)
+            scheduler.wait()
+            elapsed = time.perf_counter() - start
+            scheduler.shutdown()
+            baseline = elapsed if baseline is None else baseline
+            print(f'{workers:>8} {elapsed:>10.2f} {task_count / elapsed:>10.1f} {baseline / elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Compares `compute_region_stats`, which computes the basic statistics of all the regions of a label image at once,
+to computing them region by region as Area, Circularity, MeanIntensity and MeanHSV formerly did: a mask per region,
+`regionprops_table` over the whole label image for the perimeters and `rgb2hsv` of the whole photo. Checks that the
+values agree and reports the times.
+
+Run from the repository root:
+    python -m benchmarks.bench_region_stats --regions 30 --size 4000
+"""
+import argparse
+import time
+import typing
+
+import numpy as np
+from skimage.color import rgb2hsv
+from skimage.draw import disk
+from skimage.measure import regionprops_table
+
+from arthropod_describer.common.region_stats import compute_region_stats
+
+
+def make_label_image(rng: np.random.Generator, size: int, region_count: int) -> np.ndarray:
+    """Blobs of a few overlapping disks each, later regions paint over the earlier ones."""
+    lab = np.zeros((size, size), np.uint32)
+    for label in range(1, region_count + 1):
+        center = rng.integers(size // 10, size - size // 10, 2)
+        for _ in range(4):
+            radius = int(rng.integers(size // 60, size // 25))
+            rr, cc = disk(tuple(center + rng.integers(-radius, radius + 1, 2)), radius, shape=lab.shape)
+            lab[rr, cc] = label
+    return lab
+
+
+def per_region_stats(lab: np.ndarray, image: np.ndarray, reflections: np.ndarray) \
+        -> typing.Dict[int, typing.Tuple[int, float, typing.List[float], typing.List[float]]]:
+    """The former computations: area, perimeter, mean RGB and mean HSV of every region."""
+    hsv = rgb2hsv(image)
+    reg_props = regionprops_table(lab, properties=['label', 'perimeter', 'bbox'])
+    stats = {}
+    for label, perimeter, top, left, bottom, right in zip(reg_props['label'], reg_props['perimeter'],
+                                                          reg_props['bbox-0'], reg_props['bbox-1'],
+                                                          reg_props['bbox-2'], reg_props['bbox-3']):
+        mask = lab[top:bottom, left:right] == label
+        area = int(np.count_nonzero(lab == label))
+        ys, xs = np.nonzero(np.logical_and(mask, reflections[top:bottom, left:right] == 0))
+        mean_rgb = np.mean(image[top:bottom, left:right][ys, xs], axis=0)
+        hsv_roi = hsv[top:bottom, left:right]
+        hue_radians = 2 * np.pi * hsv_roi[ys, xs, 0]
+        avg_sin, avg_cos = np.mean(np.sin(hue_radians)), np.mean(np.cos(hue_radians))
+        length = np.sqrt(avg_sin * avg_sin + avg_cos * avg_cos)
+        mean_hsv = [np.mod(np.degrees(np.arctan2(avg_sin, avg_cos)), 360),
+                    100 * np.mean(hsv_roi[ys, xs, 1]) * length, 100 * np.mean(hsv_roi[ys, xs, 2])]
+        stats[int(label)] = (area, float(perimeter), mean_rgb.tolist(), [float(v) for v in mean_hsv])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Region statistics at once vs. region by region')
+    parser.add_argument('--regions', type=int, default=30)
+    parser.add_argument('--size', type=int, default=4000, help='size of the square photo in pixels')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lab = make_label_image(rng, args.size, args.regions)
+    image = rng.integers(0, 256, (args.size, args.size, 3), dtype=np.uint8)
+    reflections = (rng.random((args.size, args.size)) < 0.02).astype(np.uint32)
+
+    start = time.perf_counter()
+    expected = per_region_stats(lab, image, reflections)
+    former = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = compute_region_stats(lab, range(1, args.regions + 1), image, reflections)
+    engine = time.perf_counter() - start
+
+    diffs = {
+        'area': max(abs(actual[label].area - stats[0]) for label, stats in expected.items()),
+        'perimeter': max(abs(actual[label].perimeter - stats[1]) for label, stats in expected.items()),
+        'mean RGB': max(np.max(np.abs(np.subtract(actual[label].mean_rgb, stats[2])))
+                        for label, stats in expected.items()),
+        'mean HSV': max(np.max(np.abs(np.subtract(actual[label].mean_hsv, stats[3])))
+                        for label, stats in expected.items()),
+    }
+    print(f'{len(expected)} regions in a {args.size}x{args.size} px photo')
+    print(f'{"region by region":>17} {1000 * former:>9.1f} ms')
+    print(f'{"all at once":>17} {1000 * engine:>9.1f} ms  ({former / engine:.1f}x)')
+    for name, diff in diffs.items():
+        print(f'max {name} difference: {diff:.2e}')
+
+
+if __name__ == '__main__':
+    main()
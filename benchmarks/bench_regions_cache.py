@@ -0,0 +1,75 @@
+"""Compares the `RegionsCache` builders on photos with a label image using the whole arthropod label hierarchy and
+checks that all of them produce identical regions. The last column is the time a lazy `RegionsCache` takes to
+provide only the region of the whole specimen.
+
+Run from the repository root:
+    python -m benchmarks.bench_regions_cache --sizes 1024 4096
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.local_storage import LocalStorage
+from arthropod_describer.common.regions_cache import BUILDERS, RegionsCache
+from benchmarks.synthetic_project import PACKAGE_FOLDER, make_hierarchical_label_image, make_project
+
+
+def regions_equal(regions1: RegionsCache, regions2: RegionsCache) -> bool:
+    if set(regions1.regions.keys()) != set(regions2.regions.keys()):
+        return False
+    for label, reg1 in regions1.regions.items():
+        reg2 = regions2.regions[label]
+        if reg1.label != reg2.label or tuple(reg1.bbox) != tuple(reg2.bbox) or \
+                not np.array_equal(reg1.mask, reg2.mask) or not np.array_equal(reg1.image, reg2.image):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RegionsCache construction time per builder')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1024, 2048, 4096])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    label_hierarchy = LabelHierarchy.load(PACKAGE_FOLDER / 'regions_label_hierarchy.json')
+    region_labels = {label for label in label_hierarchy.labels if label > 0}
+    print(f'{len(region_labels)} regions on {len(label_hierarchy.group_by_level(region_labels))} levels')
+    specimen = min(region_labels)
+    print(f'{"size":>6} ' + ' '.join(f'{builder + " [ms]":>16}' for builder in BUILDERS.keys()) +
+          f' {"lazy, 1 [ms]":>16} {"identical":>10}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = make_project(Path(tmp), 1, (size, size))
+            lab = make_hierarchical_label_image(size, np.random.default_rng(0), label_hierarchy)
+            Image.fromarray(lab).save(folder / 'Labels' / 'photo_00000.png.tif')
+            photo = LocalStorage.load_from(folder).get_photo_by_idx(0)
+            _ = photo['Labels'].label_index  # decodes the photo and the label image and builds the index
+
+            times, caches = [], []
+            for builder in BUILDERS.keys():
+                runs = []
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    cache = RegionsCache(region_labels, photo, 'Labels', builder=builder)
+                    runs.append(time.perf_counter() - start)
+                times.append(statistics.median(runs))
+                caches.append(cache)
+            runs = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                _ = RegionsCache(region_labels, photo, 'Labels', lazy=True).regions[specimen]
+                runs.append(time.perf_counter() - start)
+            times.append(statistics.median(runs))
+            caches.append(RegionsCache(region_labels, photo, 'Labels', lazy=True))
+            identical = all(regions_equal(caches[0], cache) for cache in caches[1:])
+            print(f'{size:>6} ' + ' '.join(f'{1000 * t:>16.2f}' for t in times) + f' {str(identical):>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Measures re-measuring a synthetic project with the result cache: the first run computes everything, the second
+one takes everything from the cache and the third one follows edits of the label images of `--edited` photos.
+
+Run from the repository root:
+    python -m benchmarks.bench_result_cache --photos 32 --edited 5
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from PySide2.QtCore import QCoreApplication
+
+from arthropod_describer.common.computations_scheduler import ComputationsScheduler, instantiate_computation
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+from arthropod_describer.common.local_storage import LocalStorage
+from arthropod_describer.common.result_cache import ResultCache, RESULT_CACHE_FILENAME
+from benchmarks.synthetic_project import PACKAGE_FOLDER, make_hierarchical_label_image, make_project
+
+PROPERTIES_PACKAGE = 'arthropod_describer.plugins.test_plugin.properties'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-measuring a project with the result cache')
+    parser.add_argument('--photos', type=int, default=32)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--edited', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--computations', nargs='+', default=['area', 'mean_intensity', 'mean_hsv', 'glcm_contrast'],
+                        help=f'modules from {PROPERTIES_PACKAGE}')
+    args = parser.parse_args()
+
+    _ = QCoreApplication.instance() or QCoreApplication([])
+    label_hierarchy = LabelHierarchy.load(PACKAGE_FOLDER / 'regions_label_hierarchy.json')
+    region_labels = {label for label in label_hierarchy.labels if label > 0 and label_hierarchy.get_level(label) <= 1}
+    computations = {name: instantiate_computation(f'{PROPERTIES_PACKAGE}.{name}', {}) for name in args.computations}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = make_project(Path(tmp), args.photos, (args.size, args.size))
+        rng = np.random.default_rng(0)
+        for i in range(args.photos):
+            lab = make_hierarchical_label_image(args.size, rng, label_hierarchy)
+            Image.fromarray(lab).save(folder / 'Labels' / f'photo_{i:05d}.png.tif')
+        storage = LocalStorage.load_from(folder)
+        result_cache = ResultCache(folder / RESULT_CACHE_FILENAME)
+        assignments = [(i, {name: region_labels for name in computations.keys()}) for i in range(args.photos)]
+        scheduler = ComputationsScheduler(max_workers=args.workers)
+
+        print(f'{args.photos} photos, {len(region_labels)} regions per photo, {len(computations)} computations')
+        print(f'{"run":>16} {"time [s]":>10} {"cache hits":>11}')
+        for run in ['cold', 'warm', f'{args.edited} edited']:
+            if run.endswith('edited'):
+                for i in range(args.edited):
+                    label_img = storage.get_photo_by_idx(i)['Labels']
+                    label_img.label_image = make_hierarchical_label_image(args.size, rng, label_hierarchy)
+            start = time.perf_counter()
+            scheduler.start(storage, 'Labels', assignments, computations, result_cache)
+            scheduler.wait()
+            print(f'{run:>16} {time.perf_counter() - start:>10.2f} {scheduler.cache_hits:>11}')
+        scheduler.shutdown()
+        result_cache.close()
+
+
+if __name__ == '__main__':
+    main()
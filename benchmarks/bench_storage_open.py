@@ -0,0 +1,51 @@
+"""Measures the time it takes to open a `LocalStorage` and to save it after a single tag toggle as a function of
+the project size.
+
+Run from the repository root:
+    python -m benchmarks.bench_storage_open --sizes 100 1000 5000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from arthropod_describer.common.local_storage import LocalStorage
+from benchmarks.synthetic_project import make_project
+
+
+def time_open(folder: Path, lazy: bool, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        LocalStorage.load_from(folder, lazy=lazy)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LocalStorage open time vs. project size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"photos":>8} {"eager [s]":>10} {"lazy [s]":>10} {"first photo [ms]":>17} {"tag save [ms]":>14}')
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = make_project(Path(tmp), size)
+            LocalStorage.load_from(folder)  # creates photo_info.json
+            LocalStorage.load_from(folder, lazy=False).save()  # caches the image sizes in the manifest
+            eager = time_open(folder, False, args.repeats)
+            lazy = time_open(folder, True, args.repeats)
+            storage = LocalStorage.load_from(folder, lazy=True)
+            start = time.perf_counter()
+            storage.get_photo_by_idx(size // 2)
+            first = time.perf_counter() - start
+            storage.get_photo_by_idx(size // 2).toggle_tag('benchmark', True)
+            start = time.perf_counter()
+            storage.save()
+            tag_save = time.perf_counter() - start
+            print(f'{size:>8} {eager:>10.3f} {lazy:>10.3f} {1000 * first:>17.2f} {1000 * tag_save:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Helpers for generating synthetic projects used by the benchmarks."""
+import json
+import shutil
+import typing
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+import arthropod_describer
+from arthropod_describer.common.label_hierarchy import LabelHierarchy
+
+
+PACKAGE_FOLDER = Path(arthropod_describer.__file__).parent
+
+
+def make_project(folder: Path, photo_count: int, image_size: typing.Tuple[int, int] = (64, 48),
+                 with_labels: bool = False, label_format: str = 'tif') -> Path:
+    """Creates a project in `folder` with `photo_count` random RGB photos of `image_size` (width, height).
+
+    Label images are always written as TIFF files, with `label_format` other than 'tif' they are migrated on the
+    first access."""
+    lbls_info = {'label_images': {
+        'Labels': {'always_constrain_to': None, 'allow_constrain_to': ['Labels'], 'storage_format': label_format},
+        'Reflections': {'always_constrain_to': 'Labels', 'allow_constrain_to': None, 'storage_format': label_format}
+    }, 'default_label_image': 'Labels'}
+    for sub in ['images', 'Labels', 'Reflections']:
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+    with open(folder / 'label_images_info.json', 'w') as f:
+        json.dump(lbls_info, f, indent=2)
+    shutil.copy(PACKAGE_FOLDER / 'regions_label_hierarchy.json', folder / 'Labels_labels.json')
+    shutil.copy(PACKAGE_FOLDER / 'reflections_label_hierarchy.json', folder / 'Reflections_labels.json')
+
+    rng = np.random.default_rng(42)
+    for i in range(photo_count):
+        img = rng.integers(0, 255, (image_size[1], image_size[0], 3), dtype=np.uint8)
+        Image.fromarray(img).save(folder / 'images' / f'photo_{i:05d}.png')
+        if with_labels:
+            lab = make_label_image(image_size, rng)
+            Image.fromarray(lab).save(folder / 'Labels' / f'photo_{i:05d}.png.tif')
+    return folder
+
+
+def make_label_image(image_size: typing.Tuple[int, int], rng: np.random.Generator,
+                     region_count: int = 8) -> np.ndarray:
+    """Returns a uint32 label image (height, width) with `region_count` rectangular regions on a zero background."""
+    w, h = image_size
+    lab = np.zeros((h, w), np.uint32)
+    for i in range(region_count):
+        top, left = rng.integers(0, h // 2), rng.integers(0, w // 2)
+        bottom, right = top + rng.integers(2, h // 2), left + rng.integers(2, w // 2)
+        lab[top:bottom, left:right] = (i + 1) << 24
+    return lab
+
+
+def make_hierarchical_label_image(size: int, rng: np.random.Generator, label_hierarchy: LabelHierarchy) -> np.ndarray:
+    """Paints a rectangle for every label of `label_hierarchy`, children are painted after their parents, so most of
+    the regions on the upper levels consist of several labels."""
+    lab = np.zeros((size, size), np.uint32)
+    for label in sorted(label_hierarchy.labels, key=label_hierarchy.get_level):
+        if label <= 0:
+            continue
+        extent = size // (2 + 2 * label_hierarchy.get_level(label))
+        top, left = rng.integers(0, size - extent, 2)
+        lab[top:top + rng.integers(2, extent), left:left + rng.integers(2, extent)] = label
+    return lab